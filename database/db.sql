@@ -14,18 +14,27 @@ CREATE TABLE User(
     date_of_birth DATETIME NOT NULL,
     user_type ENUM('FREELANCER', 'EMPLOYER'),
     token VARCHAR(200),
-    balance FLOAT DEFAULT 0,
+    balance_minor BIGINT NOT NULL DEFAULT 0,
     resume_id VARCHAR(36)
 );
 
 
 CREATE TABLE Chat(
     id INT PRIMARY KEY AUTO_INCREMENT,
-    user_1 INT NOT NULL, -- chat initiator
-    user_2 INT NOT NULL,
+    user_1 INT NOT NULL, -- lower user id of the pair
+    user_2 INT NOT NULL, -- higher user id of the pair
+    last_sequence INT NOT NULL DEFAULT 0,
+    last_message_id INT,
+    last_message_preview VARCHAR(100),
+    last_message_time DATETIME,
+    unread_1 INT NOT NULL DEFAULT 0,
+    unread_2 INT NOT NULL DEFAULT 0,
 
     FOREIGN KEY (user_1) REFERENCES User(id),
-    FOREIGN KEY (user_2) REFERENCES User(id)
+    FOREIGN KEY (user_2) REFERENCES User(id),
+    INDEX ix_chat_user_1_last_message_time (user_1, last_message_time),
+    INDEX ix_chat_user_2_last_message_time (user_2, last_message_time),
+    UNIQUE INDEX uq_chat_user_1_user_2 (user_1, user_2)
 );
 
 CREATE TABLE `Message`(
@@ -36,53 +45,81 @@ CREATE TABLE `Message`(
 
     content_type ENUM('TEXT', 'FILE', 'EVENT') default 'TEXT',
     content VARCHAR(4000) NOT NULL,
+    `sequence` INT,
 
     FOREIGN KEY (chat_id) REFERENCES Chat(id),
     FOREIGN KEY (sender_id) REFERENCES User(id),
-    PRIMARY KEY (id, chat_id)    
+    PRIMARY KEY (id, chat_id),
+    INDEX ix_message_chat_id_time_stamp (chat_id, time_stamp)
 );
 
+-- ids of files, attachments, jobs, contracts, escrows and work are time
+-- ordered UUIDs (version 7) stored as BINARY(16), see server/model/ids.py
 CREATE TABLE `File`(
-    id CHAR(36) PRIMARY KEY,
+    id BINARY(16) PRIMARY KEY,
     file_name VARCHAR(30),
     file_path VARCHAR(260),
-    mime_type VARCHAR(128) 
+    mime_type VARCHAR(128),
+    content_hash CHAR(64),
+    size BIGINT,
+    -- P: pending, R: ready, F: content does not match hash
+    status CHAR(1) NOT NULL DEFAULT 'R',
+
+    INDEX ix_file_content_hash (content_hash),
+    INDEX ix_file_status_id (status, id)
+);
+
+-- users, chats, proposals, contracts and jobs referencing a file,
+-- proposals are identified as "<job id>:<worker id>"
+CREATE TABLE File_access(
+    file_id BINARY(16) NOT NULL,
+    scope_type VARCHAR(10) NOT NULL,
+    scope_id VARCHAR(64) NOT NULL,
+
+    FOREIGN KEY (file_id) REFERENCES `File`(id),
+    PRIMARY KEY (file_id, scope_type, scope_id)
 );
 
 CREATE TABLE Job (
-    id CHAR(36) PRIMARY KEY,
+    id BINARY(16) PRIMARY KEY,
     title VARCHAR(50) NOT NULL,
     `description` VARCHAR(500) NOT NULL,
     experience_level ENUM('ENTRY', 'INTERMEDIATE', 'EXPERT') NOT NULL,
-    attachment_id CHAR(36),
+    attachment_id BINARY(16),
     budget float,
     owner_id int not null,
-    post_time DATETIME not null DEFAULT NOW()
+    post_time DATETIME not null DEFAULT NOW(),
+
+    INDEX ix_job_owner_id_post_time (owner_id, post_time)
 );
 
 CREATE TABLE Contract (    
-    id CHAR(36) PRIMARY KEY,
-    job_id CHAR(36) NOT NULL,
+    id BINARY(16) PRIMARY KEY,
+    job_id BINARY(16) NOT NULL,
     worker_id INT NOT NULL,
     deadline DATETIME NOT NULL,   
     `status` CHAR(1),
 
     FOREIGN KEY (worker_id) REFERENCES User(id),
-    FOREIGN KEY (job_id) REFERENCES Job(id)    
+    FOREIGN KEY (job_id) REFERENCES Job(id),
+    INDEX ix_contract_status_deadline (`status`, deadline),
+    INDEX ix_contract_job_id_worker_id_status (job_id, worker_id, `status`)
 );
 
 CREATE TABLE Escrow (
-    id CHAR(36) PRIMARY KEY,
-    contract_id CHAR(36) NOT NULL,
-    amount FLOAT NOT NULL,
+    id BINARY(16) PRIMARY KEY,
+    contract_id BINARY(16) NOT NULL,
+    amount_minor BIGINT NOT NULL,
+    balance_minor BIGINT NOT NULL DEFAULT 0,
     date_of_initiation DATETIME NOT NULL DEFAULT NOW(),
 
-    FOREIGN KEY (contract_id) REFERENCES Contract(id)
+    FOREIGN KEY (contract_id) REFERENCES Contract(id),
+    INDEX ix_escrow_contract_id (contract_id)
 );
 
 CREATE TABLE `Attachment`(
-    id CHAR(36) NOT NULL,
-    file_id CHAR(36) NOT NULL,
+    id BINARY(16) NOT NULL,
+    file_id BINARY(16) NOT NULL,
 
     FOREIGN KEY (file_id) REFERENCES `File`(id),
     PRIMARY KEY (id, file_id)
@@ -93,25 +130,75 @@ CREATE TABLE User_balance (
     amount FLOAT NOT NULL DEFAULT 0
 );
 
+CREATE TABLE Payment_event(
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    tx_ref VARCHAR(100) NOT NULL UNIQUE,
+    user_id INT,
+    amount_minor BIGINT,
+    `status` CHAR(1) NOT NULL DEFAULT 'P',
+    attempts INT NOT NULL DEFAULT 0,
+    created_at DATETIME NOT NULL DEFAULT NOW(),
+    processed_at DATETIME,
+
+    FOREIGN KEY (user_id) REFERENCES User(id),
+    INDEX ix_payment_event_status_id (`status`, id)
+);
+
+CREATE TABLE Ledger_entry(
+    id INT PRIMARY KEY AUTO_INCREMENT,
+    transfer_id CHAR(36) NOT NULL,
+    account_type VARCHAR(10) NOT NULL,
+    account_id VARCHAR(36) NOT NULL,
+    amount BIGINT NOT NULL,
+    kind VARCHAR(20) NOT NULL,
+    reference VARCHAR(100),
+    created_at DATETIME NOT NULL DEFAULT NOW(),
+
+    INDEX ix_ledger_entry_transfer_id (transfer_id),
+    INDEX ix_ledger_entry_account (account_type, account_id, id)
+);
+
 CREATE TABLE Proposal(
     worker_id INT not null,
-    job_id CHAR(36) not null,
-    attachment_id CHAR(36),
+    job_id BINARY(16) not null,
+    attachment_id BINARY(16),
     content varchar(500),
     sent_time datetime not null,
     
     foreign key (worker_id) references User(id),
     foreign key (job_id) references Job(id),
     foreign key (attachment_id) references Attachment(id),
-    PRIMARY Key (worker_id, job_id)
+    PRIMARY Key (worker_id, job_id),
+    INDEX ix_proposal_job_id_sent_time (job_id, sent_time)
 );
 
 CREATE TABLE Work(
-    id char(36) PRIMARY KEY,
-    contract_id CHAR(36) NOT NULL,
-    attachment_id CHAR(36),
+    id BINARY(16) PRIMARY KEY,
+    contract_id BINARY(16) NOT NULL,
+    attachment_id BINARY(16),
     submission_date DATETIME default now(),
 
     foreign key (contract_id) references `Contract`(id),
-    foreign key (attachment_id) references Attachment(id)    
-);
\ No newline at end of file
+    foreign key (attachment_id) references Attachment(id),
+    INDEX ix_work_contract_id_submission_date (contract_id, submission_date)
+);
+
+-- versions of server/migrations/versions this schema already contains,
+-- add a row here whenever a migration is added
+CREATE TABLE Schema_version(
+    version INT PRIMARY KEY,
+    `name` VARCHAR(100) NOT NULL,
+    applied_at DATETIME NOT NULL
+);
+
+INSERT INTO Schema_version (version, `name`, applied_at) VALUES
+    (1, 'chat_summaries', NOW()),
+    (2, 'file_content_hash', NOW()),
+    (3, 'money_in_santim', NOW()),
+    (4, 'contract_deadline_index', NOW()),
+    (5, 'hot_path_indexes', NOW()),
+    (6, 'canonical_chat_pairs', NOW()),
+    (7, 'file_access', NOW()),
+    (8, 'file_status', NOW()),
+    (9, 'binary_ids', NOW()),
+    (10, 'work_contract_index', NOW());
@@ -1,26 +1,32 @@
 import os
 from dotenv import load_dotenv
 
+# blueprints read configuration when they are imported
+load_dotenv()
+
+import click
 from werkzeug.security import generate_password_hash
-from flask import Flask, render_template, request, url_for, redirect, send_file
+from flask import Flask, render_template, request, url_for, redirect, abort, jsonify
 from flask_login import LoginManager, login_user, logout_user, login_required, current_user
 from sqlalchemy.exc import IntegrityError
 
-from model import User, UserType, db, File, Message, ContentType
-from chat import chat_bp, socketio
+from model import User, UserType, db, File, FileAccess, FileAccessScope, FileStatus
+from chat import chat_bp, socketio, MESSAGE_QUEUE
 from docs.doc import doc_bp
 from job import job_bp
 from proposal import proposal_bp
 from payment import payment_bp
-from contract import contract_bp
-from auth import AuthenticationManager
+from contract import contract_bp, EscrowSweeper
+from auth import get_auth_manager, revoke_user, access_control
 from utils import FileManager
-
-load_dotenv()
+from migrations import Migrator, IndexCheck
 
 app = Flask(__name__)
 app.config["SECRET_KEY"] = os.getenv("FLASK_SECRET_KEY")
 app.config['SQLALCHEMY_DATABASE_URI'] = os.getenv('DATABASE_URI')
+# hand file downloads off to front proxy when it is configured for it
+app.config['USE_X_SENDFILE'] = os.getenv('USE_X_SENDFILE', '').lower() in ('1', 'true')
+app.config['X_ACCEL_REDIRECT_PREFIX'] = os.getenv('X_ACCEL_REDIRECT_PREFIX')
 
 file_mgr = FileManager(os.getenv('UPLOAD_FOLDER'))
 
@@ -29,7 +35,7 @@ db.init_app(app)
 login_manager = LoginManager()
 login_manager.init_app(app)
 
-socketio.init_app(app)
+socketio.init_app(app, message_queue=MESSAGE_QUEUE)
 
 app.register_blueprint(chat_bp, url_prefix='/messages')
 app.register_blueprint(doc_bp, url_prefix='/docs')
@@ -38,7 +44,16 @@ app.register_blueprint(proposal_bp, url_prefix='/proposal')
 app.register_blueprint(payment_bp, url_prefix='/payment')
 app.register_blueprint(contract_bp, url_prefix='/contract')
 
-auth_manager = AuthenticationManager(os.getenv('FLASK_SECRET_KEY'))
+auth_manager = get_auth_manager(os.getenv('FLASK_SECRET_KEY'))
+
+# refunds escrow of contracts left open past their deadline, 0 disables it
+escrow_sweeper = EscrowSweeper(interval=float(os.getenv('ESCROW_SWEEP_INTERVAL', 300)))
+
+
+@app.before_request
+def start_escrow_sweeper():
+    # started by the server handling requests, not by CLI commands importing the app
+    escrow_sweeper.start(app)
 
 
 @login_manager.user_loader
@@ -59,9 +74,10 @@ def home():
 @app.route("/finance")
 @login_required
 def finance():
+    contracts = current_user.get_grouped_contracts()
     if current_user.user_type == UserType.EMPLOYER:
-        return render_template('emp_finance.html')
-    return render_template('free_finance.html')
+        return render_template('emp_finance.html', contracts=contracts)
+    return render_template('free_finance.html', contracts=contracts)
 
 
 @app.route("/login", methods=["GET", "POST"])
@@ -73,6 +89,7 @@ def login():
 
         if auth_manager.verify_credentials(email, password):
             user = User.get_by_email(email)
+            revoke_user(user)
             user.token = auth_manager.generate_auth_token(user.id)
             db.session.commit()
 
@@ -87,6 +104,7 @@ def login():
 @login_required
 def logout():
     user = User.get(current_user.id)
+    revoke_user(user)
     user.token = None
     db.session.commit()
     logout_user()
@@ -119,6 +137,9 @@ def register_freelancer():
 
         try:
             db.session.add(new_user)
+            db.session.flush()
+            if file_id:
+                FileAccess.grant(file_id, FileAccessScope.USER, new_user.id)
             db.session.commit()
         except IntegrityError:
             db.session.rollback()
@@ -157,13 +178,73 @@ def register_employer():
 @app.route('/files/<id>')
 @login_required
 def files(id):
-    message = Message.query.filter_by(
-        content_type=ContentType.FILE, content=id).first()
-    return send_file(File.get(id).file_path)
-    # if current_user.id in [message.chat.u1.id, message.chat.u2.id]:
-    #     return send_file(File.get(id).file_path)
+    file = File.get(id)
+    # content of failed files does not match what was uploaded
+    if not file or file.status == FileStatus.FAILED:
+        abort(404)
+
+    if not access_control.can_access_file(current_user.id, file.id):
+        abort(403)
+
+    return file_mgr.send(file, app.config['X_ACCEL_REDIRECT_PREFIX'])
+
+
+@app.route('/files/<id>/preview')
+@login_required
+def file_preview(id):
+    file = File.get(id)
+    if not file:
+        abort(404)
+
+    if not access_control.can_access_file(current_user.id, file.id):
+        abort(403)
+
+    if not file_mgr.has_preview(file):
+        # files stored before previews existed are rendered on first request
+        file_mgr.request_preview(file)
+        abort(404)
+
+    return file_mgr.send_preview(file, app.config['X_ACCEL_REDIRECT_PREFIX'])
+
+
+@app.route('/files/<id>/status')
+@login_required
+def file_status(id):
+    file = File.get(id)
+    if not file:
+        abort(404)
+
+    if not access_control.can_access_file(current_user.id, file.id):
+        abort(403)
+
+    return jsonify({
+        "file_id": file.id,
+        "status": file.status,
+        "mime_type": file.mime_type,
+        "size": file.size,
+        "preview_link": url_for('file_preview', id=file.id) if file_mgr.has_preview(file) else None
+    })
+
+
+@app.cli.command("migrate")
+def migrate():
+    """Applies pending database migrations"""
+
+    applied = Migrator(db.engine).upgrade()
+    click.echo(f"Applied migrations: {applied}" if applied else "Database is up to date")
+
+
+@app.cli.command("check-indexes")
+def check_indexes():
+    """Fails if a hot query reads a whole table"""
+
+    failures = IndexCheck().run()
+    for name, scans in failures.items():
+        click.echo(f"{name}: {'; '.join(scans)}")
 
-    # return "Unauthorize file access"
+    if failures:
+        raise SystemExit(1)
+    click.echo("Every hot query uses an index")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,212 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional
+
+from model import Chat, Contract, FileAccess, FileAccessScope, Job, db
+
+
+class MembershipCache:
+    """
+    Bounded cache of the chats, contracts and jobs users take part in
+
+    Memberships are only ever added (chats and contracts keep their users),
+    entries are reloaded after ttl seconds to pick up memberships added by
+    other processes. Least recently used users are dropped once max_size
+    is reached.
+
+    Parameters:
+        max_size (int): maximum number of cached users
+        ttl (int): maximum life time of single entry in seconds
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: int = 300) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[int, tuple[dict[str, set[str]], float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, user_id: int) -> Optional[dict[str, set[str]]]:
+        """
+        Gets cached memberships of user
+
+        Args:
+            user_id (int): user id
+
+        Returns:
+            dict: scope type -> set of ids, None if user is not cached or expired
+        """
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+
+            memberships, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[user_id]
+                return None
+
+            self._entries.move_to_end(user_id)
+            return memberships
+
+    def set(self, user_id: int, memberships: dict[str, set[str]]) -> None:
+        """
+        Caches memberships of user
+
+        Args:
+            user_id (int): user id
+            memberships (dict): scope type -> set of ids
+        """
+
+        with self._lock:
+            self._entries[user_id] = (memberships, time.monotonic() + self.ttl)
+            self._entries.move_to_end(user_id)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def add(self, user_id: int, scope_type: str, scope_id: str) -> None:
+        """
+        Adds membership to cached user, uncached users are left alone
+
+        Args:
+            user_id (int): user id
+            scope_type (str): one of FileAccessScope
+            scope_id (str): id of chat, contract or job
+        """
+
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is not None:
+                entry[0].setdefault(scope_type, set()).add(scope_id)
+
+
+class AccessControl:
+    """
+    Authorizes access to chats and stored files
+
+    A file is authorized with one lookup of the records referencing it in
+    FileAccess, matched against the cached memberships of the user. A
+    membership missing from the cache is checked against the database and
+    cached, so chats and contracts created after the cache was filled are
+    never refused.
+
+    Parameters:
+        cache (MembershipCache): cache of memberships (default is a new cache)
+    """
+
+    def __init__(self, cache: Optional[MembershipCache] = None):
+        self.cache = cache or MembershipCache()
+
+    def memberships(self, user_id: int) -> dict[str, set[str]]:
+        """
+        Gets ids of chats, contracts and jobs user takes part in
+
+        Args:
+            user_id (int): user id
+
+        Returns:
+            dict: scope type -> set of ids
+        """
+
+        memberships = self.cache.get(user_id)
+        if memberships is None:
+            memberships = self._load(user_id)
+            self.cache.set(user_id, memberships)
+
+        return memberships
+
+    def is_chat_member(self, user_id: int, chat_id) -> bool:
+        """
+        Checks whether user takes part in chat
+
+        Args:
+            user_id (int): user id
+            chat_id (int): chat id
+
+        Returns:
+            bool: True if user is one of the chat's users
+        """
+
+        return self._is_member(user_id, FileAccessScope.CHAT, str(chat_id))
+
+    def can_access_file(self, user_id: int, file_id: str) -> bool:
+        """
+        Checks whether user may download file
+
+        Args:
+            user_id (int): user id
+            file_id (str): file id
+
+        Returns:
+            bool: True if file is attached to a job, or was uploaded by the user
+                or sent to a chat, proposal or contract the user takes part in
+        """
+
+        for scope_type, scope_id in FileAccess.get_scopes(file_id):
+            if scope_type == FileAccessScope.JOB:
+                return True
+
+            if scope_type == FileAccessScope.USER:
+                if scope_id == str(user_id):
+                    return True
+
+            elif scope_type == FileAccessScope.PROPOSAL:
+                job_id, _, worker_id = scope_id.rpartition(':')
+                if worker_id == str(user_id) or \
+                        self._is_member(user_id, FileAccessScope.JOB, job_id):
+                    return True
+
+            elif self._is_member(user_id, scope_type, scope_id):
+                return True
+
+        return False
+
+    def _is_member(self, user_id: int, scope_type: str, scope_id: str) -> bool:
+        if scope_id in self.memberships(user_id).get(scope_type, ()):
+            return True
+
+        if self._query_member(user_id, scope_type, scope_id):
+            self.cache.add(user_id, scope_type, scope_id)
+            return True
+
+        return False
+
+    @staticmethod
+    def _load(user_id: int) -> dict[str, set[str]]:
+        chats = db.session.query(Chat.id).filter(
+            db.or_(Chat.user_1 == user_id, Chat.user_2 == user_id))
+        jobs = db.session.query(Job.id).filter(Job.owner_id == user_id)
+        contracts = db.session.query(Contract.id).outerjoin(Job, Contract.job_id == Job.id)\
+            .filter(db.or_(Contract.worker_id == user_id, Job.owner_id == user_id))
+
+        return {
+            FileAccessScope.CHAT: {str(chat_id) for chat_id, in chats},
+            FileAccessScope.JOB: {str(job_id) for job_id, in jobs},
+            FileAccessScope.CONTRACT: {str(contract_id) for contract_id, in contracts}
+        }
+
+    @staticmethod
+    def _query_member(user_id: int, scope_type: str, scope_id: str) -> bool:
+        if scope_type == FileAccessScope.CHAT:
+            try:
+                chat = Chat.get(int(scope_id))
+            except ValueError:
+                return False
+            return chat is not None and user_id in (chat.user_1, chat.user_2)
+
+        if scope_type == FileAccessScope.JOB:
+            return db.session.query(
+                db.exists().where(Job.id == scope_id, Job.owner_id == user_id)).scalar()
+
+        if scope_type == FileAccessScope.CONTRACT:
+            return db.session.query(Contract.id).outerjoin(Job, Contract.job_id == Job.id)\
+                .filter(Contract.id == scope_id,
+                        db.or_(Contract.worker_id == user_id, Job.owner_id == user_id))\
+                .first() is not None
+
+        return False
+
+
+access_control = AccessControl()
@@ -1,12 +1,15 @@
 import os
 import sys
-from typing import Any, Optional
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Optional
 
 from itsdangerous.url_safe import URLSafeTimedSerializer
 from itsdangerous.exc import BadSignature, SignatureExpired
 from werkzeug.security import check_password_hash
 
-from model import User
+from model import User, db
 
 sys.path.append('..')
 
@@ -38,20 +41,23 @@ class AuthenticationManager:
 
         return self.serilizer.dumps(data)
 
-    def verify_token(self, token: str) -> Any:
+    def verify_token(self, token: str, return_timestamp: bool = False) -> Any:
         """
         Verifies and loads authentication token generated by serilizer
 
         Args:
             token (str): authentication token to verify
+            return_timestamp (bool): also return time the token was signed at
+                (default is False)
 
         Returns:
-            Any: data from token if the token is valid, None otherwise        
+            Any: data from token if the token is valid, None otherwise,
+                (data, datetime) tuple if return_timestamp is True
         """
 
         try:
-            data = self.serilizer.loads(token, max_age=self.max_age)
-            return data
+            return self.serilizer.loads(token, max_age=self.max_age,
+                                        return_timestamp=return_timestamp)
         except BadSignature:
             return None
         except SignatureExpired:
@@ -76,10 +82,160 @@ class AuthenticationManager:
         return check_password_hash(user.password, password)
 
 
-def load_user(token: str, secret_key=os.getenv('FLASK_SECRET_KEY')) -> Optional[User]:
+class TokenCache:
+    """
+    Bounded cache mapping verified authentication tokens to user ids
+
+    Entries expire after ttl seconds or when the token itself expires,
+    whichever comes first. Least recently used entries are dropped once
+    max_size is reached.
+
+    Parameters:
+        max_size (int): maximum number of cached tokens
+        ttl (int): maximum life time of single entry in seconds
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: int = 60) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: OrderedDict[str, tuple[Any, float]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, token: str) -> Any:
+        """
+        Gets user id of cached token
+
+        Args:
+            token (str): authentication token
+
+        Returns:
+            Any: user id if token is cached and not expired, None otherwise
+        """
+
+        with self._lock:
+            entry = self._entries.get(token)
+            if entry is None:
+                return None
+
+            user_id, expires_at = entry
+            if expires_at <= time.time():
+                del self._entries[token]
+                return None
+
+            self._entries.move_to_end(token)
+            return user_id
+
+    def set(self, token: str, user_id: Any, token_expires_at: float) -> None:
+        """
+        Caches verified token
+
+        Args:
+            token (str): authentication token
+            user_id (Any): id of the user the token belongs to
+            token_expires_at (float): unix time the token expires at
+        """
+
+        expires_at = min(time.time() + self.ttl, token_expires_at)
+
+        with self._lock:
+            self._entries[token] = (user_id, expires_at)
+            self._entries.move_to_end(token)
+
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, token: Optional[str]) -> None:
+        """
+        Removes token from cache
+
+        Args:
+            token (str): authentication token
+        """
+
+        with self._lock:
+            self._entries.pop(token, None)
+
+
+token_cache = TokenCache()
+
+_auth_managers: dict[str, AuthenticationManager] = {}
+
+
+def get_auth_manager(secret_key: Optional[str] = None) -> AuthenticationManager:
+    """
+    Gets AuthenticationManager shared by the process for secret key
+
+    Args:
+        secret_key (str): encryption key (default is FLASK_SECRET_KEY
+            environment variable)
+
+    Returns:
+        AuthenticationManager: the shared manager
+    """
+
+    secret_key = secret_key or os.getenv('FLASK_SECRET_KEY')
+
+    auth_manager = _auth_managers.get(secret_key)
+    if auth_manager is None:
+        auth_manager = _auth_managers.setdefault(
+            secret_key, AuthenticationManager(secret_key))
+
+    return auth_manager
+
+
+_revoke_hooks: list[Callable[[Any], None]] = []
+
+
+def on_revoke(hook: Callable[[Any], None]) -> Callable[[Any], None]:
+    """
+    Registers function called with user id whenever authentication of user is revoked
+
+    Args:
+        hook (callable): function receiving user id
+
+    Returns:
+        callable: the hook, so that on_revoke can be used as decorator
+    """
+
+    _revoke_hooks.append(hook)
+    return hook
+
+
+def invalidate_token(token: Optional[str]) -> None:
+    """
+    Drops cached verification of token, call it whenever user.token changes
+
+    Args:
+        token (str): authentication token that is no longer valid
+    """
+
+    if token:
+        token_cache.invalidate(token)
+
+
+def revoke_user(user: User) -> None:
+    """
+    Invalidates current token of user and runs revocation hooks, call it
+    before user.token is replaced or cleared
+
+    Args:
+        user (User): the user whose authentication is revoked
+    """
+
+    invalidate_token(user.token)
+
+    for hook in _revoke_hooks:
+        hook(user.id)
+
+
+def load_user(token: str, secret_key: Optional[str] = None) -> Optional[User]:
     """
     Validates user token and loads user from database if user token is valid
 
+    Tokens verified once are cached by token_cache, so later calls skip the
+    signature check. The token is still compared with the one stored on the
+    user, so tokens revoked by another worker stop working right away.
+
     Args:
         token (str): a user token generated by AuthenticationManager
 
@@ -87,10 +243,30 @@ def load_user(token: str, secret_key=os.getenv('FLASK_SECRET_KEY')) -> Optional[
         User: the user object for which the token belongs if the token is valid, None otherwise
     """
 
-    auth_manager = AuthenticationManager(secret_key)
-    user_id = auth_manager.verify_token(token)
+    if not token:
+        return None
 
-    if user_id:
-        user = User.get(user_id)
-        if user.token == token:
+    user_id = token_cache.get(token)
+    if user_id is not None:
+        user = db.session.get(User, user_id)
+        # the cache is per process, a token replaced through another worker
+        # is only noticed by comparing it with the stored one
+        if user and user.token == token:
             return user
+
+        token_cache.invalidate(token)
+        return None
+
+    auth_manager = get_auth_manager(secret_key)
+    verified = auth_manager.verify_token(token, return_timestamp=True)
+
+    if not verified:
+        return None
+
+    user_id, signed_at = verified
+    user = User.get(user_id)
+
+    if user and user.token == token:
+        token_cache.set(token, user.id,
+                        signed_at.timestamp() + auth_manager.max_age)
+        return user
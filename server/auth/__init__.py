@@ -1 +1,2 @@
-from .AuthenticationManager import AuthenticationManager, load_user
+from .AuthenticationManager import AuthenticationManager, load_user, invalidate_token, revoke_user, on_revoke, get_auth_manager
+from .AccessControl import AccessControl, access_control
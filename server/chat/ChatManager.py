@@ -1,7 +1,16 @@
+import re
 import sys
-from model import db, Message, Chat, ContentType
+from datetime import datetime
+from model import db, Message, Chat, File, FileAccess, FileAccessScope, ContentType
 sys.path.append('..')
 
+CLEANR = re.compile('<.*?>')
+
+
+def text_only(raw_html):
+    clean_text = re.sub(CLEANR, '', raw_html)
+    return clean_text
+
 
 class ChatManager:
     """
@@ -16,41 +25,108 @@ class ChatManager:
 
     def initiate_chat(self, receiver_id: str) -> str:
         """
-        Create new chat between two users
+        Create new chat between two users unless they already have one
 
         Args:
             receiver_id: the second user in the chat
 
         Returns: 
-            str: the created chat id
+            str: id of the created or already existing chat
         """
 
-        if Chat.get_chat(self.user_id, receiver_id):
-            return
+        user_1, user_2 = Chat.pair(self.user_id, receiver_id)
 
-        chat = Chat(user_1=self.user_id, user_2=receiver_id)
+        chat = Chat.get_chat(user_1, user_2)
+        if chat:
+            return chat.id
 
-        db.session.add(chat)
+        # insert is skipped when the unique (user_1, user_2) index already
+        # holds a chat created concurrently
+        db.session.execute(
+            db.insert(Chat)
+            .values(user_1=user_1, user_2=user_2)
+            .prefix_with('IGNORE', dialect='mysql')
+            .prefix_with('OR IGNORE', dialect='sqlite')
+        )
+        # the chat is read in a new transaction, the snapshot of the current
+        # one may predate a chat created concurrently
         db.session.commit()
 
-        return chat.id
+        return Chat.get_chat(user_1, user_2).id
 
-    def send_message(self, chat_id: str, content: str, content_type: str = ContentType.TEXT):
+    def send_message(self, chat_id: str, content: str, content_type: str = ContentType.TEXT) -> Message:
         """
         Save message under chat_id
 
+        The chat row is locked and reloaded until commit while its sequence
+        number, last message summary and unread counter are updated, so
+        messages of one chat get consecutive sequence numbers.
+
         Args:
             chat_id (str): chat containing two users
             sender_id (str): the user id of sender of the message
             content (str): the message sent
             content_type (str): specifies how to interpret the content
                 (default is 'TEXT')
+
+        Returns:
+            Message: the saved message
         """
 
-        msg = Message(chat_id=chat_id,
+        # the chat may already be loaded without lock, refresh it with the locked row
+        chat = Chat.query.filter(Chat.id == chat_id).with_for_update()\
+            .populate_existing().one()
+        chat.last_sequence += 1
+
+        msg = Message(chat_id=chat.id,
                       sender_id=self.user_id,
                       content=content,
-                      content_type=content_type)
+                      content_type=content_type,
+                      time_stamp=datetime.now(),
+                      sequence=chat.last_sequence)
 
         db.session.add(msg)
+        db.session.flush()
+
+        # counter is incremented by the database, a read of the chat without
+        # lock would otherwise overwrite it with a stale value
+        unread = Chat.unread_2 if chat.user_1 == self.user_id else Chat.unread_1
+        db.session.execute(
+            db.update(Chat)
+            .where(Chat.id == chat.id)
+            .values({
+                Chat.last_message_id: msg.id,
+                Chat.last_message_preview: self.preview(content, content_type),
+                Chat.last_message_time: msg.time_stamp,
+                unread: unread + 1
+            })
+            .execution_options(synchronize_session=False)
+        )
+
+        if content_type == ContentType.FILE:
+            FileAccess.grant(content, FileAccessScope.CHAT, chat.id)
+
         db.session.commit()
+
+        return msg
+
+    @staticmethod
+    def preview(content: str, content_type: str) -> str:
+        """
+        Creates plain text inbox preview of message content
+
+        Args:
+            content (str): the message sent
+            content_type (str): specifies how to interpret the content
+
+        Returns:
+            str: preview text
+        """
+
+        if content_type == ContentType.FILE:
+            file = File.get(content)
+            text = file.file_name if file else ''
+        else:
+            text = text_only(content)
+
+        return text[:Chat.PREVIEW_LENGTH]
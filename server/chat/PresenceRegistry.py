@@ -0,0 +1,165 @@
+import threading
+from abc import ABC, abstractmethod
+from typing import Iterable, Optional
+
+
+class PresenceRegistry(ABC):
+    """Abstract base class for registries tracking which sockets each user has open"""
+
+    @abstractmethod
+    def add(self, user_id: int, sid: str) -> bool:
+        """Registers socket of user, returns True if it is the first socket of user"""
+        pass
+
+    @abstractmethod
+    def remove(self, user_id: int, sid: str) -> bool:
+        """Unregisters socket of user, returns True if it was the last socket of user"""
+        pass
+
+    @abstractmethod
+    def remove_user(self, user_id: int) -> set[str]:
+        """Unregisters every socket of user and returns their session ids"""
+        pass
+
+    @abstractmethod
+    def get_sids(self, user_id: int) -> set[str]:
+        """Gets session ids of sockets user has open"""
+        pass
+
+    @abstractmethod
+    def online(self, user_ids: Iterable[int]) -> set[int]:
+        """Gets the users among user_ids that have at least one socket open"""
+        pass
+
+    def refresh(self, user_ids: Iterable[int]) -> None:
+        """Marks sockets of users as still open, called periodically for the
+        users with sockets on this worker"""
+        pass
+
+
+class LocalPresenceRegistry(PresenceRegistry):
+    """PresenceRegistry keeping sockets in process memory, for single process deployments and tests"""
+
+    def __init__(self):
+        self._sockets: dict[int, set[str]] = {}
+        self._lock = threading.Lock()
+
+    def add(self, user_id: int, sid: str) -> bool:
+        with self._lock:
+            sockets = self._sockets.setdefault(user_id, set())
+            first = not sockets
+            sockets.add(sid)
+            return first
+
+    def remove(self, user_id: int, sid: str) -> bool:
+        with self._lock:
+            sockets = self._sockets.get(user_id)
+            if sockets is None or sid not in sockets:
+                return False
+
+            sockets.discard(sid)
+            if not sockets:
+                del self._sockets[user_id]
+            return not sockets
+
+    def remove_user(self, user_id: int) -> set[str]:
+        with self._lock:
+            return self._sockets.pop(user_id, set())
+
+    def get_sids(self, user_id: int) -> set[str]:
+        with self._lock:
+            return set(self._sockets.get(user_id, ()))
+
+    def online(self, user_ids: Iterable[int]) -> set[int]:
+        with self._lock:
+            return {user_id for user_id in user_ids if user_id in self._sockets}
+
+
+class RedisPresenceRegistry(PresenceRegistry):
+    """
+    PresenceRegistry shared by every worker through Redis
+
+    Each user is stored as a set of session ids. Workers refresh the sets
+    of their users through `refresh`, sets expire `ttl` seconds after the
+    last refresh so sockets of crashed workers are forgotten soon.
+    """
+
+    KEY_PREFIX = 'gigrid:presence:'
+
+    def __init__(self, url: str, ttl: int = 90):
+        """
+        Args:
+            url (str): Redis connection url
+            ttl (int): life time of user socket set in seconds, must be
+                longer than the interval sets are refreshed at (default is 90)
+        """
+
+        try:
+            import redis
+        except ImportError:
+            raise ImportError(
+                'redis package is required to share presence between workers')
+
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.ttl = ttl
+
+    def _key(self, user_id: int) -> str:
+        return f'{self.KEY_PREFIX}{user_id}'
+
+    def add(self, user_id: int, sid: str) -> bool:
+        pipe = self.redis.pipeline()
+        pipe.sadd(self._key(user_id), sid)
+        pipe.scard(self._key(user_id))
+        pipe.expire(self._key(user_id), self.ttl)
+        added, count, _ = pipe.execute()
+        return bool(added) and count == 1
+
+    def remove(self, user_id: int, sid: str) -> bool:
+        pipe = self.redis.pipeline()
+        pipe.srem(self._key(user_id), sid)
+        pipe.scard(self._key(user_id))
+        removed, count = pipe.execute()
+        return bool(removed) and count == 0
+
+    def remove_user(self, user_id: int) -> set[str]:
+        pipe = self.redis.pipeline()
+        pipe.smembers(self._key(user_id))
+        pipe.delete(self._key(user_id))
+        sids, _ = pipe.execute()
+        return set(sids)
+
+    def get_sids(self, user_id: int) -> set[str]:
+        return set(self.redis.smembers(self._key(user_id)))
+
+    def online(self, user_ids: Iterable[int]) -> set[int]:
+        user_ids = list(user_ids)
+
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.exists(self._key(user_id))
+
+        return {user_id for user_id, exists in zip(user_ids, pipe.execute()) if exists}
+
+    def refresh(self, user_ids: Iterable[int]) -> None:
+        pipe = self.redis.pipeline(transaction=False)
+        for user_id in user_ids:
+            pipe.expire(self._key(user_id), self.ttl)
+        pipe.execute()
+
+
+def create_presence_registry(url: Optional[str] = None) -> PresenceRegistry:
+    """
+    Creates registry matching Socket.IO message queue url
+
+    Args:
+        url (str): message queue url, Redis urls share presence between
+            workers, anything else keeps it in process
+
+    Returns:
+        PresenceRegistry: the registry
+    """
+
+    if url and url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisPresenceRegistry(url)
+
+    return LocalPresenceRegistry()
@@ -0,0 +1,159 @@
+import logging
+import threading
+import time
+from typing import Callable, Iterable
+
+from flask import Flask
+from flask_socketio import SocketIO
+
+from .SocketSessionManager import SocketSessionManager
+
+logger = logging.getLogger(__name__)
+
+
+class PresenceService:
+    """
+    Announces users going online and offline to the users they chat with
+
+    A user goes online when their first socket on any worker is registered
+    and offline when their last one is removed, as reported by the shared
+    PresenceRegistry, so exactly one worker announces each change. Changes
+    are collected for `window` seconds and then every interested user
+    receives a single event listing them, so a user reconnecting many times
+    within a window causes at most one announcement and users whose state
+    did not change in the end are not announced at all. Sockets of this
+    worker are refreshed in the registry every `heartbeat` seconds.
+
+    Parameters:
+        socketio (SocketIO): server used to emit events
+        sessions (SocketSessionManager): sockets of this worker and the
+            registry tracking sockets of users on every worker
+        get_peers (callable): maps list of user ids to dict of
+            peer id -> set of those user ids the peer chats with
+        window (float): seconds changes are coalesced for (default is 2)
+        heartbeat (float): seconds between refreshes of sockets in the
+            registry, shorter than its time to live (default is 30)
+    """
+
+    EVENT = 'presence'
+
+    def __init__(self, socketio: SocketIO, sessions: SocketSessionManager,
+                 get_peers: Callable[[list[int]], dict[int, set[int]]], window: float = 2.0,
+                 heartbeat: float = 30.0):
+        self.socketio = socketio
+        self.sessions = sessions
+        self.registry = sessions.registry
+        self.get_peers = get_peers
+        self.window = window
+        self.heartbeat = heartbeat
+
+        # user id -> (first, last) state reported within the window
+        self._pending: dict[int, tuple[bool, bool]] = {}
+        self._lock = threading.Lock()
+        self._flusher = None
+
+    def online(self, user_ids: Iterable[int]) -> set[int]:
+        """
+        Gets users that are online
+
+        Args:
+            user_ids (Iterable[int]): user ids to check
+
+        Returns:
+            set: ids of users among user_ids with at least one open socket
+        """
+
+        return self.registry.online(user_ids)
+
+    def connected(self, user_id: int, first: bool, app: Flask) -> None:
+        """
+        Records socket of user being registered
+
+        Args:
+            user_id (int): id of user who connected
+            first (bool): whether it is the first socket of user, see `PresenceRegistry.add`
+            app (Flask): application the flusher runs in
+        """
+
+        self.start(app)
+        if first:
+            self._record(user_id, True)
+
+    def disconnected(self, user_id: int, last: bool, app: Flask) -> None:
+        """
+        Records socket of user being removed
+
+        Args:
+            user_id (int): id of user who disconnected
+            last (bool): whether it was the last socket of user, see `PresenceRegistry.remove`
+            app (Flask): application the flusher runs in
+        """
+
+        if last:
+            self.start(app)
+            self._record(user_id, False)
+
+    def start(self, app: Flask) -> None:
+        """
+        Starts the flusher on first call
+
+        Args:
+            app (Flask): application the flusher runs in
+        """
+
+        with self._lock:
+            if self._flusher is None:
+                self._flusher = self.socketio.start_background_task(
+                    self._run, app)
+
+    def _record(self, user_id: int, online: bool) -> None:
+        with self._lock:
+            first, _ = self._pending.get(user_id, (online, online))
+            self._pending[user_id] = (first, online)
+
+    def _run(self, app: Flask) -> None:
+        last_heartbeat = time.monotonic()
+
+        while True:
+            self.socketio.sleep(self.window)
+
+            try:
+                with app.app_context():
+                    self.flush()
+
+                if time.monotonic() - last_heartbeat >= self.heartbeat:
+                    last_heartbeat = time.monotonic()
+                    self.registry.refresh(self.sessions.user_ids())
+            except Exception:
+                logger.exception('Failed to announce presence changes')
+
+    def flush(self) -> None:
+        """Announces state changes collected since last flush"""
+
+        with self._lock:
+            pending, self._pending = self._pending, {}
+
+        # a user who went online and offline again within the window did not change
+        changes = {user_id: last for user_id, (first, last) in pending.items()
+                   if first == last}
+        if not changes:
+            return
+
+        # changes reported by other workers may be newer than the ones of this worker
+        online = self.registry.online(changes)
+        came_online = {user_id for user_id, state in changes.items()
+                       if state and user_id in online}
+        went_offline = {user_id for user_id, state in changes.items()
+                        if not state and user_id not in online}
+
+        changed = came_online | went_offline
+        if not changed:
+            return
+
+        for peer_id, peer_users in self.get_peers(list(changed)).items():
+            self.socketio.emit(self.EVENT,
+                               {
+                                   'online': sorted(peer_users & came_online),
+                                   'offline': sorted(peer_users & went_offline)
+                               },
+                               to=SocketSessionManager.user_room(peer_id))
@@ -0,0 +1,126 @@
+import threading
+from typing import Optional
+
+from .PresenceRegistry import PresenceRegistry, LocalPresenceRegistry
+
+
+class SocketSessionManager:
+    """
+    Keeps identity of authenticated sockets
+
+    A socket is authenticated once, on connect or join, and later events read
+    the user id bound to its session id (sid) instead of verifying a token.
+    Bindings of the sockets served by this worker are kept in memory while
+    the sockets of each user are tracked by a PresenceRegistry, which may be
+    shared by every worker.
+
+    Parameters:
+        registry (PresenceRegistry): registry tracking sockets of users
+            (default is LocalPresenceRegistry)
+    """
+
+    def __init__(self, registry: Optional[PresenceRegistry] = None):
+        self.registry = registry or LocalPresenceRegistry()
+        self._users: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def bind(self, sid: str, user_id: int) -> bool:
+        """
+        Binds user to socket
+
+        Args:
+            sid (str): socket session id
+            user_id (int): id of authenticated user
+
+        Returns:
+            bool: True if it is the first socket of user on any worker
+        """
+
+        if self._users.get(sid) == user_id:
+            return False
+
+        self.unbind(sid)
+
+        with self._lock:
+            self._users[sid] = user_id
+        return self.registry.add(user_id, sid)
+
+    def unbind(self, sid: str) -> tuple[Optional[int], bool]:
+        """
+        Removes identity bound to socket
+
+        Args:
+            sid (str): socket session id
+
+        Returns:
+            tuple: id of user that was bound to socket, None if socket was
+                not authenticated, and whether it was the last socket of
+                user on any worker
+        """
+
+        with self._lock:
+            user_id = self._users.pop(sid, None)
+
+        if user_id is None:
+            return None, False
+        return user_id, self.registry.remove(user_id, sid)
+
+    def unbind_user(self, user_id: int) -> set[str]:
+        """
+        Removes identity from every socket of user, on every worker
+
+        Sockets served by other workers stay bound there until they are
+        disconnected.
+
+        Args:
+            user_id (int): user id
+
+        Returns:
+            set: session ids of sockets that were bound to user
+        """
+
+        sids = self.registry.remove_user(user_id)
+
+        with self._lock:
+            for sid in sids:
+                self._users.pop(sid, None)
+        return sids
+
+    def user_ids(self) -> set[int]:
+        """
+        Gets users with sockets bound on this worker
+
+        Returns:
+            set: user ids
+        """
+
+        with self._lock:
+            return set(self._users.values())
+
+    def get_user_id(self, sid: str) -> Optional[int]:
+        """
+        Gets id of user bound to socket
+
+        Args:
+            sid (str): socket session id
+
+        Returns:
+            int: user id if socket is authenticated, None otherwise
+        """
+
+        return self._users.get(sid)
+
+    @staticmethod
+    def user_room(user_id: int) -> str:
+        """
+        Gets name of room joined by every socket of user, kept apart from
+        chat rooms which are named by chat id
+
+        Args:
+            user_id (int): user id
+
+        Returns:
+            str: room name
+        """
+
+        return f'user:{user_id}'
@@ -1 +1 @@
-from .chat import chat_bp, socketio
+from .chat import chat_bp, socketio, MESSAGE_QUEUE
\ No newline at end of file
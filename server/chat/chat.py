@@ -3,39 +3,88 @@ import sys
 import json
 from typing import Optional
 
-from flask import Blueprint, render_template, request, url_for, redirect, jsonify
+from flask import Blueprint, render_template, request, url_for, redirect, jsonify, current_app
 
 from flask_login import login_required, current_user
 
 from flask_socketio import SocketIO, join_room
 
-from model import User, Chat, Message, File, ContentType, UserType
+from model import User, Chat, Message, File, FileAccess, FileAccessScope, ContentType, UserType, db
 
-from utils import FileManager
-from auth import AuthenticationManager, load_user
+from utils import FileManager, FileLoader, file_processor
+from auth import load_user, on_revoke, access_control
 from .ChatManager import ChatManager
-import re
+from .SocketSessionManager import SocketSessionManager
+from .PresenceRegistry import create_presence_registry
+from .PresenceService import PresenceService
 
 sys.path.append('..')
 
 chat_bp = Blueprint('chat_bp', __name__,
                     static_folder='static', template_folder='templates')
 
+# rooms and emits are shared between workers through the message queue
+# when SOCKETIO_MESSAGE_QUEUE is set (e.g. redis://localhost:6379/0),
+# it is passed to socketio.init_app by the application
+MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE')
+
 socketio = SocketIO(cors_allowed_origins="*")
+socket_sessions = SocketSessionManager(create_presence_registry(MESSAGE_QUEUE))
+presence = PresenceService(socketio, socket_sessions, Chat.get_peers)
+
+MAX_PRESENCE_QUERY = 500
 file_mgr = FileManager(os.getenv('UPLOAD_FOLDER'))
 
-CLEANR = re.compile('<.*?>')
+HISTORY_PAGE_SIZE = 50
+MAX_HISTORY_PAGE_SIZE = 200
+
+
+def message_json(message: Message, file: Optional[File] = None) -> dict:
+    """Serializes message, file is required for FILE messages
+
+    Args:
+        message (Message): the message
+        file (File): file referenced by FILE message
+
+    Returns:
+        dict: message data shared by chat history and socket events
+    """
+
+    data = {
+        "id": message.id,
+        "chat_id": message.chat_id,
+        "sender_id": message.sender_id,
+        "sequence": message.sequence,
+        "content_type": message.content_type,
+        "timestamp": message.time_stamp.isoformat()
+    }
+
+    if message.content_type == ContentType.FILE:
+        data["file_name"] = file.file_name
+        data["file_link"] = url_for('files', id=file.id)
+        data["mime_type"] = file.mime_type
+        data["file_status"] = file.status
+        if file_mgr.has_preview(file):
+            data["preview_link"] = url_for('file_preview', id=file.id)
+    else:
+        data["content"] = message.content
 
+    return data
 
-def text_only(raw_html):
-    clean_text = re.sub(CLEANR, '', raw_html)
-    return clean_text
+
+def to_int(value, default: Optional[int] = None) -> Optional[int]:
+    """Converts request value to int, returns default if it is missing or invalid"""
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
 
 
 @chat_bp.route('/')
 @login_required
 def message():
-    return render_template('messages.html', text_only=text_only)
+    return render_template('messages.html', chats=Chat.get_inbox(current_user.id))
 
 
 @chat_bp.route('/<user_id>')
@@ -59,33 +108,36 @@ def get_messages():
         return ""
 
     chat_id = request.json.get('chat_id')
+    if not access_control.is_chat_member(user.id, chat_id):
+        return "", 403
+
     chat = Chat.get(chat_id)
 
-    if not chat:
-        return ""
+    before = to_int(request.json.get('before'))
+    after = to_int(request.json.get('after'))
+    limit = to_int(request.json.get('limit'), HISTORY_PAGE_SIZE)
+    limit = min(max(limit, 1), MAX_HISTORY_PAGE_SIZE)
+
+    if before is None and chat.mark_read(user.id):
+        db.session.commit()
+
+    messages = Message.get_history(chat.id, before=before, after=after, limit=limit)
+
+    file_loader = FileLoader.current()
+    file_loader.prime(message.content for message in messages
+                      if message.content_type == ContentType.FILE)
 
     result = []
-    for message in chat.messages:
-        if message.content_type == ContentType.TEXT:
-            result.append({
-                "id": message.id,
-                "content": message.content,
-                "content_type": message.content_type,
-                "timestamp": message.time_stamp,
-                "sent": user.id == message.sender_id
-            })
-
-        elif message.content_type == ContentType.FILE:
-            file = File.get(message.content)
-            if file:
-                result.append({
-                    "id": message.id,
-                    "file_name": file.file_name,
-                    "file_link": url_for('files', id=file.id),
-                    "content_type": message.content_type,
-                    "timestamp": message.time_stamp,
-                    "sent": user.id == message.sender_id
-                })
+    for message in messages:
+        file = None
+        if message.content_type == ContentType.FILE:
+            file = file_loader.get(message.content)
+            if not file:
+                continue
+
+        data = message_json(message, file)
+        data["sent"] = user.id == message.sender_id
+        result.append(data)
 
     return jsonify(result)
 
@@ -98,74 +150,183 @@ def upload_file():
 
     file = request.files['file']
     if file and file.filename:
-        file_id = file_mgr.save(file)
+        file_id = file_mgr.save(file, owner_id=current_user.id)
         return json.dumps({'status': 'success', 'file_id': file_id})
 
     return json.dumps({'status': 'failure'})
 
 
+def socket_user_id() -> Optional[int]:
+    """Gets id of user authenticated on the socket handling current event"""
+
+    return socket_sessions.get_user_id(request.sid)
+
+
+def authenticate_socket(token: Optional[str] = None) -> Optional[User]:
+    """Authenticates socket handling current event and binds user to it
+
+    The login session cookie sent with the handshake is used when present,
+    the authentication token otherwise.
+
+    Args:
+        token (str): authentication token
+
+    Returns:
+        User: authenticated user, None if authentication failed
+    """
+
+    user = current_user if current_user.is_authenticated else load_user(token)
+
+    if user:
+        first = socket_sessions.bind(request.sid, user.id)
+        presence.connected(user.id, first, current_app._get_current_object())
+    return user
+
+
+@on_revoke
+def disconnect_user(user_id: int) -> None:
+    """Disconnects sockets of user whose authentication was revoked"""
+
+    sids = socket_sessions.unbind_user(user_id)
+    for sid in sids:
+        socketio.server.disconnect(sid, namespace='/')
+    if sids:
+        presence.disconnected(user_id, True, current_app._get_current_object())
+
+
+@socketio.on('connect')
+def handle_connect(auth=None):
+    token = auth.get('authentication_token') if isinstance(auth, dict) else None
+    authenticate_socket(token)
+
+
+@socketio.on('disconnect')
+def handle_disconnect(*args):
+    user_id, last = socket_sessions.unbind(request.sid)
+
+    if user_id is not None:
+        presence.disconnected(user_id, last, current_app._get_current_object())
+
+
 @socketio.on('join')
 def handle_join(data):
-    token = data.get('authentication_token', '')
-    user: User = load_user(token)
+    user_id = socket_user_id()
+
+    if user_id:
+        user = User.get(user_id)
+    else:
+        user = authenticate_socket(data.get('authentication_token', ''))
 
     if user:
-        chat_ids = [chat.id for chat in user.chats]
+        for chat in user.chats:
+            join_room(chat.id)
+        join_room(SocketSessionManager.user_room(user.id))
+
+
+@socketio.on('who_is_online')
+def handle_who_is_online(data):
+    if not socket_user_id():
+        return []
+
+    user_ids = []
+    for user_id in data.get('user_ids', [])[:MAX_PRESENCE_QUERY]:
+        try:
+            user_ids.append(int(user_id))
+        except (TypeError, ValueError):
+            continue
+
+    return sorted(presence.online(user_ids))
+
+
+def notify_files_processed(files: list[File]) -> None:
+    """Pushes result of post processing of files to the users who uploaded them
+
+    Args:
+        files (list): processed files
+    """
+
+    for file in files:
+        data = {"file_id": file.id, "status": file.status,
+                "mime_type": file.mime_type, "size": file.size}
 
-        for chat_id in chat_ids:
-            join_room(chat_id)
-        join_room(user.id)
+        for scope_type, scope_id in FileAccess.get_scopes(file.id):
+            if scope_type == FileAccessScope.USER:
+                socketio.emit('file_processed', data,
+                              to=SocketSessionManager.user_room(scope_id))
 
-        socketio.emit('online_announcement',
-                      {
-                          'user_id': user.id
-                      },
-                      rooms=chat_ids)
+
+file_processor.listeners.append(notify_files_processed)
+
+
+def get_member_chat(user_id: int, chat_id) -> Optional[Chat]:
+    """Gets chat if user takes part in it
+
+    Args:
+        user_id (int): user id
+        chat_id (int): chat id
+
+    Returns:
+        Chat: chat object if chat is found and user is in it, None otherwise
+    """
+
+    try:
+        chat = Chat.get(int(chat_id))
+    except (TypeError, ValueError):
+        return None
+
+    if chat and user_id in (chat.user_1, chat.user_2):
+        return chat
 
 
 @socketio.on('send_message')
 def handle_message(data):
-    token = data.get('authentication_token', '')
-    user = load_user(token)
+    user_id = socket_user_id()
 
-    if not user:
+    if not user_id:
         return
 
     message = data["message"]
-    chat_id = data['chat_id']
-
-    chat = Chat.get(int(chat_id))
-    chat_mgr = ChatManager(user.id)
+    chat = get_member_chat(user_id, data['chat_id'])
 
     if not chat:
         return
 
-    chat_mgr.send_message(chat_id, message)
-    socketio.emit('receive_message', rooms=chat_id)
+    chat_mgr = ChatManager(user_id)
+    msg = chat_mgr.send_message(chat.id, message)
+    socketio.emit('receive_message', message_json(msg), to=chat.id)
 
 
 @socketio.on('send_file')
 def handle_file(data):
-    token = data.get('authentication_token', '')
-    user = load_user(token)
+    user_id = socket_user_id()
 
-    if not user:
+    if not user_id:
         return
 
-    file_id = data["file_id"]
-    chat_id = data['chat_id']
+    chat = get_member_chat(user_id, data['chat_id'])
+    file = File.get(data["file_id"])
 
-    chat = Chat.get(int(chat_id))
-    chat_mgr = ChatManager(user.id)
+    # only files the sender may read can be shared
+    if not (chat and file and access_control.can_access_file(user_id, file.id)):
+        return
 
-    file = File.get(file_id)
+    chat_mgr = ChatManager(user_id)
+    msg = chat_mgr.send_message(chat.id, file.id,
+                                content_type=ContentType.FILE)
+    socketio.emit('receive_message', message_json(msg, file), to=chat.id)
 
-    if not (chat and file):
+
+@socketio.on('mark_read')
+def handle_mark_read(data):
+    user_id = socket_user_id()
+
+    if not user_id:
         return
 
-    chat_mgr.send_message(chat_id, file.id,
-                          content_type=ContentType.FILE)
-    socketio.emit('receive_message', rooms=chat_id)
+    chat = get_member_chat(user_id, data.get('chat_id'))
+
+    if chat and chat.mark_read(user_id):
+        db.session.commit()
 
 
 @socketio.on('event')
@@ -7,7 +7,9 @@ JOIN = "join";
 SEND_MESSAGE = "send_message";
 SEND_FILE = "send_file";
 RECEIVE_MESSAGE = "receive_message";
-ONLINE_ANN = "online_announcement";
+MARK_READ = "mark_read";
+PRESENCE = "presence";
+WHO_IS_ONLINE = "who_is_online";
 
 const chat_history = document.getElementById("chat-history");
 const text_field = document.getElementById("text-input");
@@ -15,9 +17,14 @@ const send_btn = document.getElementById("send-message-btn");
 const chat_detail = document.getElementById("chat-detail");
 const user_token = document.getElementById("user_token").value;
 const current_user_id = document.getElementById("current_user_id").value;
+const HISTORY_PAGE_SIZE = 50;
 let current_chat = null;
+let oldest_message_id = null;
+let newest_message_id = null;
+let newest_sequence = null;
+let has_older_messages = false;
 
-const loadChatHistory = async (chat_id, token) => {
+const loadChatHistory = async (chat_id, token, cursor = {}) => {
   const response = await fetch(`${BASE_URL}/messages`, {
     method: "POST",
     headers: {
@@ -26,6 +33,8 @@ const loadChatHistory = async (chat_id, token) => {
     body: JSON.stringify({
       authentication_token: token,
       chat_id: chat_id,
+      limit: HISTORY_PAGE_SIZE,
+      ...cursor,
     }),
   });
   const data = await response.json();
@@ -33,43 +42,156 @@ const loadChatHistory = async (chat_id, token) => {
 };
 
 const getJobs = async (user_id) => {
-  const response = await fetch(`${BASE_URL}/job/user/${user_id}`);
-  const jobs = await response.json();
+  const jobs = [];
+  let cursor = "";
+
+  do {
+    const response = await fetch(
+      `${BASE_URL}/job/user/${user_id}?limit=100&cursor=${cursor}`
+    );
+    const page = await response.json();
+    jobs.push(...page.jobs);
+    cursor = page.next_cursor;
+  } while (cursor);
+
   return jobs;
 };
 
-const updateChatHistoryUI = (data) => {
-  chat_history.innerHTML = "";
-
-  data.forEach((message) => {
-    if (message.content_type === "TEXT") {
-      chat_history.innerHTML += textMessageComponent(
-        message.content,
-        new Date(message.timestamp).toLocaleTimeString(navigator.language, {
-          hour: "2-digit",
-          minute: "2-digit",
-        }),
-        message.sent ? "sent" : ""
-      );
-    } else if (message.content_type === "FILE") {
-      chat_history.innerHTML += fileMessageComponent(
-        message.file_name,
-        message.file_link,
-        new Date(message.timestamp).toLocaleTimeString(navigator.language, {
-          hour: "2-digit",
-          minute: "2-digit",
-        }),
-        message.sent ? "sent" : ""
-      );
+const messageComponent = (message) => {
+  const time = new Date(message.timestamp).toLocaleTimeString(
+    navigator.language,
+    {
+      hour: "2-digit",
+      minute: "2-digit",
+    }
+  );
+
+  if (message.content_type === "TEXT") {
+    return textMessageComponent(
+      message.content,
+      time,
+      message.sent ? "sent" : ""
+    );
+  } else if (message.content_type === "FILE") {
+    return fileMessageComponent(
+      message.file_name,
+      message.file_link,
+      message.preview_link,
+      time,
+      message.sent ? "sent" : ""
+    );
+  }
+  return "";
+};
+
+const updateChatHistoryUI = (data, position = "replace") => {
+  if (data.length === 0 && position !== "replace") return;
+
+  const html = data.map(messageComponent).join("");
+
+  if (position === "prepend") {
+    const height = chat_history.scrollHeight;
+    chat_history.innerHTML = html + chat_history.innerHTML;
+    chat_history.scrollTop = chat_history.scrollHeight - height;
+  } else if (position === "append") {
+    chat_history.innerHTML += html;
+  } else {
+    chat_history.innerHTML = html;
+  }
+
+  if (data.length > 0) {
+    if (position !== "append" || oldest_message_id === null)
+      oldest_message_id = data[0].id;
+    if (position !== "prepend" || newest_message_id === null) {
+      newest_message_id = data[data.length - 1].id;
+      newest_sequence = data[data.length - 1].sequence;
     }
+  }
+};
+
+const updateChatPreview = (message) => {
+  const chatItem = document.querySelector(
+    `.chat-item[data-chat_id="${message.chat_id}"]`
+  );
+  if (!chatItem) return;
+
+  const preview = document.createElement("div");
+  preview.innerHTML = message.content ?? message.file_name;
+  chatItem.querySelector(".text").innerText = preview.innerText;
+
+  const unread = chatItem.querySelector(".unread");
+  if (message.chat_id !== current_chat) {
+    unread.innerText = parseInt(unread.innerText || 0) + 1;
+    unread.classList.toggle("hidden", false);
+  }
+
+  chatItem.parentElement.prepend(chatItem);
+};
+
+const receiveMessage = (message) => {
+  updateChatPreview(message);
+
+  if (message.chat_id !== current_chat) return;
+
+  if (
+    newest_sequence === null ||
+    message.sequence === null ||
+    message.sequence > newest_sequence + 1
+  ) {
+    // history is not loaded yet or messages were missed, fetch the gap
+    loadNewMessages();
+    return;
+  }
+
+  if (message.sequence <= newest_sequence) return;
+
+  message.sent = message.sender_id === parseInt(current_user_id);
+  updateChatHistoryUI([message], "append");
+
+  if (!message.sent) {
+    socket.emit(MARK_READ, {
+      chat_id: message.chat_id,
+    });
+  }
+};
+
+const loadNewMessages = async () => {
+  if (current_chat === null) return;
+
+  const chat_id = current_chat;
+  const cursor = newest_message_id === null ? {} : { after: newest_message_id };
+  const data = await loadChatHistory(chat_id, user_token, cursor);
+
+  if (chat_id === current_chat) updateChatHistoryUI(data, "append");
+};
+
+const loadOlderMessages = async () => {
+  if (current_chat === null || !has_older_messages) return;
+
+  has_older_messages = false;
+  const chat_id = current_chat;
+  const data = await loadChatHistory(chat_id, user_token, {
+    before: oldest_message_id,
   });
+
+  if (chat_id !== current_chat) return;
+  has_older_messages = data.length === HISTORY_PAGE_SIZE;
+  updateChatHistoryUI(data, "prepend");
 };
 
 const openChat = async (target) => {
   current_chat = parseInt(target.dataset.chat_id);
-  loadChatHistory(current_chat, user_token).then((data) =>
-    updateChatHistoryUI(data)
-  );
+  oldest_message_id = null;
+  newest_message_id = null;
+  newest_sequence = null;
+  has_older_messages = false;
+
+  const chat_id = current_chat;
+  loadChatHistory(chat_id, user_token).then((data) => {
+    if (chat_id !== current_chat) return;
+    has_older_messages = data.length === HISTORY_PAGE_SIZE;
+    updateChatHistoryUI(data);
+  });
 
   document
     .querySelectorAll(".chat-item")
@@ -77,6 +199,10 @@ const openChat = async (target) => {
 
   target.classList.toggle("active", true);
 
+  const unread = target.querySelector(".unread");
+  unread.innerText = 0;
+  unread.classList.toggle("hidden", true);
+
   const userdata = target.querySelector("#userdata").dataset;
   const user_id = userdata.user_id;
   const user_type = userdata.user_type;
@@ -97,15 +223,41 @@ const socket = io.connect(BASE_URL);
 
 socket.on(CONNECT, () => {
   console.log("Connected to server sending join message");
-  socket.emit(JOIN, {
-    authentication_token: user_token,
-  });
+  socket.emit(
+    JOIN,
+    {
+      authentication_token: user_token,
+    },
+    loadPresence
+  );
 });
 
-socket.on(RECEIVE_MESSAGE, () => {
-  loadChatHistory(current_chat, user_token).then((data) =>
-    updateChatHistoryUI(data)
+const setPresence = (user_ids, online) => {
+  user_ids.forEach((user_id) => {
+    document
+      .querySelectorAll(`.chat-item[data-user_id="${user_id}"] .avatar i`)
+      .forEach((icon) => icon.classList.toggle("offline", !online));
+  });
+};
+
+const loadPresence = () => {
+  const user_ids = [...document.querySelectorAll(".chat-item[data-user_id]")].map(
+    (chatItem) => chatItem.dataset.user_id
   );
+
+  socket.emit(WHO_IS_ONLINE, { user_ids: user_ids }, (online) => {
+    setPresence(user_ids, false);
+    setPresence(online, true);
+  });
+};
+
+socket.on(PRESENCE, (changes) => {
+  setPresence(changes.online, true);
+  setPresence(changes.offline, false);
+});
+
+socket.on(RECEIVE_MESSAGE, (message) => {
+  receiveMessage(message);
 });
 
 const sendMessage = () => {
@@ -114,7 +266,6 @@ const sendMessage = () => {
   if (message.length == 0 || current_chat === null) return;
 
   socket.emit(SEND_MESSAGE, {
-    authentication_token: user_token,
     message: message,
     chat_id: current_chat,
   });
@@ -129,7 +280,6 @@ const sendFile = () => {
 
       if (response.status === "success") {
         socket.emit(SEND_FILE, {
-          authentication_token: user_token,
           file_id: response.file_id,
           chat_id: current_chat,
         });
@@ -139,6 +289,10 @@ const sendFile = () => {
 };
 
 // UI Event listening
+chat_history.addEventListener("scroll", () => {
+  if (chat_history.scrollTop === 0) loadOlderMessages();
+});
+
 send_btn.addEventListener("click", () => {
   sendMessage();
   sendFile();
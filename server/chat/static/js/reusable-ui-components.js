@@ -16,8 +16,9 @@ const textMessageComponent = (content, time, sent = "") => `
     <div class="time">${time}</div>
 </div>`;
 
-const fileMessageComponent = (fileName, fileLink, time, sent = "") => `
+const fileMessageComponent = (fileName, fileLink, previewLink, time, sent = "") => `
 <div class="${"file-message " + sent}">
+    ${previewLink ? `<a href=${fileLink}><img class="preview" src=${previewLink} alt="" loading="lazy" /></a>` : ""}
     <a class="content" href=${fileLink}>${fileName}</a>
     <div class="time">${time}</div>
 </div>`;
@@ -0,0 +1,145 @@
+import logging
+import threading
+import time
+from datetime import datetime
+from typing import Optional
+
+from flask import Flask
+
+from ledger import Ledger
+from model import Contract, ContractStatus, db
+
+logger = logging.getLogger(__name__)
+
+
+class EscrowSweeper:
+    """
+    Cancels contracts that are still open after their deadline and refunds
+    their escrow to the job owner
+
+    Expired contracts are found through the (status, deadline) index and
+    handled in batches, each batch is refunded and committed in its own
+    short transaction so row locks are never held for long. Contracts locked
+    by a request or by a sweeper in another worker are skipped and picked up
+    by a later run.
+
+    Parameters:
+        interval (float): seconds between runs (default is 300)
+        batch_size (int): maximum number of contracts per transaction (default is 200)
+        pause (float): seconds to wait between batches of a run (default is 0.05)
+    """
+
+    def __init__(self, interval: float = 300, batch_size: int = 200, pause: float = 0.05):
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+
+        self.metrics = {
+            'runs': 0,
+            'batches': 0,
+            'contracts_expired': 0,
+            'refunded_minor': 0,
+            'errors': 0,
+            'last_run_seconds': 0.0,
+            'last_run_at': None
+        }
+
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def start(self, app: Flask) -> None:
+        """
+        Starts sweeping in a background thread, later calls have no effect
+
+        Args:
+            app (Flask): application the sweeper runs in
+        """
+
+        with self._lock:
+            if self._worker is None and self.interval > 0:
+                self._worker = threading.Thread(target=self._run, args=(app,),
+                                                name='escrow-sweeper', daemon=True)
+                self._worker.start()
+
+    def _run(self, app: Flask) -> None:
+        while True:
+            time.sleep(self.interval)
+
+            try:
+                with app.app_context():
+                    self.sweep()
+            except Exception:
+                self.metrics['errors'] += 1
+                logger.exception('Failed to sweep expired escrows')
+
+    def sweep(self, now: Optional[datetime] = None) -> int:
+        """
+        Cancels and refunds every contract expired at the start of the run
+
+        Args:
+            now (datetime): deadlines earlier than this are expired
+                (default is current time)
+
+        Returns:
+            int: number of contracts cancelled
+        """
+
+        now = now or datetime.now()
+        started = time.monotonic()
+        total = 0
+
+        while True:
+            expired = self.sweep_batch(now)
+            total += expired
+
+            if expired < self.batch_size:
+                break
+            time.sleep(self.pause)
+
+        self.metrics['runs'] += 1
+        self.metrics['last_run_seconds'] = time.monotonic() - started
+        self.metrics['last_run_at'] = now
+
+        if total:
+            logger.info('Refunded escrow of %d expired contracts in %.2fs',
+                        total, self.metrics['last_run_seconds'])
+
+        return total
+
+    def sweep_batch(self, now: datetime) -> int:
+        """
+        Cancels and refunds one batch of expired contracts and commits it
+
+        Args:
+            now (datetime): deadlines earlier than this are expired
+
+        Returns:
+            int: number of contracts cancelled
+        """
+
+        try:
+            expired = Contract.get_expired(now, self.batch_size)
+            if not expired:
+                db.session.commit()
+                return 0
+
+            db.session.execute(
+                db.update(Contract)
+                .where(Contract.id.in_([contract_id for contract_id, _, _ in expired]))
+                .values(status=ContractStatus.CANCELLED)
+                .execution_options(synchronize_session=False)
+            )
+
+            refunded = sum(Ledger.refund_escrow(escrow_id, owner_id)
+                           for _, escrow_id, owner_id in expired)
+
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        self.metrics['batches'] += 1
+        self.metrics['contracts_expired'] += len(expired)
+        self.metrics['refunded_minor'] += refunded
+
+        return len(expired)
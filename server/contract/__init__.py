@@ -1 +1,2 @@
-from .contract import contract_bp
\ No newline at end of file
+from .contract import contract_bp
+from .EscrowSweeper import EscrowSweeper
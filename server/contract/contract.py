@@ -1,10 +1,11 @@
 import os
-from uuid import uuid4
 from flask import Blueprint, render_template, request, jsonify, make_response, redirect, url_for
 from flask_login import login_required, current_user
 from sqlalchemy.exc import IntegrityError
 from datetime import datetime
-from model import User, Job, ContractStatus, Contract, Escrow, UserType, Work, Attachment, db
+from model import User, Job, ContractStatus, Contract, Currency, Escrow, UserType, Work, Attachment, FileAccess, FileAccessScope, db, new_id
+from ledger import Ledger
+from payment_gateway import InsufficientBalance
 from utils import FileManager
 
 
@@ -23,9 +24,11 @@ def create_contract():
     deadline = datetime.strptime(request.form.get("deadline"), "%Y-%m-%d")
 
     try:
-        if current_user.balance < float(budget):
-            return render_template("contract.html", message="Insufficient balance to set up escrow.", status=400)
-    except:
+        amount = Currency.to_minor(budget)
+    except (TypeError, ValueError):
+        amount = 0
+
+    if amount <= 0:
         return render_template("contract.html", message="Insufficient balance to set up escrow.", status=400)
 
     job = Job.get(job_id)
@@ -35,21 +38,27 @@ def create_contract():
         return redirect(url_for('login'))
 
     if job and worker and not Contract.already_exists(job_id, worker_id):
-        contract_id = uuid4()
+        contract_id = new_id()
 
         new_contract = Contract(id=contract_id,
                                 job_id=job_id, worker_id=worker_id, deadline=deadline)
 
-        new_escrow = Escrow(id=uuid4(),
-                            contract_id=contract_id, amount=float(budget))
+        new_escrow = Escrow(id=new_id(),
+                            contract_id=contract_id, amount_minor=amount)
 
         try:
             db.session.add(new_contract)
             db.session.add(new_escrow)
-            current_user.balance -= float(budget)
+            db.session.flush()
+            Ledger.fund_escrow(current_user.id, new_escrow.id, amount)
             db.session.commit()
 
+        except InsufficientBalance:
+            db.session.rollback()
+            return render_template("contract.html", message="Insufficient balance to set up escrow.", status=400)
+
         except IntegrityError:
+            db.session.rollback()
             return render_template("contract.html", message="Contract already exists.", status=400)
 
         return render_template("contract.html", status=200, worker=worker)
@@ -60,9 +69,10 @@ def create_contract():
 @contract_bp.route("/<contract_id>/<response>")
 @login_required
 def accept_or_reject_contract(contract_id, response):
-    contract = Contract.get(contract_id)
+    contract = Contract.get_for_update(contract_id)
 
-    if contract.status != None:
+    if not contract or contract.status != None:
+        db.session.rollback()
         return "Unauthorized"
 
     if contract.worker_id == current_user.id:
@@ -71,9 +81,7 @@ def accept_or_reject_contract(contract_id, response):
             contract.escrow[0].date_of_initiation = datetime.now()
         elif response == "reject":
             contract.status = ContractStatus.REJECTED
-            escrow = contract.escrow[0]
-            employer = User.get(contract.job.owner_id)
-            employer.balance += escrow.amount
+            Ledger.refund_escrow(contract.escrow[0].id, contract.job.owner_id)
             # db.session.delete(contract)
         db.session.commit()
 
@@ -85,10 +93,11 @@ def accept_or_reject_contract(contract_id, response):
 @contract_bp.route("/")
 @login_required
 def contracts():
+    contracts = current_user.get_grouped_contracts()
     if current_user.user_type == UserType.EMPLOYER:
-        return render_template("contract_employer.html")
+        return render_template("contract_employer.html", contracts=contracts)
 
-    return render_template("contract_freelancer.html")
+    return render_template("contract_freelancer.html", contracts=contracts)
 
 
 @contract_bp.route("/<contract_id>", methods=["POST"])
@@ -99,22 +108,25 @@ def submit_work(contract_id):
     if not contract or contract.worker_id != current_user.id:
         return redirect(url_for("contract_bp.contracts"))
 
-    files = request.files.getlist("files")
+    files = [file for file in request.files.getlist("files") if file.filename]
 
     attachment_id = None
-    if files and files[0].filename:
-        attachment_id = uuid4()
-
-        for file in files:
-            file_id = file_mgr.save(file)
-            attachment = Attachment(id=attachment_id)
-            attachment.file_id = file_id
-            db.session.add(attachment)
-
-    submission = Work(id=uuid4(), contract_id=contract_id,
+    if files:
+        attachment_id = new_id()
+
+        file_ids = file_mgr.save_many(files, owner_id=current_user.id)
+        db.session.add_all([Attachment(id=attachment_id, file_id=file_id)
+                            for file_id in file_ids])
+        # files are new, no access was granted before
+        db.session.add_all([FileAccess(file_id=file_id, scope_type=FileAccessScope.CONTRACT,
+                                       scope_id=str(contract.id))
+                            for file_id in file_ids])
+
+    submission = Work(id=new_id(), contract_id=contract_id,
                       attachment_id=attachment_id)
     db.session.add(submission)
     db.session.commit()
+    file_mgr.process_saved()
 
     return redirect(url_for("contract_bp.contracts"))
 
@@ -122,17 +134,17 @@ def submit_work(contract_id):
 @contract_bp.route("/complete/<contract_id>", methods=["POST"])
 @login_required
 def close_contract(contract_id):
-    contract = Contract.get(contract_id)
+    # lock the contract so the sweeper or a refund can not settle it meanwhile
+    contract = Contract.get_for_update(contract_id)
 
-    if not contract or contract.job.owner_id != current_user.id:
+    if not contract or contract.job.owner_id != current_user.id or \
+            contract.status not in (ContractStatus.ACCEPTED, ContractStatus.PENDING_CANCEL):
+        db.session.rollback()
         return redirect(url_for("contract_bp.contracts"))
 
     contract.status = ContractStatus.FINISED
 
-    escrow = contract.escrow[0]
-
-    worker = User.get(contract.worker_id)
-    worker.balance += escrow.amount
+    Ledger.release_escrow(contract.escrow[0].id, contract.worker_id)
 
     db.session.commit()
 
@@ -142,9 +154,11 @@ def close_contract(contract_id):
 @contract_bp.route("/cancel/<contract_id>")
 @login_required
 def request_refund(contract_id):
-    contract = Contract.get(contract_id)
+    contract = Contract.get_for_update(contract_id)
 
-    if not contract or contract.job.owner_id != current_user.id:
+    if not contract or contract.job.owner_id != current_user.id or \
+            contract.status != ContractStatus.ACCEPTED:
+        db.session.rollback()
         return redirect(url_for("contract_bp.contracts"))
 
     contract.status = ContractStatus.PENDING_CANCEL
@@ -157,18 +171,16 @@ def request_refund(contract_id):
 @contract_bp.route("/refund/<contract_id>/<response>")
 @login_required
 def accept_or_reject_refund(contract_id, response):
-    contract = Contract.get(contract_id)
-    print(contract, "<<<<<<<")
-    if contract.status != ContractStatus.PENDING_CANCEL:
+    contract = Contract.get_for_update(contract_id)
+
+    if not contract or contract.status != ContractStatus.PENDING_CANCEL:
+        db.session.rollback()
         return "Unauthorized"
 
     if contract.worker_id == current_user.id:
         if response == "accept":
             contract.status = ContractStatus.CANCELLED
-            escrow = contract.escrow[0]
-            employer = User.get(contract.job.owner_id)
-            employer.balance += escrow.amount
-            escrow.amount = 0
+            Ledger.refund_escrow(contract.escrow[0].id, contract.job.owner_id)
         elif response == "reject":
             contract.status = ContractStatus.ACCEPTED
 
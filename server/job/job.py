@@ -1,12 +1,15 @@
 import os
 import json
-from flask import Blueprint, render_template, request, jsonify, make_response, redirect, url_for, flash
+import base64
+from datetime import datetime
+from flask import Blueprint, render_template, request, jsonify, make_response, redirect, url_for, flash, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import login_required, current_user
 from utils import FileManager
-from uuid import uuid4
+from typing import Optional
 
-from model import User, UserType, Job, Attachment, File, db
+from model import User, UserType, Job, Attachment, File, db, new_id
+from search import tokenize
 
 
 job_bp = Blueprint('job_bp', __name__,
@@ -14,6 +17,101 @@ job_bp = Blueprint('job_bp', __name__,
 
 file_mgr = FileManager(os.getenv('UPLOAD_FOLDER'))
 
+PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+
+
+def to_float(value) -> Optional[float]:
+    """Converts request value to float, returns None if it is missing or invalid"""
+
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def to_int(value, default: int) -> int:
+    """Converts request value to int, returns default if it is missing or invalid"""
+
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+
+def encode_cursor(data: dict) -> str:
+    """Encodes pagination state into an opaque url safe cursor"""
+
+    return base64.urlsafe_b64encode(json.dumps(data).encode()).decode()
+
+
+def decode_cursor(cursor: Optional[str]) -> dict:
+    """Decodes cursor generated by encode_cursor, returns empty dict if cursor is missing or invalid"""
+
+    if not cursor:
+        return {}
+
+    try:
+        data = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return data if isinstance(data, dict) else {}
+    except (ValueError, TypeError):
+        return {}
+
+
+def keyset_position(cursor: dict) -> Optional[tuple]:
+    """Gets (post_time, id) position stored in a decoded cursor"""
+
+    try:
+        return datetime.fromisoformat(cursor["post_time"]), cursor["id"]
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def keyset_cursor(rows: list, limit: int) -> Optional[str]:
+    """Creates cursor pointing after the last row if there is a next page"""
+
+    if len(rows) <= limit:
+        return None
+
+    last = rows[limit - 1]
+    return encode_cursor({"post_time": last.post_time.isoformat(), "id": last.id})
+
+
+def job_json(row) -> dict:
+    """Serializes job listing row"""
+
+    return {"id": row.id,
+            "title": row.title,
+            "description": row.description,
+            "experience_level": row.experience_level,
+            "owner_id": row.owner_id,
+            "budget": row.budget
+            }
+
+
+def stream_jobs(rows: list, **meta) -> Response:
+    """Streams JSON object holding meta fields and serialized rows under `jobs`
+
+    Rows are encoded one at a time so a page never has to be materialized as
+    a single JSON string.
+    """
+
+    def generate():
+        yield json.dumps(meta)[:-1]
+        yield (', ' if meta else '') + '"jobs": ['
+        for index, row in enumerate(rows):
+            yield (', ' if index else '') + json.dumps(job_json(row))
+        yield ']}'
+
+    return Response(stream_with_context(generate()), status=200,
+                    mimetype="application/json")
+
+
+def page_size(value) -> int:
+    """Clamps requested page size to [1, MAX_PAGE_SIZE]"""
+
+    return min(max(to_int(value, PAGE_SIZE), 1), MAX_PAGE_SIZE)
+
 
 @job_bp.route('/')
 @login_required
@@ -42,7 +140,7 @@ def search():
 @job_bp.route('/', methods=['POST'])
 @login_required
 def post():
-    id = uuid4()
+    id = new_id()
     title = request.form.get("title")
     description = request.form.get("description")
     experience_level = request.form.get("experience-level")
@@ -62,45 +160,46 @@ def post():
 
 @job_bp.route('/user/<user_id>', methods=['GET'])
 def see_posted_jobs(user_id):
-    jobs = User.get(user_id).get_posted_jobs()
-    jsonList = []
-
-    for job in jobs:
-        jsonList.append({"id": job.id,
-                         "title": job.title,
-                         "description": job.description,
-                         "experience_level": job.experience_level,
-                         "owner_id": job.owner_id,
-                         "budget": job.budget
-                         })
-    response = make_response(
-        jsonify(jsonList),
-        200
-    )
-    response.headers["Content-Type"] = "application/json"
-    return response
+    limit = page_size(request.args.get("limit"))
+    after = keyset_position(decode_cursor(request.args.get("cursor")))
+
+    rows = Job.list_jobs(owner_id=user_id, after=after, limit=limit + 1)
+
+    return stream_jobs(rows[:limit], next_cursor=keyset_cursor(rows, limit))
 
 
 @job_bp.route('/filterJob', methods=['POST'])
 def filter():
     key = request.json.get("key")
     level = request.json.get("level")
-    jobs = Job.filter_job(key, level)
-    jsonList = []
-    for job in jobs:
-        jsonList.append({"id": job.id,
-                         "title": job.title,
-                         "description": job.description,
-                         "experience_level": job.experience_level,
-                         "owner_id": job.owner_id,
-                         "budget": job.budget
-                         })
-    response = make_response(
-        jsonify(jsonList),
-        200
-    )
-    response.headers["Content-Type"] = "application/json"
-    return response
+    min_budget = to_float(request.json.get("min_budget"))
+    max_budget = to_float(request.json.get("max_budget"))
+    limit = page_size(request.json.get("limit"))
+    cursor = decode_cursor(request.json.get("cursor"))
+
+    if tokenize(key):
+        # ranked results have no stable keyset, page through them by rank
+        offset = max(to_int(cursor.get("offset"), 0), 0)
+        total, rows = Job.filter_job(key, level, min_budget, max_budget,
+                                     offset=offset, limit=limit)
+
+        next_cursor = None
+        if offset + limit < total:
+            next_cursor = encode_cursor({"offset": offset + limit})
+
+        return stream_jobs(rows, total=total, next_cursor=next_cursor)
+
+    after = keyset_position(cursor)
+    rows = Job.list_jobs(level=level, min_budget=min_budget,
+                         max_budget=max_budget, after=after, limit=limit + 1)
+
+    meta = {}
+    if not after:
+        meta["total"] = Job.count_jobs(level=level, min_budget=min_budget,
+                                       max_budget=max_budget)
+    meta["next_cursor"] = keyset_cursor(rows, limit)
+
+    return stream_jobs(rows[:limit], **meta)
 
 
 @job_bp.route('/delete', methods=['POST'])
@@ -126,7 +225,7 @@ def upload_file():
 
     file = request.files['file']
     if file and file.filename:
-        file_id = file_mgr.save(file)
+        file_id = file_mgr.save(file, owner_id=current_user.id)
         return json.dumps({'status': 'success', 'file_id': file_id})
 
     return json.dumps({'status': 'failure'})
@@ -0,0 +1,159 @@
+from typing import Optional
+
+from model import Escrow, LedgerAccountType, LedgerEntry, LedgerEntryKind, User, db, new_id
+from payment_gateway import InsufficientBalance
+
+
+class Ledger:
+    """
+    Moves money between users, escrows and the payment provider
+
+    Every movement appends balanced entries to the ledger and updates the
+    materialized balances with a single UPDATE ... SET balance = balance + delta,
+    so concurrent movements cannot overwrite each other. Amounts are integer
+    santim. Methods take part in the caller's transaction and do not commit.
+    """
+
+    PROVIDER_ID = 'chapa'
+
+    @staticmethod
+    def deposit(user_id: int, amount: int, reference: str) -> str:
+        """Credits money received through the payment provider to user
+
+        Args:
+            user_id (int): id of user receiving the money
+            amount (int): amount in santim
+            reference (str): transaction reference of the payment
+
+        Returns:
+            str: transfer id
+        """
+
+        Ledger.__check_amount(amount)
+        Ledger.__add_to_user(user_id, amount)
+
+        return Ledger.__record(LedgerEntryKind.DEPOSIT, reference, amount,
+                               (LedgerAccountType.PROVIDER, Ledger.PROVIDER_ID),
+                               (LedgerAccountType.USER, user_id))
+
+    @staticmethod
+    def fund_escrow(user_id: int, escrow_id: str, amount: int) -> str:
+        """Moves money from user's balance to escrow
+
+        Args:
+            user_id (int): id of user funding the escrow
+            escrow_id (str): escrow id
+            amount (int): amount in santim
+
+        Raises:
+            InsufficientBalance: if user's balance is less than amount
+
+        Returns:
+            str: transfer id
+        """
+
+        Ledger.__check_amount(amount)
+
+        withdrawn = db.session.execute(
+            db.update(User)
+            .where(User.id == user_id, User.balance_minor >= amount)
+            .values(balance_minor=User.balance_minor - amount)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+        if not withdrawn:
+            raise InsufficientBalance()
+
+        db.session.execute(
+            db.update(Escrow)
+            .where(Escrow.id == str(escrow_id))
+            .values(balance_minor=Escrow.balance_minor + amount)
+            .execution_options(synchronize_session=False)
+        )
+
+        return Ledger.__record(LedgerEntryKind.ESCROW_FUND, escrow_id, amount,
+                               (LedgerAccountType.USER, user_id),
+                               (LedgerAccountType.ESCROW, escrow_id))
+
+    @staticmethod
+    def release_escrow(escrow_id: str, user_id: int) -> int:
+        """Pays everything held in escrow out to the worker
+
+        Args:
+            escrow_id (str): escrow id
+            user_id (int): id of worker
+
+        Returns:
+            int: amount moved in santim, 0 if escrow was already emptied
+        """
+
+        return Ledger.__empty_escrow(escrow_id, user_id, LedgerEntryKind.ESCROW_RELEASE)
+
+    @staticmethod
+    def refund_escrow(escrow_id: str, user_id: int) -> int:
+        """Returns everything held in escrow to the job owner
+
+        Args:
+            escrow_id (str): escrow id
+            user_id (int): id of job owner
+
+        Returns:
+            int: amount moved in santim, 0 if escrow was already emptied
+        """
+
+        return Ledger.__empty_escrow(escrow_id, user_id, LedgerEntryKind.ESCROW_REFUND)
+
+    @staticmethod
+    def __empty_escrow(escrow_id: str, user_id: int, kind: str) -> int:
+        # row lock serializes concurrent releases and refunds of the escrow
+        held = db.session.execute(
+            db.select(Escrow.balance_minor)
+            .where(Escrow.id == str(escrow_id))
+            .with_for_update()
+        ).scalar()
+
+        if not held:
+            return 0
+
+        db.session.execute(
+            db.update(Escrow)
+            .where(Escrow.id == str(escrow_id))
+            .values(balance_minor=Escrow.balance_minor - held)
+            .execution_options(synchronize_session=False)
+        )
+        Ledger.__add_to_user(user_id, held)
+
+        Ledger.__record(kind, escrow_id, held,
+                        (LedgerAccountType.ESCROW, escrow_id),
+                        (LedgerAccountType.USER, user_id))
+        return held
+
+    @staticmethod
+    def __add_to_user(user_id: int, amount: int) -> None:
+        db.session.execute(
+            db.update(User)
+            .where(User.id == user_id)
+            .values(balance_minor=User.balance_minor + amount)
+            .execution_options(synchronize_session=False)
+        )
+
+    @staticmethod
+    def __record(kind: str, reference: Optional[str], amount: int,
+                 source: tuple[str, object], destination: tuple[str, object]) -> str:
+        transfer_id = new_id()
+
+        db.session.add_all([
+            LedgerEntry(transfer_id=transfer_id, account_type=source[0],
+                        account_id=str(source[1]), amount=-amount,
+                        kind=kind, reference=str(reference)),
+            LedgerEntry(transfer_id=transfer_id, account_type=destination[0],
+                        account_id=str(destination[1]), amount=amount,
+                        kind=kind, reference=str(reference))
+        ])
+
+        return transfer_id
+
+    @staticmethod
+    def __check_amount(amount: int) -> None:
+        if not isinstance(amount, int) or amount <= 0:
+            raise ValueError(f'amount must be positive number of santim, got {amount!r}')
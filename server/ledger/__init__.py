@@ -0,0 +1 @@
+from .Ledger import Ledger
@@ -0,0 +1,120 @@
+from datetime import datetime
+from typing import Any, Callable
+
+from sqlalchemy import event
+
+from model import (Chat, Contract, File, FileAccess, Job, LedgerEntry, Message,
+                   PaymentEvent, Proposal, User, db)
+
+
+class IndexCheck:
+    """
+    Runs EXPLAIN for the statements issued by the hot query paths of the
+    application and reports every table they read in full
+
+    Statements are captured by calling the model methods themselves, so
+    the check follows changes to the queries. The query planner decides
+    based on table statistics, run the check against a database holding
+    realistic data. Must be used inside an application context.
+    """
+
+    @staticmethod
+    def hot_paths() -> dict[str, Callable[[], Any]]:
+        """Gets calls issuing the hot queries, keyed by name"""
+
+        now = datetime.now()
+        return {
+            'User.get_by_email': lambda: User.get_by_email('someone@example.com'),
+            'Chat.get_chat': lambda: Chat.get_chat(1, 2),
+            'Chat.get_inbox': lambda: Chat.get_inbox(1),
+            'Message.get_history': lambda: Message.get_history(1),
+            'Message._position': lambda: Message._position(1, 1),
+            'Contract.already_exists': lambda: Contract.already_exists('job', 1),
+            'Contract.get_expired': lambda: Contract.get_expired(now, 100),
+            'Job.list_jobs': lambda: Job.list_jobs(owner_id=1, after=(now, 'job')),
+            'Proposal.get_by_job': lambda: Proposal.get_by_job('job'),
+            'PaymentEvent.get_pending': lambda: PaymentEvent.get_pending(50),
+            'LedgerEntry.get_account_entries': lambda: LedgerEntry.get_account_entries('USER', 1),
+            'File by content_hash': lambda: File.query.filter_by(content_hash='0' * 64).first(),
+            'FileAccess.get_scopes': lambda: FileAccess.get_scopes('file'),
+            'File.get_pending': lambda: File.get_pending(20)
+        }
+
+    def run(self) -> dict[str, list[str]]:
+        """Explains every hot query
+
+        Returns:
+            dict: name of hot path -> list of full table scans, only paths
+                with at least one scan are included
+        """
+
+        failures = {}
+        for name, call in self.hot_paths().items():
+            scans = []
+            for statement, parameters in self.capture(call):
+                scans.extend(self.full_scans(statement, parameters))
+
+            if scans:
+                failures[name] = scans
+
+        return failures
+
+    @staticmethod
+    def capture(call: Callable[[], Any]) -> list[tuple[str, Any]]:
+        """Calls function and collects SELECT statements it sends to the database
+
+        Args:
+            call (callable): function issuing queries
+
+        Returns:
+            list: list of (statement, parameters) tuples
+        """
+
+        statements = []
+
+        def before_cursor_execute(connection, cursor, statement, parameters, context, executemany):
+            if statement.lstrip().upper().startswith('SELECT'):
+                statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            call()
+        finally:
+            event.remove(db.engine, 'before_cursor_execute',
+                         before_cursor_execute)
+            db.session.rollback()
+
+        return statements
+
+    @staticmethod
+    def full_scans(statement: str, parameters: Any) -> list[str]:
+        """Explains statement
+
+        Args:
+            statement (str): SQL statement as sent to the database
+            parameters (Any): parameters of the statement
+
+        Raises:
+            NotImplementedError: if database is not MySQL or SQLite
+
+        Returns:
+            list: descriptions of full table scans in the query plan
+        """
+
+        dialect = db.engine.dialect.name
+
+        with db.engine.connect() as connection:
+            if dialect == 'mysql':
+                plan = connection.exec_driver_sql(
+                    f'EXPLAIN {statement}', parameters).mappings().all()
+                return [f"full scan of {row['table']}" for row in plan
+                        if row['type'] == 'ALL']
+
+            if dialect == 'sqlite':
+                plan = connection.exec_driver_sql(
+                    f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+                return [row[3] for row in plan
+                        if row[3].startswith('SCAN ') and ' INDEX ' not in row[3]
+                        and 'PRIMARY KEY' not in row[3] and 'CONSTANT ROW' not in row[3]]
+
+        raise NotImplementedError(f'EXPLAIN is not supported for {dialect}')
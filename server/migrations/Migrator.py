@@ -0,0 +1,99 @@
+import importlib
+import logging
+import pkgutil
+from datetime import datetime
+from types import ModuleType
+from typing import Optional
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, select
+from sqlalchemy.engine import Engine
+
+from . import versions
+from .SchemaEditor import SchemaEditor
+
+logger = logging.getLogger(__name__)
+
+metadata = MetaData()
+
+schema_version = Table(
+    'schema_version', metadata,
+    Column('version', Integer, primary_key=True, autoincrement=False),
+    Column('name', String(100), nullable=False),
+    Column('applied_at', DateTime, nullable=False)
+)
+
+
+class Migrator:
+    """
+    Applies versioned schema migrations found in migrations/versions
+
+    A migration is a module named v<version>_<name>.py defining
+    upgrade(schema: SchemaEditor). Applied versions are recorded in the
+    schema_version table, database/db.sql creates the latest schema and
+    records every version so fresh databases have nothing to apply.
+
+    Parameters:
+        engine (Engine): engine of the database to migrate
+    """
+
+    def __init__(self, engine: Engine):
+        self.engine = engine
+
+    @staticmethod
+    def migrations() -> list[tuple[int, str, ModuleType]]:
+        """Gets all migrations ordered by version
+
+        Returns:
+            list: list of (version, name, module) tuples
+        """
+
+        found = []
+        for module_info in pkgutil.iter_modules(versions.__path__):
+            prefix, _, name = module_info.name.partition('_')
+            if not prefix.startswith('v') or not prefix[1:].isdigit():
+                continue
+
+            module = importlib.import_module(
+                f'{versions.__name__}.{module_info.name}')
+            found.append((int(prefix[1:]), name, module))
+
+        found.sort(key=lambda migration: migration[0])
+        return found
+
+    def applied(self) -> set[int]:
+        """Gets versions already applied to the database"""
+
+        with self.engine.begin() as connection:
+            schema_version.create(connection, checkfirst=True)
+            return set(connection.execute(select(schema_version.c.version)).scalars())
+
+    def pending(self) -> list[tuple[int, str, ModuleType]]:
+        """Gets migrations not applied yet, oldest first"""
+
+        applied = self.applied()
+        return [migration for migration in self.migrations()
+                if migration[0] not in applied]
+
+    def upgrade(self, target: Optional[int] = None) -> list[int]:
+        """Applies pending migrations, each in its own transaction
+
+        Args:
+            target (int): last version to apply (default is latest)
+
+        Returns:
+            list: versions applied by this call
+        """
+
+        done = []
+        for version, name, module in self.pending():
+            if target is not None and version > target:
+                break
+
+            logger.info('Applying migration %04d %s', version, name)
+            with self.engine.begin() as connection:
+                module.upgrade(SchemaEditor(connection))
+                connection.execute(schema_version.insert().values(
+                    version=version, name=name, applied_at=datetime.now()))
+            done.append(version)
+
+        return done
@@ -0,0 +1,129 @@
+from typing import Iterable
+
+from sqlalchemy import inspect, text
+from sqlalchemy.engine import Connection
+
+
+class SchemaEditor:
+    """
+    Schema changes used by migrations, every change checks the current
+    schema first so a migration interrupted half way (MySQL commits DDL
+    statements implicitly) can simply be run again
+
+    Parameters:
+        connection (Connection): connection the migration runs on
+    """
+
+    def __init__(self, connection: Connection):
+        self.connection = connection
+        self.dialect = connection.dialect.name
+        self._preparer = connection.dialect.identifier_preparer
+
+    def quote(self, name: str) -> str:
+        """Quotes table, column or index name for the current database"""
+
+        return self._preparer.quote_identifier(name)
+
+    def execute(self, statement: str, **params):
+        """Executes raw SQL statement
+
+        Args:
+            statement (str): SQL with :name placeholders for params
+
+        Returns:
+            CursorResult: result of the statement
+        """
+
+        return self.connection.execute(text(statement), params)
+
+    def has_table(self, table: str) -> bool:
+        return inspect(self.connection).has_table(table)
+
+    def has_column(self, table: str, column: str) -> bool:
+        return any(existing['name'] == column
+                   for existing in inspect(self.connection).get_columns(table))
+
+    def has_index(self, table: str, index: str) -> bool:
+        inspector = inspect(self.connection)
+        names = {existing['name'] for existing in inspector.get_indexes(table)}
+        names |= {existing['name']
+                  for existing in inspector.get_unique_constraints(table)}
+        return index in names
+
+    def has_index_on(self, table: str, columns: Iterable[str]) -> bool:
+        """Checks whether an index or unique constraint on exactly these columns exists"""
+
+        columns = list(columns)
+        inspector = inspect(self.connection)
+        existing = inspector.get_indexes(table) + inspector.get_unique_constraints(table)
+        return any(list(index['column_names']) == columns for index in existing)
+
+    def add_column(self, table: str, column: str, definition: str) -> bool:
+        """Adds column unless it exists
+
+        Args:
+            table (str): table name
+            column (str): column name
+            definition (str): type and constraints, e.g. 'BIGINT NOT NULL DEFAULT 0'
+
+        Returns:
+            bool: True if column was added
+        """
+
+        if self.has_column(table, column):
+            return False
+
+        self.execute(
+            f'ALTER TABLE {self.quote(table)} ADD COLUMN {self.quote(column)} {definition}')
+        return True
+
+    def drop_column(self, table: str, column: str) -> bool:
+        """Drops column if it exists
+
+        Returns:
+            bool: True if column was dropped
+        """
+
+        if not self.has_column(table, column):
+            return False
+
+        self.execute(
+            f'ALTER TABLE {self.quote(table)} DROP COLUMN {self.quote(column)}')
+        return True
+
+    def create_index(self, table: str, index: str, columns: Iterable[str], unique: bool = False) -> bool:
+        """Creates index unless it exists
+
+        Args:
+            table (str): table name
+            index (str): index name
+            columns (Iterable[str]): indexed columns in order
+            unique (bool): creates unique index (default is False)
+
+        Returns:
+            bool: True if index was created
+        """
+
+        if self.has_index(table, index):
+            return False
+
+        column_list = ', '.join(self.quote(column) for column in columns)
+        self.execute(f'CREATE {"UNIQUE " if unique else ""}INDEX {self.quote(index)} '
+                     f'ON {self.quote(table)} ({column_list})')
+        return True
+
+    def drop_index(self, table: str, index: str) -> bool:
+        """Drops index if it exists
+
+        Returns:
+            bool: True if index was dropped
+        """
+
+        if not self.has_index(table, index):
+            return False
+
+        if self.dialect == 'mysql':
+            self.execute(f'DROP INDEX {self.quote(index)} ON {self.quote(table)}')
+        else:
+            self.execute(f'DROP INDEX {self.quote(index)}')
+        return True
@@ -0,0 +1,3 @@
+from .Migrator import Migrator
+from .SchemaEditor import SchemaEditor
+from .IndexCheck import IndexCheck
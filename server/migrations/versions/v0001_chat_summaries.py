@@ -0,0 +1,50 @@
+"""Inbox summaries on chats and per chat message sequence numbers"""
+
+from ..SchemaEditor import SchemaEditor
+
+PREVIEW_LENGTH = 100
+
+
+def upgrade(schema: SchemaEditor) -> None:
+    schema.add_column('chat', 'last_sequence', 'INT NOT NULL DEFAULT 0')
+    schema.add_column('chat', 'last_message_id', 'INT')
+    schema.add_column('chat', 'last_message_preview',
+                      f'VARCHAR({PREVIEW_LENGTH})')
+    schema.add_column('chat', 'last_message_time', 'DATETIME')
+    schema.add_column('chat', 'unread_1', 'INT NOT NULL DEFAULT 0')
+    schema.add_column('chat', 'unread_2', 'INT NOT NULL DEFAULT 0')
+    schema.add_column('message', 'sequence', 'INT')
+
+    schema.create_index('chat', 'ix_chat_user_1_last_message_time',
+                        ['user_1', 'last_message_time'])
+    schema.create_index('chat', 'ix_chat_user_2_last_message_time',
+                        ['user_2', 'last_message_time'])
+    schema.create_index('message', 'ix_message_chat_id_time_stamp',
+                        ['chat_id', 'time_stamp'])
+
+    # summarize latest message of chats created before summaries existed
+    schema.execute('''
+        UPDATE chat SET last_message_time = (
+            SELECT MAX(m.time_stamp) FROM message m WHERE m.chat_id = chat.id
+        )
+        WHERE last_message_id IS NULL
+    ''')
+    schema.execute('''
+        UPDATE chat SET last_message_id = (
+            SELECT MAX(m.id) FROM message m
+            WHERE m.chat_id = chat.id AND m.time_stamp = chat.last_message_time
+        )
+        WHERE last_message_id IS NULL AND last_message_time IS NOT NULL
+    ''')
+    schema.execute(f'''
+        UPDATE chat SET last_message_preview = (
+            SELECT CASE
+                WHEN m.content_type = 'FILE'
+                    THEN (SELECT f.file_name FROM file f WHERE f.id = m.content)
+                ELSE SUBSTR(m.content, 1, {PREVIEW_LENGTH})
+            END
+            FROM message m
+            WHERE m.chat_id = chat.id AND m.id = chat.last_message_id
+        )
+        WHERE last_message_id IS NOT NULL AND last_message_preview IS NULL
+    ''')
@@ -0,0 +1,9 @@
+"""Content hash and size of stored files"""
+
+from ..SchemaEditor import SchemaEditor
+
+
+def upgrade(schema: SchemaEditor) -> None:
+    schema.add_column('file', 'content_hash', 'CHAR(64)')
+    schema.add_column('file', 'size', 'BIGINT')
+    schema.create_index('file', 'ix_file_content_hash', ['content_hash'])
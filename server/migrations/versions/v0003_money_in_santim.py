@@ -0,0 +1,102 @@
+"""Balances and escrow amounts as integer santim, payment events and the ledger"""
+
+from datetime import datetime
+from uuid import uuid4
+
+from sqlalchemy import (BigInteger, Column, DateTime, ForeignKey, Index, Integer,
+                        MetaData, String, Table)
+
+from ..SchemaEditor import SchemaEditor
+
+metadata = MetaData()
+
+user = Table('user', metadata, Column('id', Integer, primary_key=True))
+
+payment_event = Table(
+    'payment_event', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('tx_ref', String(100), nullable=False, unique=True),
+    Column('user_id', Integer, ForeignKey('user.id')),
+    Column('amount_minor', BigInteger),
+    Column('status', String(1), nullable=False),
+    Column('attempts', Integer, nullable=False, default=0),
+    Column('created_at', DateTime),
+    Column('processed_at', DateTime),
+    Index('ix_payment_event_status_id', 'status', 'id')
+)
+
+ledger_entry = Table(
+    'ledger_entry', metadata,
+    Column('id', Integer, primary_key=True),
+    Column('transfer_id', String(36), nullable=False, index=True),
+    Column('account_type', String(10), nullable=False),
+    Column('account_id', String(36), nullable=False),
+    Column('amount', BigInteger, nullable=False),
+    Column('kind', String(20), nullable=False),
+    Column('reference', String(100)),
+    Column('created_at', DateTime),
+    Index('ix_ledger_entry_account', 'account_type', 'account_id', 'id')
+)
+
+OPENING = 'OPENING'
+
+
+def upgrade(schema: SchemaEditor) -> None:
+    payment_event.create(schema.connection, checkfirst=True)
+    ledger_entry.create(schema.connection, checkfirst=True)
+
+    user_table = schema.quote('user')
+
+    schema.add_column('user', 'balance_minor', 'BIGINT NOT NULL DEFAULT 0')
+    if schema.has_column('user', 'balance'):
+        schema.execute(f'''
+            UPDATE {user_table} SET balance_minor = ROUND(COALESCE(balance, 0) * 100)
+        ''')
+
+    schema.add_column('escrow', 'amount_minor', 'BIGINT NOT NULL DEFAULT 0')
+    schema.add_column('escrow', 'balance_minor', 'BIGINT NOT NULL DEFAULT 0')
+    if schema.has_column('escrow', 'amount'):
+        schema.execute('''
+            UPDATE escrow SET amount_minor = ROUND(COALESCE(amount, 0) * 100)
+        ''')
+        # escrow of offered, accepted and pending cancel contracts still holds its amount
+        schema.execute(f'''
+            UPDATE escrow SET balance_minor = amount_minor
+            WHERE contract_id IN (
+                SELECT c.id FROM contract c
+                WHERE c.{schema.quote('status')} IS NULL
+                   OR c.{schema.quote('status')} IN ('A', 'P')
+            )
+        ''')
+
+    if schema.has_column('user', 'balance') or schema.has_column('escrow', 'amount'):
+        _open_ledger(schema)
+
+    schema.drop_column('user', 'balance')
+    schema.drop_column('escrow', 'amount')
+
+
+def _open_ledger(schema: SchemaEditor) -> None:
+    """Books converted balances as opening entries so that every balance
+    equals the sum of its ledger entries"""
+
+    schema.execute('DELETE FROM ledger_entry WHERE kind = :kind', kind=OPENING)
+
+    balances = [('USER', row[0], row[1]) for row in schema.execute(
+        f'SELECT id, balance_minor FROM {schema.quote("user")} WHERE balance_minor <> 0')]
+    balances += [('ESCROW', row[0], row[1]) for row in schema.execute(
+        'SELECT id, balance_minor FROM escrow WHERE balance_minor <> 0')]
+
+    now = datetime.now()
+    entries = []
+    for account_type, account_id, amount in balances:
+        transfer_id = str(uuid4())
+        entries.append(dict(transfer_id=transfer_id, account_type='PROVIDER',
+                            account_id=OPENING.lower(), amount=-amount, kind=OPENING,
+                            reference=None, created_at=now))
+        entries.append(dict(transfer_id=transfer_id, account_type=account_type,
+                            account_id=str(account_id), amount=amount, kind=OPENING,
+                            reference=None, created_at=now))
+
+    if entries:
+        schema.connection.execute(ledger_entry.insert(), entries)
@@ -0,0 +1,8 @@
+"""Index used by the escrow sweeper to find expired contracts"""
+
+from ..SchemaEditor import SchemaEditor
+
+
+def upgrade(schema: SchemaEditor) -> None:
+    schema.create_index('contract', 'ix_contract_status_deadline',
+                        ['status', 'deadline'])
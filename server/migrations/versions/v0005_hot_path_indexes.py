@@ -0,0 +1,18 @@
+"""Indexes for login, chat lookup, contract checks, job listings and proposals"""
+
+from ..SchemaEditor import SchemaEditor
+
+
+def upgrade(schema: SchemaEditor) -> None:
+    # databases created from db.sql already have a unique key on email
+    if not schema.has_index_on('user', ['email']):
+        schema.create_index('user', 'ix_user_email', ['email'], unique=True)
+
+    schema.create_index('chat', 'ix_chat_user_1_user_2', ['user_1', 'user_2'])
+    schema.create_index('contract', 'ix_contract_job_id_worker_id_status',
+                        ['job_id', 'worker_id', 'status'])
+    schema.create_index('job', 'ix_job_owner_id_post_time',
+                        ['owner_id', 'post_time'])
+    schema.create_index('proposal', 'ix_proposal_job_id_sent_time',
+                        ['job_id', 'sent_time'])
+    schema.create_index('escrow', 'ix_escrow_contract_id', ['contract_id'])
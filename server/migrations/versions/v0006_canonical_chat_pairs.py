@@ -0,0 +1,76 @@
+"""Chats stored as (lower user id, higher user id) with one chat per pair"""
+
+from ..SchemaEditor import SchemaEditor
+
+PREVIEW_LENGTH = 100
+
+
+def upgrade(schema: SchemaEditor) -> None:
+    # MySQL evaluates SET assignments left to right, swap row by row
+    swapped = schema.execute('''
+        SELECT id, user_1, user_2, unread_1, unread_2 FROM chat WHERE user_1 > user_2
+    ''').all()
+    for chat_id, user_1, user_2, unread_1, unread_2 in swapped:
+        schema.execute('''
+            UPDATE chat SET user_1 = :user_1, user_2 = :user_2,
+                unread_1 = :unread_1, unread_2 = :unread_2
+            WHERE id = :id
+        ''', id=chat_id, user_1=user_2, user_2=user_1, unread_1=unread_2, unread_2=unread_1)
+
+    duplicated = schema.execute('''
+        SELECT user_1, user_2, MIN(id) FROM chat
+        GROUP BY user_1, user_2 HAVING COUNT(*) > 1
+    ''').all()
+    for user_1, user_2, kept in duplicated:
+        _merge(schema, user_1, user_2, kept)
+
+    schema.create_index('chat', 'uq_chat_user_1_user_2',
+                        ['user_1', 'user_2'], unique=True)
+    schema.drop_index('chat', 'ix_chat_user_1_user_2')
+
+
+def _merge(schema: SchemaEditor, user_1: int, user_2: int, kept: int) -> None:
+    """Moves messages of duplicate chats of a pair to the oldest chat and
+    deletes the duplicates"""
+
+    duplicates = schema.execute('''
+        SELECT id, unread_1, unread_2 FROM chat
+        WHERE user_1 = :user_1 AND user_2 = :user_2 AND id <> :kept
+    ''', user_1=user_1, user_2=user_2, kept=kept).all()
+
+    for chat_id, unread_1, unread_2 in duplicates:
+        schema.execute('UPDATE message SET chat_id = :kept WHERE chat_id = :id',
+                       kept=kept, id=chat_id)
+        schema.execute('''
+            UPDATE chat SET unread_1 = unread_1 + :unread_1, unread_2 = unread_2 + :unread_2
+            WHERE id = :kept
+        ''', kept=kept, unread_1=unread_1, unread_2=unread_2)
+        schema.execute('DELETE FROM chat WHERE id = :id', id=chat_id)
+
+    # renumber merged messages so sequence numbers stay gapless
+    sequence = schema.quote('sequence')
+    messages = schema.execute(
+        'SELECT id FROM message WHERE chat_id = :kept ORDER BY time_stamp, id', kept=kept).all()
+    for number, (message_id,) in enumerate(messages, start=1):
+        schema.execute(f'UPDATE message SET {sequence} = :number WHERE chat_id = :kept AND id = :id',
+                       number=number, kept=kept, id=message_id)
+
+    last = schema.execute('''
+        SELECT m.id, m.time_stamp, m.content_type, m.content FROM message m
+        WHERE m.chat_id = :kept ORDER BY m.time_stamp DESC, m.id DESC LIMIT 1
+    ''', kept=kept).first()
+
+    if last is None:
+        return
+
+    message_id, time_stamp, content_type, content = last
+    if content_type == 'FILE':
+        content = schema.execute('SELECT file_name FROM file WHERE id = :id',
+                                 id=content).scalar() or ''
+
+    schema.execute('''
+        UPDATE chat SET last_sequence = :last_sequence, last_message_id = :message_id,
+            last_message_time = :time_stamp, last_message_preview = :preview
+        WHERE id = :kept
+    ''', last_sequence=len(messages), message_id=message_id, time_stamp=time_stamp,
+        preview=(content or '')[:PREVIEW_LENGTH], kept=kept)
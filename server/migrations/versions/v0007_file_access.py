@@ -0,0 +1,55 @@
+"""Records granting access to stored files, filled from existing references"""
+
+from sqlalchemy import Column, ForeignKey, MetaData, String, Table
+
+from ..SchemaEditor import SchemaEditor
+
+metadata = MetaData()
+
+file = Table('file', metadata, Column('id', String(36), primary_key=True))
+
+file_access = Table(
+    'file_access', metadata,
+    Column('file_id', String(36), ForeignKey('file.id'), primary_key=True),
+    Column('scope_type', String(10), primary_key=True),
+    Column('scope_id', String(64), primary_key=True)
+)
+
+
+def upgrade(schema: SchemaEditor) -> None:
+    file_access.create(schema.connection, checkfirst=True)
+
+    user = schema.quote('user')
+    references = [
+        # uploader and chat of files sent as messages
+        ('SELECT m.content, m.sender_id FROM message m '
+         "WHERE m.content_type = 'FILE'", 'USER'),
+        ('SELECT m.content, m.chat_id FROM message m '
+         "WHERE m.content_type = 'FILE'", 'CHAT'),
+        (f'SELECT u.resume_id, u.id FROM {user} u WHERE u.resume_id IS NOT NULL', 'USER'),
+        ('SELECT a.file_id, w.contract_id FROM work w '
+         'JOIN attachment a ON a.id = w.attachment_id', 'CONTRACT'),
+        ('SELECT a.file_id, j.id FROM job j '
+         'JOIN attachment a ON a.id = j.attachment_id', 'JOB')
+    ]
+
+    grants = set()
+    for statement, scope_type in references:
+        for file_id, scope_id in schema.execute(statement):
+            grants.add((str(file_id), scope_type, str(scope_id)))
+
+    proposals = schema.execute('SELECT a.file_id, p.job_id, p.worker_id FROM proposal p '
+                               'JOIN attachment a ON a.id = p.attachment_id')
+    for file_id, job_id, worker_id in proposals:
+        grants.add((str(file_id), 'PROPOSAL', f'{job_id}:{worker_id}'))
+        grants.add((str(file_id), 'USER', str(worker_id)))
+
+    existing_files = {row[0] for row in schema.execute('SELECT id FROM file')}
+    granted = {tuple(row) for row in schema.execute(
+        'SELECT file_id, scope_type, scope_id FROM file_access')}
+
+    rows = [dict(file_id=file_id, scope_type=scope_type, scope_id=scope_id)
+            for file_id, scope_type, scope_id in grants - granted
+            if file_id in existing_files]
+    if rows:
+        schema.connection.execute(file_access.insert(), rows)
@@ -0,0 +1,8 @@
+"""Post processing status of stored files, existing files are ready"""
+
+from ..SchemaEditor import SchemaEditor
+
+
+def upgrade(schema: SchemaEditor) -> None:
+    schema.add_column('file', 'status', "CHAR(1) NOT NULL DEFAULT 'R'")
+    schema.create_index('file', 'ix_file_status_id', ['status', 'id'])
@@ -0,0 +1,133 @@
+"""Ids of files, attachments, jobs, contracts, escrows and work as BINARY(16)"""
+
+import uuid
+
+from sqlalchemy import inspect
+
+from ..SchemaEditor import SchemaEditor
+
+COLUMNS = [
+    ('file', 'id'),
+    ('file_access', 'file_id'),
+    ('attachment', 'id'),
+    ('attachment', 'file_id'),
+    ('job', 'id'),
+    ('job', 'attachment_id'),
+    ('contract', 'id'),
+    ('contract', 'job_id'),
+    ('escrow', 'id'),
+    ('escrow', 'contract_id'),
+    ('proposal', 'job_id'),
+    ('proposal', 'attachment_id'),
+    ('work', 'id'),
+    ('work', 'contract_id'),
+    ('work', 'attachment_id')
+]
+
+# (table, column, referenced table) as declared in database/db.sql
+FOREIGN_KEYS = [
+    ('file_access', 'file_id', 'file'),
+    ('attachment', 'file_id', 'file'),
+    ('contract', 'job_id', 'job'),
+    ('escrow', 'contract_id', 'contract'),
+    ('proposal', 'job_id', 'job'),
+    ('proposal', 'attachment_id', 'attachment'),
+    ('work', 'contract_id', 'contract'),
+    ('work', 'attachment_id', 'attachment')
+]
+
+UUID_PATTERN = '^[0-9A-Fa-f]{8}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{4}-[0-9A-Fa-f]{12}$'
+
+
+def upgrade(schema: SchemaEditor) -> None:
+    if schema.dialect == 'mysql':
+        _convert_columns(schema)
+    else:
+        _convert_values(schema)
+
+
+def _convert_columns(schema: SchemaEditor) -> None:
+    """Changes the columns to BINARY(16), foreign keys are dropped while
+    both sides of them are converted"""
+
+    columns = [(table, column) for table, column in COLUMNS if schema.has_table(table)]
+
+    # refuse before anything is changed, UNHEX would turn other ids into NULL
+    for table, column in columns:
+        if _column(schema, table, column)[0] not in ('char', 'varchar'):
+            continue
+
+        invalid = schema.execute(f'''
+            SELECT COUNT(*) FROM {schema.quote(table)}
+            WHERE {schema.quote(column)} IS NOT NULL AND {schema.quote(column)} NOT REGEXP :pattern
+        ''', pattern=UUID_PATTERN).scalar()
+        if invalid:
+            raise RuntimeError(f'{table}.{column} holds {invalid} ids that are not UUIDs')
+
+    converted = set(columns)
+    for table in {table for table, _ in columns}:
+        for foreign_key in inspect(schema.connection).get_foreign_keys(table):
+            if any((table, column) in converted for column in foreign_key['constrained_columns']):
+                schema.execute(f'ALTER TABLE {schema.quote(table)} '
+                               f'DROP FOREIGN KEY {schema.quote(foreign_key["name"])}')
+
+    for table, column in columns:
+        data_type, nullable = _column(schema, table, column)
+        null = '' if nullable else ' NOT NULL'
+        quoted_table, quoted_column = schema.quote(table), schema.quote(column)
+
+        if data_type in ('char', 'varchar'):
+            schema.execute(f'ALTER TABLE {quoted_table} MODIFY {quoted_column} VARBINARY(36){null}')
+            data_type = 'varbinary'
+
+        if data_type == 'varbinary':
+            schema.execute(f'''
+                UPDATE {quoted_table} SET {quoted_column} = UNHEX(REPLACE({quoted_column}, '-', ''))
+                WHERE LENGTH({quoted_column}) = 36
+            ''')
+            schema.execute(f'ALTER TABLE {quoted_table} MODIFY {quoted_column} BINARY(16){null}')
+
+    for table, column, referenced in FOREIGN_KEYS:
+        if not schema.has_table(table):
+            continue
+
+        foreign_keys = inspect(schema.connection).get_foreign_keys(table)
+        if not any(foreign_key['constrained_columns'] == [column] for foreign_key in foreign_keys):
+            schema.execute(f'ALTER TABLE {schema.quote(table)} ADD FOREIGN KEY ({schema.quote(column)}) '
+                           f'REFERENCES {schema.quote(referenced)} (id)')
+
+
+def _column(schema: SchemaEditor, table: str, column: str) -> tuple[str, bool]:
+    """Gets data type and nullability of MySQL column"""
+
+    data_type, is_nullable = schema.execute('''
+        SELECT DATA_TYPE, IS_NULLABLE FROM information_schema.COLUMNS
+        WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = :table AND COLUMN_NAME = :column
+    ''', table=table, column=column).one()
+
+    return data_type.lower(), is_nullable == 'YES'
+
+
+def _convert_values(schema: SchemaEditor) -> None:
+    """SQLite keeps declared column types, ids are stored as blobs in place.
+    Values that are not UUIDs are stored as their encoding, the way
+    BinaryUUID binds them."""
+
+    for table, column in COLUMNS:
+        if not schema.has_table(table):
+            continue
+
+        quoted_table, quoted_column = schema.quote(table), schema.quote(column)
+        values = schema.execute(f'''
+            SELECT DISTINCT {quoted_column} FROM {quoted_table}
+            WHERE typeof({quoted_column}) = 'text'
+        ''').scalars().all()
+
+        for value in values:
+            try:
+                binary = uuid.UUID(value).bytes
+            except ValueError:
+                binary = value.encode()
+
+            schema.execute(f'UPDATE {quoted_table} SET {quoted_column} = :binary '
+                           f'WHERE {quoted_column} = :value', binary=binary, value=value)
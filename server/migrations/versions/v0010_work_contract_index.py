@@ -0,0 +1,8 @@
+"""Index used by the escrow sweeper to skip contracts with submitted work"""
+
+from ..SchemaEditor import SchemaEditor
+
+
+def upgrade(schema: SchemaEditor) -> None:
+    schema.create_index('work', 'ix_work_contract_id_submission_date',
+                        ['contract_id', 'submission_date'])
@@ -1 +1,2 @@
 from .model import *
+from .ids import BinaryUUID, new_id, uuid7
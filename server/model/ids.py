@@ -0,0 +1,80 @@
+import os
+import threading
+import time
+import uuid
+from typing import Optional
+
+from sqlalchemy.types import BINARY, TypeDecorator
+
+_lock = threading.Lock()
+_last = 0
+
+
+def uuid7() -> uuid.UUID:
+    """Generates time ordered UUID (version 7, RFC 9562)
+
+    The first 48 bits hold the Unix time in milliseconds, followed by a
+    12 bit counter keeping ids generated by this process strictly
+    increasing within a millisecond, and 62 random bits. Ids of different
+    processes collide only if they share millisecond, counter and all
+    random bits, so no existence check is needed.
+
+    Returns:
+        UUID: new id
+    """
+
+    global _last
+
+    with _lock:
+        # millisecond timestamp followed by counter
+        clock = max(time.time_ns() // 1_000_000 << 12, _last + 1)
+        _last = clock
+
+    random_bits = int.from_bytes(os.urandom(8), 'big') & ((1 << 62) - 1)
+    return uuid.UUID(int=(clock >> 12) << 80 | 0x7 << 76 | (clock & 0xFFF) << 64
+                     | 0b10 << 62 | random_bits)
+
+
+def new_id() -> str:
+    """Generates primary key for new row, see `uuid7`
+
+    Returns:
+        str: time ordered UUID in its canonical text form
+    """
+
+    return str(uuid7())
+
+
+class BinaryUUID(TypeDecorator):
+    """
+    UUID stored as BINARY(16) and used as canonical text by the application
+
+    Values that are not UUIDs, e.g. ids taken from a request, are bound as
+    their text encoding which never equals a stored id, so lookups of them
+    find nothing instead of failing.
+    """
+
+    impl = BINARY(16)
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect) -> Optional[bytes]:
+        if value is None:
+            return None
+
+        if isinstance(value, uuid.UUID):
+            return value.bytes
+
+        try:
+            return uuid.UUID(str(value)).bytes
+        except ValueError:
+            return str(value).encode()
+
+    def process_result_value(self, value, dialect) -> Optional[str]:
+        if value is None or isinstance(value, str):
+            return value
+
+        value = bytes(value)
+        if len(value) == 16:
+            return str(uuid.UUID(bytes=value))
+
+        return value.decode(errors='replace')
@@ -1,13 +1,22 @@
 from __future__ import annotations
 
 from datetime import datetime
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
 
+from flask import g, has_app_context, has_request_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy import event
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, object_session
 from sqlalchemy.orm.exc import NoResultFound
 
 from typing import Optional
 
+from search import SearchIndex
+
+from .ids import BinaryUUID, new_id
+
 db = SQLAlchemy()
 
 
@@ -35,6 +44,102 @@ class ContractStatus:
     CANCELLED = 'C'
     PENDING_CANCEL = 'P'
 
+    @staticmethod
+    def all() -> list[str]:
+        """Gets all contract statuses"""
+
+        return [ContractStatus.ACCEPTED, ContractStatus.REJECTED, ContractStatus.FINISED,
+                ContractStatus.CANCELLED, ContractStatus.PENDING_CANCEL]
+
+
+class PaymentEventStatus:
+    """Data class to represent progress of a payment reported by the payment provider"""
+
+    INITIATED = 'I'
+    PENDING = 'P'
+    CREDITED = 'C'
+    FAILED = 'F'
+
+
+class FileStatus:
+    """Data class to represent progress of checks run on stored uploads"""
+
+    PENDING = 'P'
+    READY = 'R'
+    FAILED = 'F'
+
+
+class Currency:
+    """Data class to convert amounts of money (in ETB) to integer number of
+    santim they are stored and moved as"""
+
+    MINOR_UNITS = 100
+
+    @staticmethod
+    def to_minor(amount) -> int:
+        """Converts amount in ETB to santim, rounding half santim up
+
+        Args:
+            amount (str | int | float | Decimal): amount in ETB
+
+        Raises:
+            ValueError: if amount is not a finite number
+
+        Returns:
+            int: amount in santim
+        """
+
+        try:
+            amount = Decimal(str(amount))
+        except InvalidOperation:
+            raise ValueError(f'invalid amount {amount!r}')
+
+        if not amount.is_finite():
+            raise ValueError(f'invalid amount {amount!r}')
+
+        return int((amount * Currency.MINOR_UNITS).to_integral_value(ROUND_HALF_UP))
+
+    @staticmethod
+    def from_minor(amount: Optional[int]) -> Decimal:
+        """Converts amount in santim to ETB
+
+        Args:
+            amount (int): amount in santim
+
+        Returns:
+            Decimal: amount in ETB with two decimal places
+        """
+
+        return (Decimal(amount or 0) / Currency.MINOR_UNITS).quantize(Decimal('0.01'))
+
+
+class LedgerAccountType:
+    """Data class to represent kinds of accounts money moves between"""
+
+    USER = 'USER'
+    ESCROW = 'ESCROW'
+    PROVIDER = 'PROVIDER'
+
+
+class LedgerEntryKind:
+    """Data class to represent reasons money moved"""
+
+    DEPOSIT = 'DEPOSIT'
+    ESCROW_FUND = 'ESCROW_FUND'
+    ESCROW_RELEASE = 'ESCROW_RELEASE'
+    ESCROW_REFUND = 'ESCROW_REFUND'
+    OPENING_BALANCE = 'OPENING'
+
+
+class FileAccessScope:
+    """Data class to represent kinds of records granting access to a stored file"""
+
+    USER = 'USER'
+    CHAT = 'CHAT'
+    PROPOSAL = 'PROPOSAL'
+    CONTRACT = 'CONTRACT'
+    JOB = 'JOB'
+
 
 class ContentType:
     """Data class to represent types of message contents supported by messaging functionality"""
@@ -57,23 +162,30 @@ class User(db.Model, UserMixin):
         date_of_birth (datetime): user's birth date
         user_type (str): one of supported user types specified under UserType class        
         token (str): user's authentication token
-        balance (float): the amount of money a user has in the system
-        initiated_chats (list[Chat]): list of Chat objects initiated by this user
-        joined_chats (list[Chat]): list of Chat objects joined by this user
+        balance_minor (int): the amount of money (in santim) a user has in the system,
+            changed only through Ledger
+        initiated_chats (list[Chat]): list of Chat objects in which this user is user_1
+        joined_chats (list[Chat]): list of Chat objects in which this user is user_2
         resume_id (str): file id referencing user resume
     """
 
     id = db.Column(db.Integer, primary_key=True)
     firstname = db.Column(db.String(50))
     lastname = db.Column(db.String(50))
-    email = db.Column(db.String(100))
+    email = db.Column(db.String(100), unique=True, index=True)
     password = db.Column(db.String(100))
     date_of_birth = db.Column(db.DateTime)
     user_type = db.Column(db.Enum(UserType.FREELANCER, UserType.EMPLOYER))
     token = db.Column(db.String(200))
-    balance = db.Column(db.Float, default=0)
+    balance_minor = db.Column(db.BigInteger, nullable=False, default=0)
     resume_id = db.Column(db.String(36))
 
+    @property
+    def balance(self) -> Decimal:
+        """Gets the amount of money (in ETB) the user has in the system"""
+
+        return Currency.from_minor(self.balance_minor)
+
     @property
     def chats(self):
         """Gets all chats associated with user
@@ -127,37 +239,107 @@ class User(db.Model, UserMixin):
 
         return jobs
 
-    def get_fund_in_escrow(self):
-        if self.user_type == UserType.FREELANCER:
-            amount = 0
-            for contract in self.contracts:
-                if contract.status in [ContractStatus.FINISED, ContractStatus.REJECTED]:
-                    continue
-                for e in contract.escrow:
-                    amount += e.amount
+    def _filter_contracts(self, query):
+        """Restricts query joining Contract to contracts the user takes part in
 
-            return float(amount)
+        Freelancers take part in contracts they work on, employers in
+        contracts on the jobs they posted.
+        """
 
-        else:
-            amount = 0
-            for job in self.get_posted_jobs():
-                for contract in Contract.query.filter_by(job_id=job.id).all():
-                    if contract.status in [ContractStatus.FINISED, ContractStatus.REJECTED]:
-                        continue
-                    for e in contract.escrow:
-                        amount += e.amount
-            return float(amount)
-
-    def get_contracts(self):
         if self.user_type == UserType.FREELANCER:
-            return self.contracts
+            return query.filter(Contract.worker_id == self.id)
+
+        return query.join(Job, Contract.job_id == Job.id).filter(Job.owner_id == self.id)
+
+    def _request_cache(self) -> dict:
+        """Gets per request cache of the user, it is cleared on every commit
+
+        Returns:
+            dict: cache of the user, a new empty dict outside of requests
+        """
+
+        if not has_request_context():
+            return {}
+
+        return g.setdefault("user_cache", {}).setdefault(self.id, {})
+
+    def get_fund_in_escrow(self) -> Decimal:
+        """Gets total fund held in escrow for contracts that are not finished or rejected
+
+        Returns:
+            Decimal: sum of escrow balances (in ETB)
+        """
+
+        cache = self._request_cache()
+        if "fund_in_escrow" not in cache:
+            cache["fund_in_escrow"] = self._query_fund_in_escrow()
+
+        return cache["fund_in_escrow"]
+
+    def _query_fund_in_escrow(self) -> Decimal:
+        query = db.session.query(
+            db.func.coalesce(db.func.sum(Escrow.balance_minor), 0)
+        ).select_from(Escrow).join(Contract, Escrow.contract_id == Contract.id)
 
-        contracts = []
-        for job in self.get_posted_jobs():
-            for contract in Contract.query.filter_by(job_id=job.id).all():
-                contracts.append(contract)
+        amount = self._filter_contracts(query).filter(
+            db.or_(
+                Contract.status == None,
+                Contract.status.notin_(
+                    [ContractStatus.FINISED, ContractStatus.REJECTED])
+            )
+        ).scalar()
+
+        return Currency.from_minor(amount)
+
+    def get_contracts(self) -> list[Contract]:
+        """Gets contracts the user works on or contracts on jobs posted by the user
+
+        Job, escrow and submissions of the contracts are loaded eagerly and
+        the result is reused for the rest of the request.
+
+        Returns:
+            list: list of Contract objects
+        """
+
+        cache = self._request_cache()
+        if "contracts" not in cache:
+            cache["contracts"] = self._query_contracts()
+
+        return cache["contracts"]
+
+    def get_grouped_contracts(self) -> dict[Optional[str], list[Contract]]:
+        """Gets contracts of the user partitioned by status
 
-        return contracts
+        Returns:
+            dict: maps every ContractStatus value, and None for contracts
+                waiting for the worker's response, to list of Contract objects
+        """
+
+        cache = self._request_cache()
+        if "grouped_contracts" not in cache:
+            groups = {status: [] for status in ContractStatus.all()}
+            groups[None] = []
+
+            for contract in self.get_contracts():
+                groups.setdefault(contract.status, []).append(contract)
+
+            cache["grouped_contracts"] = groups
+
+        return cache["grouped_contracts"]
+
+    def _query_contracts(self) -> list[Contract]:
+        query = self._filter_contracts(Contract.query)
+
+        if self.user_type == UserType.FREELANCER:
+            job_loader = db.joinedload(Contract.job)
+        else:
+            job_loader = db.contains_eager(Contract.job)
+
+        return query.options(
+            job_loader,
+            db.selectinload(Contract.escrow),
+            db.selectinload(Contract.submissions)
+        ).all()
 
     def __repr__(self):
         return f"User(id={self.id}, email={self.email})"
@@ -168,22 +350,154 @@ class Chat(db.Model):
 
     Parameters:
         id (str): unique chat id
-        user_1 (str): chat initiator id
-        user_2 (str): second user id in chat
-        u1 (User): chat initiator User object
-        u2 (User): second User object
+        user_1 (int): lower id of the two users, see Chat.pair
+        user_2 (int): higher id of the two users
+        u1 (User): User object of user_1
+        u2 (User): User object of user_2
+        last_sequence (int): sequence number of the last message sent in the chat
+        last_message_id (int): id of the last message sent in the chat
+        last_message_preview (str): plain text preview of the last message
+        last_message_time (datetime): sent time of the last message
+        unread_1 (int): number of messages user_1 has not read
+        unread_2 (int): number of messages user_2 has not read
         messages (list): list of messages sent in the chat
     """
 
+    PREVIEW_LENGTH = 100
+
     id = db.Column(db.Integer, primary_key=True)
     user_1 = db.Column(db.Integer, db.ForeignKey(User.id))
     user_2 = db.Column(db.Integer, db.ForeignKey(User.id))
+    last_sequence = db.Column(db.Integer, nullable=False, default=0)
+    last_message_id = db.Column(db.Integer)
+    last_message_preview = db.Column(db.String(PREVIEW_LENGTH))
+    last_message_time = db.Column(db.DateTime)
+    unread_1 = db.Column(db.Integer, nullable=False, default=0)
+    unread_2 = db.Column(db.Integer, nullable=False, default=0)
 
     u1 = db.relationship(User, backref='initiated_chats',
                          foreign_keys=[user_1])
     u2 = db.relationship(User, backref='joined_chats',
                          foreign_keys=[user_2])
 
+    __table_args__ = (
+        db.Index('ix_chat_user_1_last_message_time',
+                 'user_1', 'last_message_time'),
+        db.Index('ix_chat_user_2_last_message_time',
+                 'user_2', 'last_message_time'),
+        # a pair of users has exactly one chat
+        db.Index('uq_chat_user_1_user_2', 'user_1', 'user_2', unique=True),
+    )
+
+    @staticmethod
+    def pair(user_a: int, user_b: int) -> tuple[int, int]:
+        """Orders ids of two users the way chats store them
+
+        Args:
+            user_a (int): id of one user
+            user_b (int): id of other user
+
+        Returns:
+            tuple: (user_1, user_2) of chat between the users
+        """
+
+        user_a, user_b = int(user_a), int(user_b)
+        return min(user_a, user_b), max(user_a, user_b)
+
+    @staticmethod
+    def get_inbox(user_id: int) -> list[Chat]:
+        """Gets chats of user, most recently active first
+
+        Args:
+            user_id (int): user id
+
+        Returns:
+            list: list of Chat objects with both users loaded
+        """
+
+        return Chat.query.filter(
+            db.or_(Chat.user_1 == user_id, Chat.user_2 == user_id)
+        ).options(
+            db.joinedload(Chat.u1),
+            db.joinedload(Chat.u2)
+        ).order_by(
+            Chat.last_message_time.is_(None),
+            Chat.last_message_time.desc(),
+            Chat.id.desc()
+        ).all()
+
+    @staticmethod
+    def get_peers(user_ids: list[int]) -> dict[int, set[int]]:
+        """Gets users chatting with any of the given users
+
+        Args:
+            user_ids (list): user ids
+
+        Returns:
+            dict: maps id of every chat partner to set of ids among user_ids
+                they chat with
+        """
+
+        rows = db.session.query(Chat.user_1, Chat.user_2).filter(
+            db.or_(Chat.user_1.in_(user_ids), Chat.user_2.in_(user_ids)))
+
+        user_ids = set(user_ids)
+        peers: dict[int, set[int]] = {}
+        for user_1, user_2 in rows:
+            if user_1 in user_ids:
+                peers.setdefault(user_2, set()).add(user_1)
+            if user_2 in user_ids:
+                peers.setdefault(user_1, set()).add(user_2)
+
+        return peers
+
+    def other_user(self, user_id: int) -> User:
+        """Gets the user in chat other than user_id
+
+        Args:
+            user_id (int): id of one user in chat
+
+        Returns:
+            User: the other user
+        """
+
+        if self.user_1 == user_id:
+            return self.u2
+        return self.u1
+
+    def unread_count(self, user_id: int) -> int:
+        """Gets number of messages user has not read in chat
+
+        Args:
+            user_id (int): id of user in chat
+
+        Returns:
+            int: unread message count
+        """
+
+        if self.user_1 == user_id:
+            return self.unread_1
+        return self.unread_2
+
+    def mark_read(self, user_id: int) -> bool:
+        """Resets unread message count of user, changes are not commited
+
+        Args:
+            user_id (int): id of user in chat
+
+        Returns:
+            bool: True if there were unread messages, False otherwise
+        """
+
+        if not self.unread_count(user_id):
+            return False
+
+        if self.user_1 == user_id:
+            self.unread_1 = 0
+        else:
+            self.unread_2 = 0
+        return True
+
     @staticmethod
     def get(chat_id: int) -> Optional[User]:
         """Gets chat by id
@@ -209,19 +523,8 @@ class Chat(db.Model):
             Chat: chat object if chat associating the users is found, None otherwise
         """
 
-        chat = Chat.query.filter(
-            db.or_(
-                db.and_(
-                    Chat.user_1 == user_1,
-                    Chat.user_2 == user_2
-                ),
-                db.and_(
-                    Chat.user_1 == user_2,
-                    Chat.user_2 == user_1
-                )
-            )
-        )
-        return chat.first()
+        user_1, user_2 = Chat.pair(user_1, user_2)
+        return Chat.query.filter_by(user_1=user_1, user_2=user_2).first()
 
     def __repr__(self):
         return f"Chat(id={self.id}, user_1={self.u1.firstname}, user_2={self.u2.lastname})"
@@ -238,6 +541,8 @@ class Message(db.Model):
         content (str): the message sent
         content_type (str): specifies how to interpret the content
             (default is 'TEXT')
+        sequence (int): position of the message in its chat, starting from 1
+            without gaps
         sender (User): sender of the message
         chat (Chat): the chat the message belongs to
     """
@@ -249,11 +554,67 @@ class Message(db.Model):
     content = db.Column(db.String(200))
     content_type = db.Column(
         db.Enum(ContentType.TEXT, ContentType.FILE, ContentType.EVENT))
+    sequence = db.Column(db.Integer)
 
     sender = db.relationship(User, foreign_keys=[sender_id])
     chat = db.relationship(Chat, backref=db.backref(
         'messages', order_by='Message.time_stamp'), foreign_keys=[chat_id])
 
+    __table_args__ = (
+        db.Index('ix_message_chat_id_time_stamp', 'chat_id', 'time_stamp'),
+    )
+
+    @staticmethod
+    def get_history(chat_id: int, before: Optional[int] = None, after: Optional[int] = None,
+                    limit: int = 50) -> list[Message]:
+        """Gets a page of messages sent in chat, oldest first
+
+        Args:
+            chat_id (int): chat id
+            before (int): only get messages sent before message with this id
+            after (int): only get messages sent after message with this id
+            limit (int): maximum number of messages to return, when after is
+                given the oldest messages after it are returned, otherwise
+                the newest ones
+
+        Returns:
+            list: list of Message objects, empty if before or after is not
+                a message of the chat
+        """
+
+        query = Message.query.filter(Message.chat_id == chat_id)
+        position = db.tuple_(Message.time_stamp, Message.id)
+
+        # a cursor that is not a message of this chat selects nothing,
+        # instead of silently paging from the start or the end of the chat
+        if before is not None:
+            anchor = Message._position(chat_id, before)
+            if not anchor:
+                return []
+            query = query.filter(position < anchor)
+
+        if after is not None:
+            anchor = Message._position(chat_id, after)
+            if not anchor:
+                return []
+            query = query.filter(position > anchor)
+
+        if after is not None:
+            return query.order_by(Message.time_stamp, Message.id).limit(limit).all()
+
+        messages = query.order_by(Message.time_stamp.desc(),
+                                  Message.id.desc()).limit(limit).all()
+        messages.reverse()
+        return messages
+
+    @staticmethod
+    def _position(chat_id: int, message_id: int) -> Optional[tuple]:
+        """Gets (time_stamp, id) of message used as pagination cursor"""
+
+        row = db.session.query(Message.time_stamp, Message.id).filter(
+            Message.chat_id == chat_id, Message.id == message_id).first()
+        return tuple(row) if row else None
+
     @property
     def receiver(self):
         """Gets receiver of message
@@ -276,14 +637,26 @@ class File(db.Model):
     Parameters:
         id (str): unique file id
         file_name (str): name of file
-        file_path (str): path to file on local drive
+        file_path (str): path to file on local drive, files with identical
+            content share the same path
         mime_type (str): MIME type of file
+        content_hash (str): hex encoded SHA-256 of file content
+        size (int): file size in bytes
+        status (str): one of FileStatus, mime_type is only trusted once
+            the file is ready
     """
 
-    id = db.Column(db.String(36), primary_key=True)
+    __table_args__ = (
+        db.Index('ix_file_status_id', 'status', 'id'),
+    )
+
+    id = db.Column(BinaryUUID, primary_key=True, default=new_id)
     file_name = db.Column(db.String(30))
     file_path = db.Column(db.String(260))
     mime_type = db.Column(db.String(128))
+    content_hash = db.Column(db.String(64), index=True)
+    size = db.Column(db.BigInteger)
+    status = db.Column(db.String(1), nullable=False, default=FileStatus.READY)
 
     @staticmethod
     def get(file_id: str) -> Optional[File]:
@@ -298,10 +671,78 @@ class File(db.Model):
 
         return File.query.filter_by(id=file_id).first()
 
+    @staticmethod
+    def get_pending(limit: int, after_id: str = '') -> list[File]:
+        """Gets files waiting for post processing ordered by id
+
+        Args:
+            limit (int): maximum number of files to return
+            after_id (str): only files with greater id are returned
+
+        Returns:
+            list: list of File objects
+        """
+
+        return File.query.filter(File.status == FileStatus.PENDING, File.id > after_id)\
+            .order_by(File.id).limit(limit).all()
+
     def __repr__(self):
         return f"File(id={self.id}, file_name={self.file_name}, mime_type={self.mime_type})"
 
 
+class FileAccess(db.Model):
+    """FileAccess records a user, chat, proposal, contract or job that
+    references a file, users taking part in any of them may download it
+
+    Parameters:
+        file_id (str): file id
+        scope_type (str): one of FileAccessScope
+        scope_id (str): id of user, chat, contract or job, proposals are
+            identified as "<job id>:<worker id>"
+    """
+
+    file_id = db.Column(BinaryUUID, db.ForeignKey(File.id), primary_key=True)
+    scope_type = db.Column(db.String(10), primary_key=True)
+    scope_id = db.Column(db.String(64), primary_key=True)
+
+    @staticmethod
+    def grant(file_id: str, scope_type: str, scope_id) -> None:
+        """Grants access to file, changes are not commited
+
+        Args:
+            file_id (str): file id
+            scope_type (str): one of FileAccessScope
+            scope_id (Any): id of the record referencing the file
+        """
+
+        key = (str(file_id), scope_type, str(scope_id))
+        if db.session.get(FileAccess, key) is None:
+            db.session.add(FileAccess(file_id=key[0], scope_type=key[1], scope_id=key[2]))
+
+    @staticmethod
+    def get_scopes(file_id: str) -> list[tuple[str, str]]:
+        """Gets records granting access to file
+
+        Args:
+            file_id (str): file id
+
+        Returns:
+            list: list of (scope_type, scope_id) tuples
+        """
+
+        return [tuple(row) for row in db.session.query(FileAccess.scope_type, FileAccess.scope_id)
+                .filter(FileAccess.file_id == file_id).all()]
+
+    @staticmethod
+    def proposal_scope(job_id: str, worker_id: int) -> str:
+        """Gets scope id of a proposal"""
+
+        return f"{job_id}:{worker_id}"
+
+    def __repr__(self):
+        return f"FileAccess(file={self.file_id}, scope={self.scope_type}:{self.scope_id})"
+
+
 class Attachment(db.Model):
     """Job database model
 
@@ -310,8 +751,8 @@ class Attachment(db.Model):
         file_id (str): id for file
     """
 
-    id = db.Column(db.String(36), primary_key=True)
-    file_id = db.Column(db.String(36), db.ForeignKey(
+    id = db.Column(BinaryUUID, primary_key=True)
+    file_id = db.Column(BinaryUUID, db.ForeignKey(
         File.id), primary_key=True)
 
     file = db.relationship(File)
@@ -333,7 +774,7 @@ class Job(db.Model):
         owner (User): job poster
     """
 
-    id = db.Column(db.String(36), primary_key=True)
+    id = db.Column(BinaryUUID, primary_key=True, default=new_id)
     title = db.Column(db.String(50))
     description = db.Column(db.String(500))
     experience_level = db.Column(
@@ -341,7 +782,7 @@ class Job(db.Model):
             ExperienceLevel.ENTRY,
             ExperienceLevel.INTERMEDIATE,
             ExperienceLevel.EXPERT))
-    attachment_id = db.Column(db.String(50), db.ForeignKey(Attachment.id))
+    attachment_id = db.Column(BinaryUUID, db.ForeignKey(Attachment.id))
     budget = db.Column(db.Float)
     owner_id = db.Column(db.Integer, db.ForeignKey(User.id))
     post_time = db.Column(db.DateTime, default=datetime.now)
@@ -349,6 +790,10 @@ class Job(db.Model):
     attachments = db.relationship(Attachment, foreign_keys=[attachment_id])
     owner = db.relationship(User, foreign_keys=[owner_id])
 
+    __table_args__ = (
+        db.Index('ix_job_owner_id_post_time', 'owner_id', 'post_time'),
+    )
+
     @staticmethod
     def get(job_id: str) -> Optional[Job]:
         """Queries job from data base
@@ -365,37 +810,132 @@ class Job(db.Model):
         except:
             return None
 
+    search_index = SearchIndex()
+
     @staticmethod
-    def filter_job(key: str, level) -> Optional[Job]:
-        """Filters job using a key
+    def listing_columns() -> tuple:
+        """Columns needed to render job listings"""
+
+        return (Job.id, Job.title, Job.description, Job.experience_level,
+                Job.owner_id, Job.budget, Job.post_time)
+
+    @staticmethod
+    def filter_job(key: str, level: Optional[str] = None, min_budget: Optional[float] = None,
+                   max_budget: Optional[float] = None, offset: int = 0, limit: int = 20) -> tuple[int, list[Job]]:
+        """Ranks jobs matching a key using the job search index
 
         Args:
-            key (str): key word in - name of job
-                                   - description of job
-                                   - experience level of job
+            key (str): free text matched against - name of job
+                                                 - description of job
+                                                 - experience level of job
+            level (str): required experience level, one of ExperienceLevel
+            min_budget (float): lowest accepted budget
+            max_budget (float): highest accepted budget
+            offset (int): number of ranked jobs to skip
+            limit (int): maximum number of jobs to return
+
         Returns:
-                Job: job object if job associated with they key is found, None otherwise
+            tuple: total number of matching jobs and list of job listing rows
+                for the requested page, best match first
         """
 
+        filters = []
         if level:
-            query = db.and_(
-                db.or_(
-                    Job.title.like(f"%{key}%"),
-                    Job.description.like(f"%{key}%"),
-                    Job.budget.like(f"%{key}%")
-                ),
-
-                Job.experience_level == level
-            )
-        else:
-            query = db.or_(Job.title.like(f"%{key}%"),
-                           Job.description.like(f"%{key}%"),
-                           Job.experience_level.like(f"%{key}%"),
-                           Job.budget.like(f"%{key}%"))
+            filters.append(lambda job: job["experience_level"] == level)
+        if min_budget is not None:
+            filters.append(lambda job: job["budget"] is not None
+                           and job["budget"] >= min_budget)
+        if max_budget is not None:
+            filters.append(lambda job: job["budget"] is not None
+                           and job["budget"] <= max_budget)
+
+        total, matches = Job.search_index.search(
+            key, filters, offset=offset, limit=limit,
+            sort_key=lambda job: job["post_time"] or datetime.min)
+
+        ids = [job_id for job_id, _ in matches]
+        if not ids:
+            return total, []
+
+        rows = db.session.query(*Job.listing_columns()).filter(Job.id.in_(ids))
+        jobs = {row.id: row for row in rows}
+        return total, [jobs[job_id] for job_id in ids if job_id in jobs]
+
+    @staticmethod
+    def list_jobs(owner_id: Optional[int] = None, level: Optional[str] = None,
+                  min_budget: Optional[float] = None, max_budget: Optional[float] = None,
+                  after: Optional[tuple] = None, limit: int = 20) -> list:
+        """Lists newest jobs first using keyset pagination on (post_time, id)
+
+        Args:
+            owner_id (int): only list jobs posted by this user
+            level (str): required experience level, one of ExperienceLevel
+            min_budget (float): lowest accepted budget
+            max_budget (float): highest accepted budget
+            after (tuple): (post_time, id) of the last job of previous page
+            limit (int): maximum number of jobs to return
+
+        Returns:
+            list: list of job listing rows
+        """
+
+        query = db.session.query(*Job.listing_columns()).filter(
+            *Job._listing_filters(owner_id, level, min_budget, max_budget))
+
+        if after:
+            query = query.filter(db.tuple_(Job.post_time, Job.id) < after)
+
+        return query.order_by(Job.post_time.desc(), Job.id.desc()).limit(limit).all()
+
+    @staticmethod
+    def count_jobs(owner_id: Optional[int] = None, level: Optional[str] = None,
+                   min_budget: Optional[float] = None, max_budget: Optional[float] = None) -> int:
+        """Counts jobs matching the filters accepted by list_jobs
+
+        Returns:
+            int: number of matching jobs
+        """
+
+        return db.session.query(db.func.count(Job.id)).filter(
+            *Job._listing_filters(owner_id, level, min_budget, max_budget)).scalar()
 
-        job = Job.query.filter(query).all()
+    @staticmethod
+    def _listing_filters(owner_id, level, min_budget, max_budget) -> list:
+        filters = []
+        if owner_id is not None:
+            filters.append(Job.owner_id == owner_id)
+        if level:
+            filters.append(Job.experience_level == level)
+        if min_budget is not None:
+            filters.append(Job.budget >= min_budget)
+        if max_budget is not None:
+            filters.append(Job.budget <= max_budget)
+        return filters
+
+    @staticmethod
+    def index_document(job_id, title, description, experience_level, budget, post_time) -> tuple:
+        """Builds search index entry of a job
+
+        Returns:
+            tuple: (doc_id, fields, attributes) expected by SearchIndex
+        """
+
+        fields = [(title, 3), (description, 1), (experience_level, 1)]
+        attributes = {
+            "experience_level": experience_level,
+            "budget": float(budget) if budget not in (None, "") else None,
+            "post_time": post_time
+        }
+        return str(job_id), fields, attributes
+
+    @staticmethod
+    def load_search_index():
+        """Yields index entries of every job using a column only query"""
 
-        return job
+        rows = db.session.query(Job.id, Job.title, Job.description,
+                                Job.experience_level, Job.budget, Job.post_time)
+        for row in rows.yield_per(1000):
+            yield Job.index_document(*row)
 
     @staticmethod
     def get_jobs(owner_id: int) -> Optional[Job]:
@@ -414,15 +954,24 @@ class Job(db.Model):
         return jobs
 
     @staticmethod
-    def get_all_jobs() -> list[Job]:
-        """Gets all posted Jobs
+    def get_all_jobs(batch_size: int = 500):
+        """Iterates over all posted jobs newest first, one keyset page at a time
+
         Args:
-            None
+            batch_size (int): number of rows fetched per query
+
         Returns:
-            list: list of jobs
+            generator: job listing rows
         """
-        job = Job.query.all()
-        return job
+
+        after = None
+        while True:
+            rows = Job.list_jobs(after=after, limit=batch_size)
+            yield from rows
+
+            if len(rows) < batch_size:
+                return
+            after = (rows[-1].post_time, rows[-1].id)
 
     @staticmethod
     def deleteJob(id: str) -> None:
@@ -432,19 +981,61 @@ class Job(db.Model):
         Returns:
             None
         """
-        Job.query.filter_by(id=id).delete()
+        job = Job.get(id)
+        if job:
+            db.session.delete(job)
 
     def __repr__(self):
         return f"Job(id={self.id}, job_title={self.title}, experience_level={self.experience_level}, job_owner={self.owner_id}, post_time={self.post_time}, job_description={self.description})"
 
 
+Job.search_index.set_loader(Job.load_search_index)
+
+
+@event.listens_for(Job, "after_insert")
+@event.listens_for(Job, "after_update")
+def _queue_job_index_update(mapper, connection, job):
+    session = object_session(job)
+    if session is not None:
+        session.info.setdefault("job_index_updates", {})[job.id] = Job.index_document(
+            job.id, job.title, job.description, job.experience_level,
+            job.budget, job.post_time)
+
+
+@event.listens_for(Job, "after_delete")
+def _queue_job_index_delete(mapper, connection, job):
+    session = object_session(job)
+    if session is not None:
+        session.info.setdefault("job_index_updates", {})[job.id] = None
+
+
+@event.listens_for(Session, "after_commit")
+def _apply_job_index_updates(session):
+    for job_id, document in session.info.pop("job_index_updates", {}).items():
+        if document is None:
+            Job.search_index.remove(job_id)
+        else:
+            Job.search_index.add(*document)
+
+
+@event.listens_for(Session, "after_rollback")
+def _discard_job_index_updates(session):
+    session.info.pop("job_index_updates", None)
+
+
+@event.listens_for(Session, "after_commit")
+def _clear_user_cache(session):
+    if has_app_context():
+        g.pop("user_cache", None)
+
+
 class Contract(db.Model):
     """Contract is created when worker and job poster reach on agreement
 
     Parameters:
         id (str): unique contract id
         job_id (str): the job id
-        worker_id (str): the freelancer id
+        worker_id (int): the freelancer id
         deadline (datetime): last date for work submission
         status (string): accepted or rejected by the worker
 
@@ -452,9 +1043,9 @@ class Contract(db.Model):
     be refunded to job owner`
     """
 
-    id = db.Column(db.String(36), primary_key=True)
-    job_id = db.Column(db.String(36), db.ForeignKey(Job.id))
-    worker_id = db.Column(db.String(36), db.ForeignKey(User.id))
+    id = db.Column(BinaryUUID, primary_key=True, default=new_id)
+    job_id = db.Column(BinaryUUID, db.ForeignKey(Job.id))
+    worker_id = db.Column(db.Integer, db.ForeignKey(User.id))
     deadline = db.Column(db.DateTime)
     status = db.Column(db.String(1))
 
@@ -463,6 +1054,12 @@ class Contract(db.Model):
     worker = db.relationship(User, backref='contracts',
                              foreign_keys=[worker_id])
 
+    __table_args__ = (
+        db.Index('ix_contract_status_deadline', 'status', 'deadline'),
+        db.Index('ix_contract_job_id_worker_id_status',
+                 'job_id', 'worker_id', 'status'),
+    )
+
     @staticmethod
     def get(contract_id: str) -> Optional[User]:
         """Gets user by id
@@ -476,6 +1073,53 @@ class Contract(db.Model):
 
         return Contract.query.filter_by(id=contract_id).first()
 
+    @staticmethod
+    def get_for_update(contract_id: str) -> Optional[Contract]:
+        """Gets contract and locks it until the transaction ends, an already
+        loaded contract object is refreshed with the locked row
+
+        Args:
+            contract_id (str): contract id
+
+        Returns:
+            Contract: contract object if contract is found, None otherwise
+        """
+
+        return Contract.query.filter_by(id=contract_id)\
+            .with_for_update()\
+            .populate_existing()\
+            .first()
+
+    @staticmethod
+    def get_expired(before: datetime, limit: int) -> list[tuple[str, str, int]]:
+        """Gets contracts that are still open past their deadline and locks
+        them, contracts locked by other transactions are skipped. Contracts
+        with work submitted before their deadline are left for the job owner
+        to review.
+
+        Args:
+            before (datetime): deadlines earlier than this are expired
+            limit (int): maximum number of contracts to return
+
+        Returns:
+            list: list of (contract id, escrow id, job owner id) tuples,
+                earliest deadline first
+        """
+
+        return db.session.query(Contract.id, Escrow.id, Job.owner_id)\
+            .join(Escrow, Escrow.contract_id == Contract.id)\
+            .join(Job, Contract.job_id == Job.id)\
+            .filter(db.or_(Contract.status.in_([ContractStatus.ACCEPTED,
+                                                ContractStatus.PENDING_CANCEL]),
+                           Contract.status == None),
+                    Contract.deadline < before,
+                    ~db.exists().where(Work.contract_id == Contract.id,
+                                       Work.submission_date <= Contract.deadline))\
+            .order_by(Contract.deadline, Contract.id)\
+            .limit(limit)\
+            .with_for_update(of=Contract, skip_locked=True)\
+            .all()
+
     def already_exists(job_id, worker_id):
         try:
             contract = Contract.query.filter(Contract.job_id == job_id,
@@ -497,17 +1141,25 @@ class Escrow(db.Model):
     Parameters:
         id (str): unique escrow id
         contract_id (str): the contract id
-        amount (float): amount (in ETB) to be trasfered to worker when contract is fullfilled
+        amount_minor (int): amount (in santim) to be trasfered to worker when contract is fullfilled
+        balance_minor (int): amount (in santim) currently held, changed only through Ledger
         date_of_initiation (datetime): date when escrow was funded
     """
 
-    id = db.Column(db.String(36), primary_key=True)
-    contract_id = db.Column(db.String(36), db.ForeignKey(Contract.id))
-    amount = db.Column(db.Float)
+    id = db.Column(BinaryUUID, primary_key=True, default=new_id)
+    contract_id = db.Column(BinaryUUID, db.ForeignKey(Contract.id), index=True)
+    amount_minor = db.Column(db.BigInteger, nullable=False)
+    balance_minor = db.Column(db.BigInteger, nullable=False, default=0)
     date_of_initiation = db.Column(db.DateTime, default=datetime.now)
 
     contract = db.relationship(Contract, backref='escrow', uselist=False)
 
+    @property
+    def amount(self) -> Decimal:
+        """Gets the amount (in ETB) to be trasfered to worker"""
+
+        return Currency.from_minor(self.amount_minor)
+
     @staticmethod
     def get(escrow_id: str) -> Optional[Escrow]:
         """Gets escrow by id
@@ -525,6 +1177,155 @@ class Escrow(db.Model):
         return f"Escrow(id={self.id}, contract={self.contract_id}, amount={self.amount})"
 
 
+class PaymentEvent(db.Model):
+    """PaymentEvent records a deposit made through the payment provider.
+    Provider callbacks only queue the event, it is verified and credited
+    to the user exactly once by the payment processor.
+
+    Parameters:
+        id (int): unique event id
+        tx_ref (str): transaction reference the payment was initialized with
+        user_id (int): id of user depositing the money
+        amount_minor (int): requested amount (in santim), replaced by the
+            verified amount when the event is credited
+        status (str): one of PaymentEventStatus
+        attempts (int): number of failed verification attempts
+        created_at (datetime): date the payment was initialized or first reported
+        processed_at (datetime): date the event was credited or given up on
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    tx_ref = db.Column(db.String(100), nullable=False, unique=True)
+    user_id = db.Column(db.Integer, db.ForeignKey(User.id))
+    amount_minor = db.Column(db.BigInteger)
+    status = db.Column(db.String(1), nullable=False,
+                       default=PaymentEventStatus.PENDING)
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    created_at = db.Column(db.DateTime, default=datetime.now)
+    processed_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_payment_event_status_id', 'status', 'id'),
+    )
+
+    @staticmethod
+    def get(tx_ref: str) -> Optional[PaymentEvent]:
+        """Gets payment event by transaction reference
+
+        Args:
+            tx_ref (str): transaction reference
+
+        Returns:
+            PaymentEvent: payment event if it is found, None otherwise
+        """
+
+        return PaymentEvent.query.filter_by(tx_ref=tx_ref).first()
+
+    @staticmethod
+    def enqueue(tx_ref: str) -> bool:
+        """Queues payment for verification, repeated calls for the same
+        transaction while it is queued or after it is credited have no effect.
+        Commits the session.
+
+        Args:
+            tx_ref (str): transaction reference
+
+        Returns:
+            bool: True if payment was queued by this call, False otherwise
+        """
+
+        queued = db.session.execute(
+            db.update(PaymentEvent)
+            .where(PaymentEvent.tx_ref == tx_ref,
+                   PaymentEvent.status.in_([PaymentEventStatus.INITIATED,
+                                            PaymentEventStatus.FAILED]))
+            .values(status=PaymentEventStatus.PENDING, attempts=0, processed_at=None)
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+        if not queued and not db.session.query(
+                db.exists().where(PaymentEvent.tx_ref == tx_ref)).scalar():
+            db.session.add(PaymentEvent(tx_ref=tx_ref,
+                                        status=PaymentEventStatus.PENDING))
+            queued = 1
+
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # concurrent callback for the same transaction inserted it first
+            db.session.rollback()
+            return False
+
+        return bool(queued)
+
+    @staticmethod
+    def get_pending(limit: int, after_id: int = 0) -> list[PaymentEvent]:
+        """Gets events waiting for verification in the order they were created
+
+        Args:
+            limit (int): maximum number of events to return
+            after_id (int): only events with greater id are returned
+
+        Returns:
+            list: list of PaymentEvent objects
+        """
+
+        return PaymentEvent.query.filter(PaymentEvent.status == PaymentEventStatus.PENDING,
+                                         PaymentEvent.id > after_id)\
+            .order_by(PaymentEvent.id).limit(limit).all()
+
+    def __repr__(self):
+        return f"PaymentEvent(tx_ref={self.tx_ref}, status={self.status}, amount={self.amount_minor})"
+
+
+class LedgerEntry(db.Model):
+    """LedgerEntry records one side of a money movement. Every transfer
+    writes entries whose amounts sum up to zero, balances stored on users
+    and escrows are the sums of their entries.
+
+    Parameters:
+        id (int): unique entry id
+        transfer_id (str): id shared by entries of the same transfer
+        account_type (str): one of LedgerAccountType
+        account_id (str): id of user, escrow or payment provider
+        amount (int): signed amount (in santim) added to the account
+        kind (str): one of LedgerEntryKind
+        reference (str): id of payment or contract the transfer belongs to
+        created_at (datetime): date of the transfer
+    """
+
+    id = db.Column(db.Integer, primary_key=True)
+    transfer_id = db.Column(db.String(36), nullable=False, index=True)
+    account_type = db.Column(db.String(10), nullable=False)
+    account_id = db.Column(db.String(36), nullable=False)
+    amount = db.Column(db.BigInteger, nullable=False)
+    kind = db.Column(db.String(20), nullable=False)
+    reference = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.now)
+
+    __table_args__ = (
+        db.Index('ix_ledger_entry_account', 'account_type', 'account_id', 'id'),
+    )
+
+    @staticmethod
+    def get_account_entries(account_type: str, account_id) -> list[LedgerEntry]:
+        """Gets entries of an account, oldest first
+
+        Args:
+            account_type (str): one of LedgerAccountType
+            account_id (str): id of the account
+
+        Returns:
+            list: list of LedgerEntry objects
+        """
+
+        return LedgerEntry.query.filter_by(account_type=account_type, account_id=str(account_id))\
+            .order_by(LedgerEntry.id).all()
+
+    def __repr__(self):
+        return f"LedgerEntry(account={self.account_type}:{self.account_id}, amount={self.amount}, kind={self.kind})"
+
+
 class Proposal(db.Model):
     """Proposal is created when worker applies for a job
 
@@ -537,9 +1338,9 @@ class Proposal(db.Model):
     """
 
     worker_id = db.Column(db.Integer, db.ForeignKey(User.id), primary_key=True)
-    job_id = db.Column(db.String(36), db.ForeignKey(Job.id), primary_key=True)
+    job_id = db.Column(BinaryUUID, db.ForeignKey(Job.id), primary_key=True)
     attachment_id = db.Column(
-        db.String(36), db.ForeignKey(Attachment.id))
+        BinaryUUID, db.ForeignKey(Attachment.id))
     content = db.Column(db.String(500))
     sent_time = db.Column(db.DateTime, default=datetime.now)
 
@@ -549,6 +1350,24 @@ class Proposal(db.Model):
                              foreign_keys=[worker_id])
     attachments = db.relationship(Attachment, foreign_keys=[attachment_id])
 
+    __table_args__ = (
+        db.Index('ix_proposal_job_id_sent_time', 'job_id', 'sent_time'),
+    )
+
+    @staticmethod
+    def get_by_job(job_id: str) -> list[Proposal]:
+        """Gets proposals sent for a job, oldest first
+
+        Args:
+            job_id (str): job id
+
+        Returns:
+            list: list of Proposal objects
+        """
+
+        return Proposal.query.filter(Proposal.job_id == job_id)\
+            .order_by(Proposal.sent_time).all()
+
 
 class Work(db.Model):
     """Work is created when worker submits a completed work for a contract
@@ -561,11 +1380,11 @@ class Work(db.Model):
     """
 
     id = db.Column(
-        db.Integer, primary_key=True)
+        BinaryUUID, primary_key=True, default=new_id)
     contract_id = db.Column(
-        db.String(36), db.ForeignKey(Contract.id))
+        BinaryUUID, db.ForeignKey(Contract.id))
     attachment_id = db.Column(
-        db.String(36), db.ForeignKey(Attachment.id))
+        BinaryUUID, db.ForeignKey(Attachment.id))
     submission_date = db.Column(
         db.DateTime, default=datetime.now, primary_key=True)
 
@@ -574,6 +1393,11 @@ class Work(db.Model):
     attachment = db.relationship(Attachment, foreign_keys=[
                                  attachment_id], uselist=True)
 
+    __table_args__ = (
+        db.Index('ix_work_contract_id_submission_date',
+                 'contract_id', 'submission_date'),
+    )
+
 
 # class UserBalance(db.Model):
 #     """Represents user balance in the system
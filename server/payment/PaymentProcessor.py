@@ -0,0 +1,175 @@
+import logging
+import threading
+from datetime import datetime
+from typing import Optional
+
+from flask import Flask
+
+from ledger import Ledger
+from model import Currency, PaymentEvent, PaymentEventStatus, User, db
+from payment_gateway import ChapaPaymentHandler
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentProcessor:
+    """
+    Verifies queued payment events in the background and credits each
+    verified payment exactly once
+
+    Events are handled in batches: transactions of a batch are verified
+    concurrently and all resulting balance updates are committed together.
+    An event is credited only if it is still pending when it is claimed, so
+    repeated callbacks and processors running in other workers cannot credit
+    it twice. Every event is credited within a savepoint, an event that
+    fails is rolled back alone and retried until max_attempts.
+
+    Parameters:
+        payment_handler (ChapaPaymentHandler): handler used to verify transactions
+        batch_size (int): maximum number of events handled per commit (default is 50)
+        interval (float): seconds between retries of events that could not
+            be verified (default is 30)
+        max_attempts (int): verification attempts before event is marked
+            as failed (default is 5)
+    """
+
+    def __init__(self, payment_handler: ChapaPaymentHandler, batch_size: int = 50,
+                 interval: float = 30, max_attempts: int = 5):
+        self.payment_handler = payment_handler
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max_attempts
+
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+
+    def wake(self, app: Flask) -> None:
+        """
+        Starts processing queued events, starts the worker on first call
+
+        Args:
+            app (Flask): application the worker runs in
+        """
+
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, args=(app,),
+                                                name='payment-processor', daemon=True)
+                self._worker.start()
+
+        self._wakeup.set()
+
+    def _run(self, app: Flask) -> None:
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+            try:
+                with app.app_context():
+                    self.process_pending()
+            except Exception:
+                logger.exception('Failed to process payment events')
+
+    def process_pending(self) -> None:
+        """Processes every event that is pending when the call starts"""
+
+        after_id = 0
+        while after_id is not None:
+            after_id = self.process_batch(after_id)
+
+    def process_batch(self, after_id: int = 0) -> Optional[int]:
+        """
+        Verifies and credits one batch of pending events and commits it
+
+        Args:
+            after_id (int): only events with greater id are processed
+
+        Returns:
+            int: id of last processed event, None if there was nothing to process
+        """
+
+        events = PaymentEvent.get_pending(self.batch_size, after_id)
+        if not events:
+            return None
+
+        tx_refs = [event.tx_ref for event in events]
+
+        # end read transaction while waiting for the payment provider, the
+        # references are taken first as reading expired attributes would
+        # begin a new one
+        db.session.commit()
+
+        futures = [(event, self.payment_handler.verify_async(tx_ref))
+                   for event, tx_ref in zip(events, tx_refs)]
+
+        for event, future in futures:
+            verified, data = future.result()
+
+            # an event failing to be credited is rolled back on its own and
+            # counted as failed attempt, it does not hold up the batch
+            try:
+                with db.session.begin_nested():
+                    credited = verified and data and self._credit(event, data)
+            except Exception:
+                logger.exception('Failed to credit payment %s', event.tx_ref)
+                credited = False
+
+            if not credited:
+                self._retry(event)
+
+        db.session.commit()
+        return events[-1].id
+
+    def _credit(self, event: PaymentEvent, data: dict) -> bool:
+        try:
+            amount = Currency.to_minor(data['amount'])
+        except (KeyError, TypeError, ValueError):
+            return False
+
+        if amount <= 0:
+            return False
+
+        user_id = event.user_id
+        if user_id is None:
+            user = User.get_by_email(data.get('email'))
+            if user is None:
+                return False
+            user_id = user.id
+
+        claimed = db.session.execute(
+            db.update(PaymentEvent)
+            .where(PaymentEvent.id == event.id,
+                   PaymentEvent.status == PaymentEventStatus.PENDING)
+            .values(status=PaymentEventStatus.CREDITED, user_id=user_id,
+                    amount_minor=amount, processed_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+        if claimed:
+            Ledger.deposit(user_id, amount, event.tx_ref)
+
+        return True
+
+    def _retry(self, event: PaymentEvent) -> None:
+        # events credited by another processor meanwhile are left untouched
+        pending = db.and_(PaymentEvent.id == event.id,
+                          PaymentEvent.status == PaymentEventStatus.PENDING)
+
+        db.session.execute(
+            db.update(PaymentEvent)
+            .where(pending)
+            .values(attempts=PaymentEvent.attempts + 1)
+            .execution_options(synchronize_session=False)
+        )
+
+        failed = db.session.execute(
+            db.update(PaymentEvent)
+            .where(pending, PaymentEvent.attempts >= self.max_attempts)
+            .values(status=PaymentEventStatus.FAILED, processed_at=datetime.now())
+            .execution_options(synchronize_session=False)
+        ).rowcount
+
+        if failed:
+            logger.warning('Giving up on payment %s after %d attempts',
+                           event.tx_ref, self.max_attempts)
@@ -1 +1,2 @@
-from .payment import payment_bp
\ No newline at end of file
+from .payment import payment_bp
+from .PaymentProcessor import PaymentProcessor
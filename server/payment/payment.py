@@ -1,12 +1,13 @@
 import os
-from flask import Blueprint, render_template, request, jsonify, make_response, redirect, url_for, flash
+from flask import Blueprint, render_template, request, jsonify, make_response, redirect, url_for, flash, current_app
 from flask_login import login_required, current_user
 from sqlalchemy.exc import IntegrityError
 
 from uuid import uuid4
 from utils import FileManager
-from model import User, Job, UserType, Proposal, Attachment, File, db
+from model import User, Job, UserType, Proposal, Attachment, File, Currency, PaymentEvent, PaymentEventStatus, db
 from payment_gateway import ChapaPaymentHandler
+from .PaymentProcessor import PaymentProcessor
 
 
 payment_bp = Blueprint('payment_bp', __name__,
@@ -15,7 +16,9 @@ payment_bp = Blueprint('payment_bp', __name__,
 file_mgr = FileManager(os.getenv('UPLOAD_FOLDER'))
 
 payment_handler: ChapaPaymentHandler = ChapaPaymentHandler(
-    os.getenv('CHAPA_SECRET_KEY'))
+    os.getenv('CHAPA_SECRET_KEY'), base_url=os.getenv('CHAPA_BASE_URL'))
+
+payment_processor = PaymentProcessor(payment_handler)
 
 
 @payment_bp.route("/", methods=["POST"])
@@ -39,6 +42,9 @@ def deposite():
     })
 
     if checkout_url:
+        db.session.add(PaymentEvent(tx_ref=ref, user_id=current_user.id, amount_minor=Currency.to_minor(amount),
+                                    status=PaymentEventStatus.INITIATED))
+        db.session.commit()
         return redirect(checkout_url)
     return redirect(url_for('finance'))
 
@@ -47,14 +53,15 @@ def deposite():
 def verify_transaction():
     trx_ref = request.args.get("trx_ref")
 
-    if payment_handler.verify_transaction(trx_ref):
-        data = payment_handler.get_transaction_data(trx_ref)
-        user = User.get_by_email(data['email'])
-        user.balance += data["amount"]
-        db.session.commit()
+    if not trx_ref:
+        return jsonify(False)
+
+    # verification and crediting happen on the payment processor, repeated
+    # callbacks for the same transaction are collapsed by the event table
+    PaymentEvent.enqueue(trx_ref)
+    payment_processor.wake(current_app._get_current_object())
 
-        return jsonify(True)
-    return jsonify(False)
+    return jsonify(True)
 
 
 # @payment_bp.route("/escrow", method=["POST"])
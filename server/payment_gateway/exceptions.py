@@ -9,11 +9,11 @@ class InsufficientBalance(TransactionException):
     """Balance is insufficient for specified transaction."""
 
     def __init__(self, message="Balance is insufficient for specified transaction."):
-        super().__init__(self, message)
+        super().__init__(message)
 
 
 class InvalidCurrency(TransactionException):
     """Unsupported currency"""
 
     def __init__(self, message="Unsupported currency"):
-        super().__init__(self, message)
+        super().__init__(message)
@@ -1,5 +1,9 @@
 from abc import ABC, abstractmethod
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from .exceptions import *
 
 
@@ -34,21 +38,53 @@ class ChapaPaymentHandler(PaymentHandler):
     API_VERSION = 'v1'
 
     BASE_URL = 'https://api.chapa.co'
-    PAYMENT_URL = f'{BASE_URL}/{API_VERSION}/transaction/initialize'
-    VERIFICATION_URL = f'{BASE_URL}/{API_VERSION}/transaction/verify'
-    TRANSFER_URL = f'{BASE_URL}/{API_VERSION}/transfers'
 
-    def __init__(self, secret_key, use_sandbox=True):
+    # (connect, read) timeouts in seconds
+    TIMEOUT = (3.05, 15)
+
+    def __init__(self, secret_key, use_sandbox=True, base_url: Optional[str] = None,
+                 timeout: tuple = TIMEOUT, retries: int = 3, backoff_factor: float = 0.5,
+                 pool_size: int = 10):
         """
         Args:
             secret_key (str): secret key provided by Chapa            
             use_sandbox (bool): initializes payment handler in test/production mode
                 (default is True (test mode))
+            base_url (str): url of Chapa API, e.g. of a local stand-in server
+                (default is BASE_URL)
+            timeout (tuple): (connect, read) timeouts in seconds
+            retries (int): maximum number of retries of a failed request
+            backoff_factor (float): base of the exponential delay between retries in seconds
+            pool_size (int): maximum number of kept alive connections
         """
 
         PaymentHandler.__init__(self, use_sandbox=use_sandbox)
 
         self.headers = {'Authorization': f'Bearer {secret_key}'}
+        self.timeout = timeout
+
+        base_url = (base_url or self.BASE_URL).rstrip('/')
+        self.PAYMENT_URL = f'{base_url}/{self.API_VERSION}/transaction/initialize'
+        self.VERIFICATION_URL = f'{base_url}/{self.API_VERSION}/transaction/verify'
+        self.TRANSFER_URL = f'{base_url}/{self.API_VERSION}/transfers'
+        self.BANKS_URL = f'{base_url}/{self.API_VERSION}/banks'
+
+        # connection errors are retried for every request, read errors and
+        # gateway errors only for idempotent GET requests
+        retry = Retry(total=retries, connect=retries, read=retries, status=retries,
+                      backoff_factor=backoff_factor,
+                      status_forcelist=(429, 502, 503, 504),
+                      allowed_methods=frozenset(['GET']),
+                      raise_on_status=False)
+        adapter = HTTPAdapter(max_retries=retry,
+                              pool_connections=pool_size, pool_maxsize=pool_size)
+
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        self._executor: Optional[ThreadPoolExecutor] = None
 
     def __validate_data(self, data: dict) -> None:
         """Raises TransactionException if supplied data is not complient with
@@ -79,44 +115,74 @@ class ChapaPaymentHandler(PaymentHandler):
         except TypeError:
             raise TransactionException("amount must be valid number")
 
-    def generate_checkout_url(self, data: dict) -> str:
+    def generate_checkout_url(self, data: dict) -> Optional[str]:
         """Generates checkout url that users can use for payment
 
         Args:
             data (dict): transaction data as key value pairs expected by Chapa API
 
         Returns:
-            str: checkout url
+            str: checkout url, None if Chapa refused the transaction or could not be reached
         """
 
         self.__validate_data(data)
 
-        response = requests.post(self.PAYMENT_URL,
-                                 data=data, headers=self.headers)
-
-        response_json = response.json()
-        print(response_json)
+        try:
+            response = self.session.post(self.PAYMENT_URL, data=data,
+                                         timeout=self.timeout)
+            response_json = response.json()
+        except (requests.RequestException, ValueError):
+            return None
 
-        if response_json['status'] == 'success':
+        if response_json.get('status') == 'success':
             return response_json['data']['checkout_url']
 
-    def verify_transaction(self, transaction_reference: str) -> bool:
-        response = requests.get(
-            f"{self.VERIFICATION_URL}/{transaction_reference}", headers=self.headers)
+    def verify(self, transaction_reference: str) -> tuple[bool, Optional[dict]]:
+        """Verifies transaction with a single request to Chapa
 
-        try:
-            return response.json()["status"] == "success"
-        except:
-            return False
+        Args:
+            transaction_reference (str): tx_ref the transaction was initialized with
 
-    def get_transaction_data(self, transaction_reference: str) -> bool:
-        response = requests.get(
-            f"{self.VERIFICATION_URL}/{transaction_reference}", headers=self.headers)
+        Returns:
+            tuple: whether the transaction succeeded and the transaction data
+                (None if it is unavailable)
+        """
 
         try:
-            return response.json()['data']
-        except:
-            return False
+            response = self.session.get(
+                f"{self.VERIFICATION_URL}/{transaction_reference}", timeout=self.timeout)
+            response_json = response.json()
+        except (requests.RequestException, ValueError):
+            return False, None
+
+        if not isinstance(response_json, dict):
+            return False, None
+
+        return response_json.get("status") == "success", response_json.get("data")
+
+    def verify_async(self, transaction_reference: str) -> Future:
+        """Verifies transaction on a worker thread so the caller is not blocked
+        while Chapa responds
+
+        Args:
+            transaction_reference (str): tx_ref the transaction was initialized with
+
+        Returns:
+            Future: resolves to the (verified, data) tuple returned by verify
+        """
+
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(
+                max_workers=4, thread_name_prefix='chapa')
+
+        return self._executor.submit(self.verify, transaction_reference)
+
+    def verify_transaction(self, transaction_reference: str) -> bool:
+        return self.verify(transaction_reference)[0]
+
+    def get_transaction_data(self, transaction_reference: str) -> bool:
+        data = self.verify(transaction_reference)[1]
+        return data if data is not None else False
 
     def send_payment(self, data: dict):
         """
@@ -126,13 +192,12 @@ class ChapaPaymentHandler(PaymentHandler):
         if self.use_sandbox:
             return True
 
-        response = requests.post(
-            self.TRANSFER_URL, data=data, headers=self.headers)
+        response = self.session.post(
+            self.TRANSFER_URL, data=data, timeout=self.timeout)
         return response.text
 
     def _get_banks(self):
-        response = requests.get(
-            "https://api.chapa.co/v1/banks", headers=self.headers)
+        response = self.session.get(self.BANKS_URL, timeout=self.timeout)
         return response.json()
 
 
@@ -1,11 +1,10 @@
 import os
-from uuid import uuid4
 from flask import Blueprint, render_template, request, jsonify, make_response, redirect, url_for, flash
 from flask_login import login_required, current_user
 from sqlalchemy.exc import IntegrityError
 
-from utils import FileManager
-from model import User, Job, UserType, Proposal, Attachment, File, db
+from utils import FileManager, FileLoader
+from model import User, Job, UserType, Proposal, Attachment, File, FileAccess, FileAccessScope, db, new_id
 
 
 proposal_bp = Blueprint('proposal_bp', __name__,
@@ -14,38 +13,61 @@ proposal_bp = Blueprint('proposal_bp', __name__,
 file_mgr = FileManager(os.getenv('UPLOAD_FOLDER'))
 
 
+def proposals_json(proposals: list[Proposal]) -> list[dict]:
+    """Serializes proposals resolving all attached files with one query
+
+    Args:
+        proposals (list): list of Proposal objects
+
+    Returns:
+        list: list of proposal data
+    """
+
+    attachment_ids = {proposal.attachment_id for proposal in proposals
+                      if proposal.attachment_id}
+
+    file_ids = {}
+    if attachment_ids:
+        for attachment in Attachment.query.filter(Attachment.id.in_(attachment_ids)):
+            file_ids.setdefault(attachment.id, []).append(attachment.file_id)
+
+    file_loader = FileLoader.current()
+    file_loader.prime(file_id for ids in file_ids.values() for file_id in ids)
+
+    result = []
+    for proposal in proposals:
+        files = file_loader.get_many(file_ids.get(proposal.attachment_id, []))
+        files = [
+            {
+                "file_name": file.file_name,
+                "file_link": url_for('files', id=file.id),
+                "preview_link": url_for('file_preview', id=file.id)
+                if file_mgr.has_preview(file) else None
+            }
+            for file in files if file
+        ]
+        result.append(
+            {
+                "job_id": proposal.job_id,
+                "sent_time": proposal.sent_time,
+                "content": proposal.content,
+                "files": files
+            }
+        )
+
+    return result
+
+
 @proposal_bp.route("/")
 @login_required
 def get_my_proposals():
-
-    proposals = []
-
     if current_user.user_type == UserType.FREELANCER:
-        for proposal in current_user.proposals:
-            files = []
-            if proposal.attachments:
-                file_ids = [
-                    attachment.file_id for attachment in proposal.attachments]
-
-                files = map(File.get, file_ids)
-                files = [
-                    {
-                        "file_name": file.file_name,
-                        "file_link": url_for('files', id=file.id)
-                    }
-                    for file in files
-                ]
-            proposals.append(
-                {
-                    "job_id": proposal.job_id,
-                    "sent_time": proposal.sent_time,
-                    "content": proposal.content,
-                    "files": files
-                }
-            )
+        proposals = Proposal.query.filter(
+            Proposal.worker_id == current_user.id
+        ).all()
 
         response = make_response(
-            jsonify(proposals),
+            jsonify(proposals_json(proposals)),
             200
         )
         response.headers["Content-Type"] = "application/json"
@@ -69,31 +91,10 @@ def get_job_proposals(job_id):
             Job.id == job_id
         ).one()
 
-        proposals = []
-
-        for proposal in job.proposals:
-            file_ids = [
-                attachment.file_id for attachment in proposal.attachments]
-
-            files = map(File.get, file_ids)
-            files = [
-                {
-                    "file_name": file.file_name,
-                    "file_link": url_for('files', id=file.id)
-                }
-                for file in files
-            ]
-            proposals.append(
-                {
-                    "job_id": proposal.job_id,
-                    "sent_time": proposal.sent_time,
-                    "content": proposal.content,
-                    "files": files
-                }
-            )
+        proposals = Proposal.get_by_job(job.id)
 
         response = make_response(
-            jsonify(proposals),
+            jsonify(proposals_json(proposals)),
             200
         )
         response.headers["Content-Type"] = "application/json"
@@ -122,13 +123,16 @@ def send_proposal():
     if job:
         attachment_id = None
 
-        file_id = None
         if attachment:
-            file_id = file_mgr.save(attachment)
+            # file rows are only added to the session, a rejected proposal
+            # leaves none of them behind
+            file_id, = file_mgr.save_many([attachment], owner_id=current_user.id)
 
-            attachment_id = uuid4()
-            new_attachement = Attachment(id=attachment_id, file_id=file_id)
-            db.session.add(new_attachement)
+            attachment_id = new_id()
+            db.session.add(Attachment(id=attachment_id, file_id=file_id))
+            # file is new, no access was granted before
+            db.session.add(FileAccess(file_id=file_id, scope_type=FileAccessScope.PROPOSAL,
+                                      scope_id=FileAccess.proposal_scope(job_id, current_user.id)))
 
         new_proposal = Proposal(
             worker_id=current_user.id,
@@ -140,11 +144,13 @@ def send_proposal():
         try:
             db.session.add(new_proposal)
             db.session.commit()
-            return render_template("proposal_response.html", status=200, job=job)
         except IntegrityError:
             db.session.rollback()
             return render_template("proposal_response.html", message="You have already submitted proposal for this job.", status=400)
 
+        file_mgr.process_saved()
+        return render_template("proposal_response.html", status=200, job=job)
+
     return render_template("proposal_response.html", message="Contract already exists.", status=400)
 
 
@@ -0,0 +1,345 @@
+import bisect
+import math
+import re
+import threading
+import time
+from typing import Any, Callable, Iterable, Optional
+
+
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+STOP_WORDS = frozenset("""
+a an and are as at be by for from has have in is it its of on or that the
+this to was were will with we you your i our
+""".split())
+
+# (suffix, replacement, minimum stem length) applied longest match first
+SUFFIX_RULES = (
+    ("ational", "ate", 2), ("tional", "tion", 2), ("ization", "ize", 2),
+    ("fulness", "ful", 2), ("ousness", "ous", 2), ("iveness", "ive", 2),
+    ("ations", "ate", 2), ("ation", "ate", 2), ("ments", "", 3),
+    ("ment", "", 3), ("ness", "", 3), ("ities", "", 3), ("ity", "", 3),
+    ("ings", "", 3), ("ing", "", 3), ("ies", "y", 2), ("ied", "y", 2),
+    ("edly", "", 3), ("ers", "", 3), ("er", "", 3), ("ed", "", 3),
+    ("ly", "", 3), ("es", "", 3), ("s", "", 3),
+)
+
+
+def stem(word: str) -> str:
+    """Reduces word to its stem using a light suffix stripping stemmer
+
+    Args:
+        word (str): lower case word
+
+    Returns:
+        str: stem of the word
+    """
+
+    if len(word) <= 3 or word.isdigit():
+        return word
+
+    for suffix, replacement, min_stem in SUFFIX_RULES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= min_stem:
+            if suffix == "s" and word.endswith("ss"):
+                return word
+            word = word[:-len(suffix)] + replacement
+            break
+
+    # developp -> develop, runn -> run
+    if len(word) > 3 and word[-1] == word[-2] and word[-1] not in "lsz":
+        word = word[:-1]
+
+    return word
+
+
+def tokenize(text: Optional[str]) -> list[str]:
+    """Splits text into stemmed, stop word free terms
+
+    Args:
+        text (str): text to tokenize
+
+    Returns:
+        list: list of terms
+    """
+
+    if not text:
+        return []
+
+    return [stem(token) for token in TOKEN_PATTERN.findall(text.lower())
+            if token not in STOP_WORDS]
+
+
+class _Documents:
+    """Documents of a SearchIndex with their postings, replaced as a whole
+    when the index is rebuilt"""
+
+    def __init__(self):
+        self.postings: dict[str, dict[Any, int]] = {}
+        self.doc_terms: dict[Any, dict[str, int]] = {}
+        self.doc_lengths: dict[Any, int] = {}
+        self.attributes: dict[Any, dict] = {}
+        self.total_length = 0
+        self._sorted_terms: Optional[list[str]] = None
+
+    def add(self, doc_id: Any, fields: list[tuple[str, int]], attributes: Optional[dict]) -> None:
+        self.remove(doc_id)
+
+        terms: dict[str, int] = {}
+        for text, weight in fields:
+            for term in tokenize(text):
+                terms[term] = terms.get(term, 0) + weight
+
+        for term, frequency in terms.items():
+            postings = self.postings.get(term)
+            if postings is None:
+                postings = self.postings[term] = {}
+                self._sorted_terms = None
+            postings[doc_id] = frequency
+
+        length = sum(terms.values())
+        self.doc_terms[doc_id] = terms
+        self.doc_lengths[doc_id] = length
+        self.attributes[doc_id] = attributes or {}
+        self.total_length += length
+
+    def remove(self, doc_id: Any) -> None:
+        terms = self.doc_terms.pop(doc_id, None)
+        if terms is None:
+            return
+
+        for term in terms:
+            postings = self.postings.get(term)
+            if postings is None:
+                continue
+            postings.pop(doc_id, None)
+            if not postings:
+                del self.postings[term]
+                self._sorted_terms = None
+
+        self.total_length -= self.doc_lengths.pop(doc_id)
+        del self.attributes[doc_id]
+
+    def terms_starting_with(self, prefix: str) -> list[str]:
+        """Gets indexed terms starting with prefix
+
+        Args:
+            prefix (str): lower case prefix
+
+        Returns:
+            list: list of terms
+        """
+
+        if self._sorted_terms is None:
+            self._sorted_terms = sorted(self.postings)
+
+        start = bisect.bisect_left(self._sorted_terms, prefix)
+        end = bisect.bisect_left(self._sorted_terms, prefix + "\uffff", start)
+        return self._sorted_terms[start:end]
+
+
+class SearchIndex:
+    """
+    In memory inverted index ranking documents with Okapi BM25
+
+    Query words also match indexed terms they are a prefix of, such matches
+    score prefix_weight of an exact match. The index is rebuilt outside of
+    its lock and swapped in once complete, searches keep using the previous
+    index meanwhile and changes made during the rebuild are applied to both.
+
+    Parameters:
+        k1 (float): term frequency saturation
+        b (float): document length normalization
+        max_age (int): seconds after which the index is rebuilt from the loader
+            so that writes made by other processes become visible (default is 300)
+        prefix_weight (float): weight of prefix matches (default is 0.5)
+        min_prefix (int): shortest query word matched as prefix (default is 3)
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75, max_age: int = 300,
+                 prefix_weight: float = 0.5, min_prefix: int = 3):
+        self.k1 = k1
+        self.b = b
+        self.max_age = max_age
+        self.prefix_weight = prefix_weight
+        self.min_prefix = min_prefix
+
+        self._lock = threading.RLock()
+        self._build_lock = threading.Lock()
+        self._loader: Optional[Callable[[], Iterable[tuple]]] = None
+        self._loaded_at: Optional[float] = None
+        self._documents = _Documents()
+        # changes made while a rebuild runs, replayed on the rebuilt index
+        self._changes: Optional[list[tuple]] = None
+
+    def set_loader(self, loader: Callable[[], Iterable[tuple]]) -> None:
+        """Registers callable used to (re)build the index
+
+        Args:
+            loader (callable): returns iterable of (doc_id, fields, attributes)
+                tuples where fields is a list of (text, weight) pairs
+        """
+
+        self._loader = loader
+        self._loaded_at = None
+
+    def ensure_loaded(self) -> None:
+        """Builds the index on first use and rebuilds it once it is older than max_age
+
+        The first build blocks searches until it completes. Later rebuilds
+        run in the calling thread while other threads search the previous
+        index, only one rebuild runs at a time.
+        """
+
+        if self._loader is None or not self._is_stale():
+            return
+
+        first_build = self._loaded_at is None
+        if not self._build_lock.acquire(blocking=first_build):
+            # another thread is rebuilding, the previous index is still usable
+            return
+
+        try:
+            if self._is_stale():
+                self._rebuild()
+        finally:
+            self._build_lock.release()
+
+    def _is_stale(self) -> bool:
+        return self._loaded_at is None or time.monotonic() - self._loaded_at >= self.max_age
+
+    def _rebuild(self) -> None:
+        with self._lock:
+            self._changes = []
+
+        try:
+            documents = _Documents()
+            for doc_id, fields, attributes in self._loader():
+                documents.add(doc_id, fields, attributes)
+        except BaseException:
+            with self._lock:
+                self._changes = None
+            raise
+
+        with self._lock:
+            for change in self._changes:
+                if change[0] == "add":
+                    documents.add(*change[1:])
+                else:
+                    documents.remove(change[1])
+
+            self._documents = documents
+            self._changes = None
+            self._loaded_at = time.monotonic()
+
+    def invalidate(self) -> None:
+        """Forces rebuild of the index on next search"""
+
+        self._loaded_at = None
+
+    def add(self, doc_id: Any, fields: list[tuple[str, int]], attributes: Optional[dict] = None) -> None:
+        """Adds or replaces document in the index
+
+        Args:
+            doc_id (Any): unique document id
+            fields (list): list of (text, weight) pairs, terms of a field
+                are counted weight times
+            attributes (dict): values used for filtering and sorting
+        """
+
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append(("add", doc_id, fields, attributes))
+
+            if self._loaded_at is not None:
+                self._documents.add(doc_id, fields, attributes)
+
+    def remove(self, doc_id: Any) -> None:
+        """Removes document from the index
+
+        Args:
+            doc_id (Any): document id
+        """
+
+        with self._lock:
+            if self._changes is not None:
+                self._changes.append(("remove", doc_id))
+
+            self._documents.remove(doc_id)
+
+    def search(self, query: Optional[str], filters: Optional[list[Callable[[dict], bool]]] = None,
+               offset: int = 0, limit: int = 20, sort_key: Optional[Callable[[dict], Any]] = None) -> tuple[int, list]:
+        """Ranks documents matching query
+
+        Args:
+            query (str): free text query, when empty every document matching
+                filters is returned ordered by sort_key
+            filters (list): predicates on document attributes, all must hold
+            offset (int): number of ranked results to skip
+            limit (int): maximum number of results to return
+            sort_key (callable): orders documents with equal score, receives
+                document attributes (default is document insertion order)
+
+        Returns:
+            tuple: total number of matching documents and list of
+                (doc_id, score) pairs for the requested page
+        """
+
+        self.ensure_loaded()
+        filters = filters or []
+        words = [word for word in TOKEN_PATTERN.findall((query or "").lower())
+                 if word not in STOP_WORDS]
+
+        with self._lock:
+            documents = self._documents
+
+            if words:
+                scores = self._score(documents, self._weigh_terms(documents, words))
+            else:
+                scores = dict.fromkeys(documents.doc_terms, 0.0)
+
+            matches = [(doc_id, score) for doc_id, score in scores.items()
+                       if all(predicate(documents.attributes[doc_id]) for predicate in filters)]
+
+            if sort_key:
+                matches.sort(key=lambda match: sort_key(
+                    documents.attributes[match[0]]), reverse=True)
+            matches.sort(key=lambda match: match[1], reverse=True)
+
+        return len(matches), matches[offset:offset + limit]
+
+    def _weigh_terms(self, documents: _Documents, words: list[str]) -> dict[str, float]:
+        """Maps indexed terms matched by query words to their weight"""
+
+        weights: dict[str, float] = {}
+        for word in words:
+            if len(word) >= self.min_prefix and not word.isdigit():
+                for term in documents.terms_starting_with(word):
+                    weights[term] = max(weights.get(term, 0.0), self.prefix_weight)
+
+            weights[stem(word)] = 1.0
+
+        return weights
+
+    def _score(self, documents: _Documents, weights: dict[str, float]) -> dict[Any, float]:
+        document_count = len(documents.doc_terms)
+        if not document_count:
+            return {}
+
+        average_length = documents.total_length / document_count
+        scores: dict[Any, float] = {}
+
+        for term, weight in weights.items():
+            postings = documents.postings.get(term)
+            if not postings:
+                continue
+
+            idf = math.log(1 + (document_count - len(postings) + 0.5) /
+                           (len(postings) + 0.5))
+
+            for doc_id, frequency in postings.items():
+                norm = self.k1 * (1 - self.b + self.b *
+                                  documents.doc_lengths[doc_id] / average_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + \
+                    weight * idf * frequency * (self.k1 + 1) / (frequency + norm)
+
+        return scores
@@ -0,0 +1 @@
+from .SearchIndex import SearchIndex, tokenize, stem
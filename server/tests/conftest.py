@@ -0,0 +1,182 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+from flask import Flask
+from sqlalchemy import event
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateTable
+
+# modules of the server import each other relative to the server directory
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+# configuration read while the application is imported, set unconditionally
+# so that tests never touch a database or upload folder of a .env file
+TEST_FOLDER = tempfile.mkdtemp(prefix='gigrid-tests-')
+os.environ.update({
+    'FLASK_SECRET_KEY': 'test secret',
+    'DATABASE_URI': f'sqlite:///{os.path.join(TEST_FOLDER, "app.sqlite")}',
+    'UPLOAD_FOLDER': os.path.join(TEST_FOLDER, 'uploads'),
+    'CHAPA_SECRET_KEY': 'test',
+    'CHAPA_BASE_URL': 'http://127.0.0.1:9',
+    'SOCKETIO_MESSAGE_QUEUE': '',
+    'ESCROW_SWEEP_INTERVAL': '0',
+    'USE_X_SENDFILE': '',
+    'X_ACCEL_REDIRECT_PREFIX': ''
+})
+
+from model import db  # noqa: E402
+
+
+@compiles(CreateTable, 'sqlite')
+def _create_table(element, compiler, **kw):
+    # message declares an autoincrement column in a composite key, which
+    # only MySQL can create, SQLite gets the id as its only key
+    table = element.element
+    if table.name != 'message':
+        return compiler.visit_create_table(element, **kw)
+
+    columns = ['id INTEGER PRIMARY KEY AUTOINCREMENT' if column.name == 'id' else
+               f'{column.name} {compiler.dialect.type_compiler_instance.process(column.type)}'
+               for column in table.columns]
+    return f'CREATE TABLE message ({", ".join(columns)})'
+
+
+def _begin_immediately(engine) -> None:
+    """SQLite has no row locks, transactions take the database write lock as
+    they begin so concurrent transactions wait for each other instead of
+    failing"""
+
+    @event.listens_for(engine, 'connect')
+    def disable_driver_transactions(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+
+    @event.listens_for(engine, 'begin')
+    def begin_immediate(connection):
+        connection.exec_driver_sql('BEGIN IMMEDIATE')
+
+
+@pytest.fixture
+def app(tmp_path):
+    """Application with only the models, backed by a SQLite database of its own"""
+
+    app = Flask(__name__)
+    app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{tmp_path / "test.sqlite"}'
+    app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'connect_args': {'timeout': 30}}
+    db.init_app(app)
+
+    with app.app_context():
+        _begin_immediately(db.engine)
+        db.create_all()
+
+    yield app
+
+    with app.app_context():
+        db.engine.dispose()
+
+
+@pytest.fixture
+def web_app():
+    """The server application with empty tables, its blueprints and routes"""
+
+    import app as server
+
+    server.app.config['TESTING'] = True
+
+    with server.app.app_context():
+        if not getattr(server, '_test_engine_ready', False):
+            _begin_immediately(db.engine)
+            server._test_engine_ready = True
+
+        db.drop_all()
+        db.create_all()
+
+    yield server.app
+
+    with server.app.app_context():
+        db.session.remove()
+
+
+@pytest.fixture
+def make_user():
+    """Creates user who can log in with password 'password'"""
+
+    from werkzeug.security import generate_password_hash
+    from model import User
+
+    def make_user(email: str, user_type: str) -> User:
+        user = User(firstname='Test', lastname='User', email=email,
+                    password=generate_password_hash('password'), user_type=user_type)
+        db.session.add(user)
+        db.session.commit()
+        return user
+
+    return make_user
+
+
+def login(client, email: str) -> None:
+    response = client.post('/login', data={'email': email, 'password': 'password'})
+    assert response.status_code == 302
+
+
+class ChapaStub(ThreadingHTTPServer):
+    """Local stand-in for the Chapa API
+
+    Responses to verification requests are taken from `replies` in order,
+    the last one is repeated. A reply is a (status, body, delay) tuple.
+    """
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(('127.0.0.1', 0), ChapaStubHandler)
+        self.replies = [(200, {'status': 'success', 'data': {'amount': '10'}}, 0)]
+        self.requests = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self) -> str:
+        return f'http://127.0.0.1:{self.server_port}'
+
+
+class ChapaStubHandler(BaseHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests.append(self.path)
+            index = min(len(self.server.requests), len(self.server.replies)) - 1
+            status, body, delay = self.server.replies[index]
+
+        time.sleep(delay)
+
+        content = body.encode() if isinstance(body, str) else json.dumps(body).encode()
+        try:
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(content)))
+            self.end_headers()
+            self.wfile.write(content)
+        except OSError:
+            # client gave up waiting
+            pass
+
+
+@pytest.fixture
+def chapa(monkeypatch):
+    stub = ChapaStub()
+    thread = threading.Thread(target=stub.serve_forever, args=(0.05,), daemon=True)
+    thread.start()
+    monkeypatch.setenv('CHAPA_BASE_URL', stub.url)
+
+    yield stub
+
+    stub.shutdown()
+    stub.server_close()
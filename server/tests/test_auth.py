@@ -0,0 +1,49 @@
+from auth import get_auth_manager, load_user, revoke_user
+from auth.AuthenticationManager import token_cache
+from model import User, UserType, db
+
+SECRET_KEY = 'secret'
+
+
+def login(user: User) -> str:
+    user.token = get_auth_manager(SECRET_KEY).generate_auth_token(user.id)
+    db.session.commit()
+    return user.token
+
+
+def test_token_stops_working_after_revoke_user(app):
+    with app.app_context():
+        user = User(email='user@example.com', user_type=UserType.FREELANCER)
+        db.session.add(user)
+        db.session.commit()
+
+        token = login(user)
+        assert load_user(token, SECRET_KEY) is user
+        assert token_cache.get(token) == user.id
+
+        # logout
+        revoke_user(user)
+        user.token = None
+        db.session.commit()
+
+        assert load_user(token, SECRET_KEY) is None
+
+
+def test_token_replaced_by_another_worker_stops_working(app):
+    with app.app_context():
+        user = User(email='user@example.com', user_type=UserType.FREELANCER)
+        db.session.add(user)
+        db.session.commit()
+
+        token = login(user)
+        assert load_user(token, SECRET_KEY) is user
+
+        # login handled by another process, whose revoke_user does not
+        # reach the token cache of this one
+        db.session.execute(db.update(User).where(User.id == user.id)
+                           .values(token='token of new session'))
+        db.session.commit()
+
+        assert token_cache.get(token) == user.id
+        assert load_user(token, SECRET_KEY) is None
+        assert token_cache.get(token) is None
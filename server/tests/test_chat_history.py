@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+from model import Chat, Message, User, UserType, db
+
+MESSAGES = 7
+
+
+def add_chat(employer_email: str, freelancer_email: str) -> tuple[int, list[int]]:
+    employer = User(email=employer_email, user_type=UserType.EMPLOYER)
+    freelancer = User(email=freelancer_email, user_type=UserType.FREELANCER)
+    db.session.add_all([employer, freelancer])
+    db.session.flush()
+
+    chat = Chat(user_1=employer.id, user_2=freelancer.id)
+    db.session.add(chat)
+    db.session.flush()
+
+    # messages sent in the same second are ordered by id
+    sent = datetime(2026, 1, 1, 12)
+    messages = [Message(chat_id=chat.id, sender_id=employer.id, content=f'message {index}',
+                        time_stamp=sent + timedelta(seconds=index // 2), sequence=index + 1)
+                for index in range(MESSAGES)]
+    db.session.add_all(messages)
+    db.session.commit()
+
+    return chat.id, [message.id for message in messages]
+
+
+def ids(messages: list[Message]) -> list[int]:
+    return [message.id for message in messages]
+
+
+def test_history_pages_before_and_after_message(app):
+    with app.app_context():
+        chat_id, sent = add_chat('employer@example.com', 'freelancer@example.com')
+
+        assert ids(Message.get_history(chat_id, limit=3)) == sent[-3:]
+        assert ids(Message.get_history(chat_id, before=sent[-3], limit=3)) == sent[1:4]
+        assert ids(Message.get_history(chat_id, before=sent[1], limit=3)) == sent[:1]
+        assert ids(Message.get_history(chat_id, before=sent[0], limit=3)) == []
+
+        assert ids(Message.get_history(chat_id, after=sent[0], limit=3)) == sent[1:4]
+        assert ids(Message.get_history(chat_id, after=sent[3], limit=3)) == sent[4:]
+        assert ids(Message.get_history(chat_id, after=sent[-1], limit=3)) == []
+
+        assert ids(Message.get_history(chat_id, before=sent[5], after=sent[1])) == sent[2:5]
+
+        # walking back page by page visits every message once
+        pages = []
+        page = Message.get_history(chat_id, limit=2)
+        while page:
+            pages = ids(page) + pages
+            page = Message.get_history(chat_id, before=page[0].id, limit=2)
+        assert pages == sent
+
+
+def test_history_is_empty_for_unknown_cursor(app):
+    with app.app_context():
+        chat_id, sent = add_chat('employer@example.com', 'freelancer@example.com')
+        _, other = add_chat('other@example.com', 'other.freelancer@example.com')
+        missing = max(sent + other) + 1
+
+        for cursor in (missing, other[3]):
+            assert Message.get_history(chat_id, before=cursor) == []
+            assert Message.get_history(chat_id, after=cursor) == []
+            assert Message.get_history(chat_id, before=sent[-1], after=cursor) == []
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta
+from typing import Optional
+
+from contract.EscrowSweeper import EscrowSweeper
+from ledger import Ledger
+from model import (Contract, ContractStatus, Escrow, Job, LedgerEntry, LedgerEntryKind, User,
+                   UserType, Work, db, new_id)
+
+DEPOSIT = 10_000
+ESCROW_AMOUNT = 300
+NOW = datetime(2026, 1, 1, 12)
+
+
+def add_contract(job_id: str, worker_id: int, owner_id: int, deadline: datetime,
+                 status: Optional[str], submitted: Optional[datetime] = None) -> str:
+    contract = Contract(id=new_id(), job_id=job_id, worker_id=worker_id,
+                        deadline=deadline, status=status)
+    escrow = Escrow(id=new_id(), contract_id=contract.id, amount_minor=ESCROW_AMOUNT)
+    db.session.add_all([contract, escrow])
+    db.session.flush()
+
+    if submitted:
+        db.session.add(Work(contract_id=contract.id, submission_date=submitted))
+
+    Ledger.fund_escrow(owner_id, escrow.id, ESCROW_AMOUNT)
+    return contract.id
+
+
+def test_sweep_refunds_expired_contracts_once(app):
+    expired_at = NOW - timedelta(days=1)
+
+    with app.app_context():
+        owner = User(email='owner@example.com', user_type=UserType.EMPLOYER)
+        worker = User(email='worker@example.com', user_type=UserType.FREELANCER)
+        db.session.add_all([owner, worker])
+        db.session.flush()
+
+        job = Job(id=new_id(), title='job', description='job', experience_level='ENTRY',
+                  budget=1, owner_id=owner.id)
+        db.session.add(job)
+        Ledger.deposit(owner.id, DEPOSIT, 'TX-1')
+
+        def add(deadline, status, submitted=None):
+            return add_contract(job.id, worker.id, owner.id, deadline, status, submitted)
+
+        expired = [
+            add(expired_at, ContractStatus.ACCEPTED),
+            add(expired_at, ContractStatus.PENDING_CANCEL),
+            # worker never responded to the offer
+            add(expired_at, None),
+            # work submitted after the deadline does not keep contract open
+            add(expired_at, ContractStatus.ACCEPTED, submitted=NOW),
+        ]
+        kept = [
+            add(expired_at, ContractStatus.ACCEPTED, submitted=expired_at - timedelta(hours=1)),
+            add(NOW + timedelta(days=1), ContractStatus.ACCEPTED),
+            add(NOW + timedelta(days=1), None),
+        ]
+        db.session.commit()
+
+        owner_id = owner.id
+
+    sweeper = EscrowSweeper(batch_size=2, pause=0)
+
+    with app.app_context():
+        assert sweeper.sweep(NOW) == len(expired)
+        assert sweeper.sweep(NOW) == 0
+
+        for contract_id in expired:
+            contract = db.session.get(Contract, contract_id)
+            assert contract.status == ContractStatus.CANCELLED
+            assert contract.escrow[0].balance_minor == 0
+
+            refunds = LedgerEntry.query.filter_by(kind=LedgerEntryKind.ESCROW_REFUND,
+                                                  account_id=str(contract.escrow[0].id))
+            assert [entry.amount for entry in refunds] == [-ESCROW_AMOUNT]
+
+        for contract_id in kept:
+            contract = db.session.get(Contract, contract_id)
+            assert contract.status != ContractStatus.CANCELLED
+            assert contract.escrow[0].balance_minor == ESCROW_AMOUNT
+
+        owner = db.session.get(User, owner_id)
+        assert owner.balance_minor == DEPOSIT - len(kept) * ESCROW_AMOUNT
+        assert db.session.query(db.func.sum(LedgerEntry.amount)).scalar() == 0
+
+    assert sweeper.metrics['runs'] == 2
+    assert sweeper.metrics['batches'] == 2
+    assert sweeper.metrics['contracts_expired'] == len(expired)
+    assert sweeper.metrics['refunded_minor'] == len(expired) * ESCROW_AMOUNT
+    assert sweeper.metrics['errors'] == 0
+    assert sweeper.metrics['last_run_at'] == NOW
@@ -0,0 +1,106 @@
+import io
+import json
+import os
+
+from conftest import login
+from model import File, FileStatus, UserType, db
+from utils import file_processor
+
+PNG = b'\x89PNG\r\n\x1a\n' + bytes(range(64))
+TEXT = b'plain text notes'
+HTML = b'<!doctype html><script>alert(1)</script>'
+
+
+def upload(client, content: bytes, name: str, mime_type: str) -> str:
+    response = client.post('/messages/uploadfile', content_type='multipart/form-data',
+                           data={'file': (io.BytesIO(content), name, mime_type)})
+    file_id = json.loads(response.data)['file_id']
+
+    file_processor.process_pending()
+    db.session.expire_all()
+    assert File.get(file_id).status == FileStatus.READY
+    return file_id
+
+
+def test_file_is_sent_with_cache_and_range_support(web_app, make_user):
+    client = web_app.test_client()
+
+    with web_app.app_context():
+        make_user('owner@example.com', UserType.FREELANCER)
+        login(client, 'owner@example.com')
+        image_id = upload(client, PNG, 'image.png', 'image/png')
+
+    response = client.get(f'/files/{image_id}')
+    assert response.status_code == 200
+    assert response.data == PNG
+    assert response.mimetype == 'image/png'
+    assert response.headers['X-Content-Type-Options'] == 'nosniff'
+    assert response.headers['Content-Disposition'].startswith('inline')
+    assert response.cache_control.private
+
+    etag = response.headers['ETag']
+    response = client.get(f'/files/{image_id}', headers={'If-None-Match': etag})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    response = client.get(f'/files/{image_id}', headers={'Range': 'bytes=2-9'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes 2-9/{len(PNG)}'
+    assert response.data == PNG[2:10]
+
+    response = client.get(f'/files/{image_id}', headers={'Range': 'bytes=-4'})
+    assert response.status_code == 206
+    assert response.headers['Content-Range'] == f'bytes {len(PNG) - 4}-{len(PNG) - 1}/{len(PNG)}'
+    assert response.data == PNG[-4:]
+
+
+def test_files_other_than_images_are_downloaded(web_app, make_user):
+    client = web_app.test_client()
+
+    with web_app.app_context():
+        make_user('owner@example.com', UserType.FREELANCER)
+        login(client, 'owner@example.com')
+        text_id = upload(client, TEXT, 'notes.txt', 'text/plain')
+        page_id = upload(client, HTML, 'page.png', 'image/png')
+
+    response = client.get(f'/files/{text_id}')
+    assert response.mimetype == 'text/plain'
+    assert response.headers['Content-Disposition'].startswith('attachment')
+    assert response.headers['X-Content-Type-Options'] == 'nosniff'
+
+    # HTML declared as an image is neither rendered nor shown inline
+    response = client.get(f'/files/{page_id}')
+    assert response.mimetype == 'application/octet-stream'
+    assert response.headers['Content-Disposition'].startswith('attachment')
+    assert response.headers['X-Content-Type-Options'] == 'nosniff'
+
+
+def test_file_is_left_to_proxy_with_accel_redirect(web_app, make_user, monkeypatch):
+    client = web_app.test_client()
+    monkeypatch.setitem(web_app.config, 'X_ACCEL_REDIRECT_PREFIX', '/protected/')
+
+    with web_app.app_context():
+        make_user('owner@example.com', UserType.FREELANCER)
+        login(client, 'owner@example.com')
+        image_id = upload(client, PNG, 'image.png', 'image/png')
+        text_id = upload(client, TEXT, 'notes.txt', 'text/plain')
+
+        relative_path = os.path.relpath(File.get(image_id).file_path,
+                                        os.getenv('UPLOAD_FOLDER'))
+
+    response = client.get(f'/files/{image_id}')
+    assert response.status_code == 200
+    assert response.data == b''
+    assert response.headers['X-Accel-Redirect'] == \
+        '/protected/' + relative_path.replace(os.sep, '/')
+    assert response.mimetype == 'image/png'
+    assert response.headers['X-Content-Type-Options'] == 'nosniff'
+    assert response.headers['Content-Disposition'].startswith('inline')
+
+    response = client.get(f'/files/{image_id}', headers={'If-None-Match': response.headers['ETag']})
+    assert response.status_code == 304
+    assert response.data == b''
+
+    response = client.get(f'/files/{text_id}')
+    assert response.data == b''
+    assert response.headers['Content-Disposition'].startswith('attachment')
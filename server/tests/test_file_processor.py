@@ -0,0 +1,111 @@
+import hashlib
+import threading
+
+from model import File, FileStatus, db
+from utils.FileProcessor import FileProcessor
+
+PNG = b'\x89PNG\r\n\x1a\n' + b'\x00' * 32
+ZIP = b'PK\x03\x04' + b'\x00' * 32
+HTML = b'<!doctype html><script>alert(1)</script>'
+
+
+def add_file(path, content: bytes, mime_type: str, stored: bytes = None) -> str:
+    # stored content differing from the uploaded one models a tampered blob
+    path.write_bytes(content if stored is None else stored)
+    file = File(file_name=path.name, file_path=str(path), mime_type=mime_type,
+                content_hash=hashlib.sha256(content).hexdigest(), size=len(content),
+                status=FileStatus.PENDING)
+    db.session.add(file)
+    db.session.commit()
+    return file.id
+
+
+def test_sniff_does_not_trust_declared_type():
+    sniff = FileProcessor.sniff
+
+    assert sniff(HTML, 'image/png') == FileProcessor.OCTET_STREAM
+    assert sniff(PNG, 'text/html') == 'image/png'
+    assert sniff(PNG, 'image/png; charset=binary') == 'image/png'
+
+    for active_type in FileProcessor.ACTIVE:
+        assert sniff(HTML, active_type) == FileProcessor.OCTET_STREAM
+        assert sniff(HTML, active_type.upper()) == FileProcessor.OCTET_STREAM
+    assert sniff(b'<svg xmlns="http://www.w3.org/2000/svg"/>', 'image/svg+xml') == \
+        FileProcessor.OCTET_STREAM
+
+    assert sniff(b'plain text', 'text/plain') == 'text/plain'
+    assert sniff(b'plain text', None) == FileProcessor.OCTET_STREAM
+
+
+def test_sniff_keeps_declared_type_of_contained_formats():
+    sniff = FileProcessor.sniff
+    docx = 'application/vnd.openxmlformats-officedocument.wordprocessingml.document'
+
+    assert sniff(ZIP, docx) == docx
+    assert sniff(ZIP, 'application/epub+zip') == 'application/epub+zip'
+    assert sniff(b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/msword') == \
+        'application/msword'
+    assert sniff(b'\x00\x00\x00\x18ftypqt  ', 'video/quicktime') == 'video/quicktime'
+
+    # a container does not lend its contents an arbitrary type
+    assert sniff(ZIP, 'text/html') == 'application/zip'
+    assert sniff(ZIP, 'image/png') == 'application/zip'
+
+
+def test_process_batch_verifies_stored_files(app, tmp_path):
+    with app.app_context():
+        image_id = add_file(tmp_path / 'image.png', PNG, 'image/png')
+        page_id = add_file(tmp_path / 'page.png', HTML, 'image/png')
+        tampered_id = add_file(tmp_path / 'tampered.png', PNG, 'image/png',
+                               stored=PNG[:-1] + b'\x01')
+        truncated_id = add_file(tmp_path / 'truncated.png', PNG, 'image/png', stored=PNG[:20])
+
+        processor = FileProcessor()
+        notified = []
+        processor.listeners.append(notified.extend)
+        processor.process_pending()
+
+        def result(file_id):
+            file = db.session.get(File, file_id)
+            return file.status, file.mime_type
+
+        db.session.expire_all()
+        assert result(image_id) == (FileStatus.READY, 'image/png')
+        assert result(page_id) == (FileStatus.READY, FileProcessor.OCTET_STREAM)
+        assert result(tampered_id) == (FileStatus.FAILED, 'image/png')
+        assert result(truncated_id) == (FileStatus.FAILED, 'image/png')
+        assert sorted(file.id for file in notified) == \
+            sorted([image_id, page_id, tampered_id, truncated_id])
+
+
+def test_file_is_processed_by_one_processor(app, tmp_path):
+    with app.app_context():
+        file_ids = [add_file(tmp_path / f'{index}.png', PNG, 'image/png') for index in range(3)]
+
+    first, second = FileProcessor(), FileProcessor()
+    processed = {first: [], second: []}
+    for processor in processed:
+        processor.listeners.append(processed[processor].extend)
+
+    def process(processor):
+        with app.app_context():
+            processor.process_pending()
+
+    # the first processor handles the files while the second is reading them
+    inspect = second.inspect
+
+    def inspect_while_first_processes(*args):
+        if not processed[first]:
+            thread = threading.Thread(target=process, args=(first,))
+            thread.start()
+            thread.join()
+        return inspect(*args)
+
+    second.inspect = inspect_while_first_processes
+    process(second)
+
+    assert sorted(file.id for file in processed[first]) == sorted(file_ids)
+    assert processed[second] == []
+
+    with app.app_context():
+        assert File.get_pending(10) == []
@@ -0,0 +1,10 @@
+from migrations import IndexCheck
+
+
+def test_hot_queries_use_indexes(app):
+    with app.app_context():
+        # every hot path is explained, none of them skips its query
+        for name, call in IndexCheck.hot_paths().items():
+            assert IndexCheck.capture(call), name
+
+        assert IndexCheck().run() == {}
@@ -0,0 +1,121 @@
+import threading
+from datetime import datetime
+
+from ledger import Ledger
+from model import (Contract, Escrow, Job, LedgerAccountType, LedgerEntry, User, UserType, db,
+                   new_id)
+from payment_gateway import InsufficientBalance
+
+DEPOSIT = 10_000
+ESCROW_AMOUNT = 300
+THREADS = 8
+CONTRACTS_PER_THREAD = 6
+
+
+def entry_sum(account_type: str, account_id) -> int:
+    return db.session.query(db.func.coalesce(db.func.sum(LedgerEntry.amount), 0))\
+        .filter(LedgerEntry.account_type == account_type,
+                LedgerEntry.account_id == str(account_id))\
+        .scalar()
+
+
+def run_threads(target, errors: list) -> None:
+    def run(index: int):
+        try:
+            target(index)
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=run, args=(index,)) for index in range(THREADS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+
+def test_parallel_escrow_funding_keeps_ledger_balanced(app):
+    with app.app_context():
+        owner = User(email='owner@example.com', user_type=UserType.EMPLOYER)
+        worker = User(email='worker@example.com', user_type=UserType.FREELANCER)
+        db.session.add_all([owner, worker])
+        db.session.flush()
+
+        job = Job(id=new_id(), title='job', description='job', experience_level='ENTRY',
+                  budget=1, owner_id=owner.id)
+        db.session.add(job)
+        Ledger.deposit(owner.id, DEPOSIT, 'TX-1')
+        db.session.commit()
+
+        owner_id, worker_id, job_id = owner.id, worker.id, job.id
+
+    funded = []
+    errors = []
+    lock = threading.Lock()
+
+    def fund(thread: int):
+        with app.app_context():
+            for _ in range(CONTRACTS_PER_THREAD):
+                contract = Contract(id=new_id(), job_id=job_id, worker_id=worker_id,
+                                    deadline=datetime.now())
+                escrow = Escrow(id=new_id(), contract_id=contract.id,
+                                amount_minor=ESCROW_AMOUNT)
+                db.session.add_all([contract, escrow])
+                db.session.flush()
+
+                try:
+                    Ledger.fund_escrow(owner_id, escrow.id, ESCROW_AMOUNT)
+                except InsufficientBalance:
+                    db.session.rollback()
+                    continue
+
+                db.session.commit()
+                with lock:
+                    funded.append(escrow.id)
+
+    def settle(thread: int):
+        # threads race to release or refund the same escrows, only the
+        # first one to empty an escrow moves money
+        with app.app_context():
+            for escrow_id in funded:
+                if thread % 2:
+                    Ledger.release_escrow(escrow_id, worker_id)
+                else:
+                    Ledger.refund_escrow(escrow_id, owner_id)
+                db.session.commit()
+
+    run_threads(fund, errors)
+    assert errors == []
+    # funding stops once the deposit is used up, never overdrawing it
+    assert len(funded) == DEPOSIT // ESCROW_AMOUNT
+
+    with app.app_context():
+        held = db.session.query(db.func.sum(Escrow.balance_minor)).scalar()
+        assert held == len(funded) * ESCROW_AMOUNT
+        assert db.session.get(User, owner_id).balance_minor == DEPOSIT - held
+
+    run_threads(settle, errors)
+    assert errors == []
+
+    with app.app_context():
+        owner = db.session.get(User, owner_id)
+        worker = db.session.get(User, worker_id)
+
+        assert owner.balance_minor >= 0 and worker.balance_minor >= 0
+        assert owner.balance_minor + worker.balance_minor == DEPOSIT
+        assert db.session.query(db.func.sum(Escrow.balance_minor)).scalar() == 0
+
+        # every transfer and so the whole ledger sums up to zero
+        assert db.session.query(db.func.sum(LedgerEntry.amount)).scalar() == 0
+        unbalanced = db.session.query(LedgerEntry.transfer_id)\
+            .group_by(LedgerEntry.transfer_id)\
+            .having(db.func.sum(LedgerEntry.amount) != 0)\
+            .all()
+        assert unbalanced == []
+
+        # stored balances are the sums of their entries
+        assert entry_sum(LedgerAccountType.USER, owner_id) == owner.balance_minor
+        assert entry_sum(LedgerAccountType.USER, worker_id) == worker.balance_minor
+        for escrow_id in funded:
+            assert entry_sum(LedgerAccountType.ESCROW, escrow_id) == 0
+            assert entry_sum(LedgerAccountType.ESCROW, escrow_id) == \
+                db.session.get(Escrow, escrow_id).balance_minor
@@ -0,0 +1,87 @@
+import os
+import time
+
+from payment_gateway import ChapaPaymentHandler
+
+
+def make_handler(**kwargs) -> ChapaPaymentHandler:
+    # configured the way payment.payment creates its handler
+    kwargs.setdefault('backoff_factor', 0)
+    return ChapaPaymentHandler('secret', base_url=os.getenv('CHAPA_BASE_URL'), **kwargs)
+
+
+def test_verify_returns_data_of_successful_transaction(chapa):
+    verified, data = make_handler().verify('TX-1')
+
+    assert verified is True
+    assert data == {'amount': '10'}
+    assert chapa.requests == ['/v1/transaction/verify/TX-1']
+
+
+def test_verify_rejects_failed_transaction(chapa):
+    chapa.replies = [(200, {'status': 'failed', 'data': None}, 0)]
+
+    assert make_handler().verify('TX-1') == (False, None)
+
+
+def test_verify_rejects_response_that_is_not_json(chapa):
+    chapa.replies = [(200, '<html>maintenance</html>', 0)]
+
+    assert make_handler().verify('TX-1') == (False, None)
+
+
+def test_verify_async_verifies_concurrently(chapa):
+    chapa.replies = [(200, {'status': 'success', 'data': {'amount': '10'}}, 0.2)]
+    handler = make_handler()
+
+    started = time.monotonic()
+    futures = [handler.verify_async(f'TX-{i}') for i in range(4)]
+    results = [future.result(timeout=5) for future in futures]
+    elapsed = time.monotonic() - started
+
+    assert results == [(True, {'amount': '10'})] * 4
+    assert sorted(chapa.requests) == [f'/v1/transaction/verify/TX-{i}' for i in range(4)]
+    # four requests of 0.2s each run on the pool at the same time
+    assert elapsed < 0.6
+
+
+def test_verify_gives_up_after_read_timeout(chapa):
+    chapa.replies = [(200, {'status': 'success', 'data': {}}, 1)]
+    handler = make_handler(timeout=(1, 0.2), retries=0)
+
+    started = time.monotonic()
+    assert handler.verify('TX-1') == (False, None)
+    assert time.monotonic() - started < 0.9
+
+
+def test_verify_retries_read_timeout(chapa):
+    chapa.replies = [(200, {'status': 'success', 'data': {}}, 1),
+                     (200, {'status': 'success', 'data': {'amount': '10'}}, 0)]
+    handler = make_handler(timeout=(1, 0.2), retries=1)
+
+    assert handler.verify('TX-1') == (True, {'amount': '10'})
+    assert len(chapa.requests) == 2
+
+
+def test_verify_retries_gateway_errors(chapa):
+    chapa.replies = [(503, 'unavailable', 0), (502, 'bad gateway', 0),
+                     (200, {'status': 'success', 'data': {'amount': '10'}}, 0)]
+
+    assert make_handler(retries=3).verify('TX-1') == (True, {'amount': '10'})
+    assert len(chapa.requests) == 3
+
+
+def test_verify_fails_when_retries_are_exhausted(chapa):
+    chapa.replies = [(503, 'unavailable', 0)]
+
+    assert make_handler(retries=2).verify('TX-1') == (False, None)
+    assert len(chapa.requests) == 3
+
+
+def test_verify_fails_when_chapa_is_unreachable(chapa):
+    url = chapa.url
+    chapa.shutdown()
+    chapa.server_close()
+
+    handler = ChapaPaymentHandler('secret', base_url=url, retries=1, backoff_factor=0)
+    assert handler.verify('TX-1') == (False, None)
@@ -0,0 +1,135 @@
+import os
+import threading
+
+from ledger import Ledger
+from model import (LedgerAccountType, LedgerEntry, LedgerEntryKind, PaymentEvent,
+                   PaymentEventStatus, User, UserType, db)
+from payment.PaymentProcessor import PaymentProcessor
+from payment_gateway import ChapaPaymentHandler
+
+CALLBACKS = 12
+PROCESSORS = 3
+
+
+def make_processor(**kwargs) -> PaymentProcessor:
+    handler = ChapaPaymentHandler('secret', base_url=os.getenv('CHAPA_BASE_URL'),
+                                  backoff_factor=0)
+    return PaymentProcessor(handler, **kwargs)
+
+
+def add_payment(tx_ref: str, amount_minor: int = 1000) -> int:
+    user = User(email=f'{tx_ref}@example.com', user_type=UserType.EMPLOYER)
+    db.session.add(user)
+    db.session.flush()
+    db.session.add(PaymentEvent(tx_ref=tx_ref, user_id=user.id, amount_minor=amount_minor,
+                                status=PaymentEventStatus.INITIATED))
+    db.session.commit()
+    return user.id
+
+
+def deposits(tx_ref: str) -> list[LedgerEntry]:
+    return LedgerEntry.query.filter_by(kind=LedgerEntryKind.DEPOSIT, reference=tx_ref,
+                                       account_type=LedgerAccountType.USER).all()
+
+
+def test_enqueue_queues_payment_once(app):
+    with app.app_context():
+        add_payment('TX-1')
+
+        assert PaymentEvent.enqueue('TX-1') is True
+        assert PaymentEvent.enqueue('TX-1') is False
+
+        # callback for a payment this server did not initialize
+        assert PaymentEvent.enqueue('TX-2') is True
+        assert PaymentEvent.enqueue('TX-2') is False
+
+        events = PaymentEvent.query.order_by(PaymentEvent.id).all()
+        assert [(event.tx_ref, event.status) for event in events] == [
+            ('TX-1', PaymentEventStatus.PENDING), ('TX-2', PaymentEventStatus.PENDING)]
+
+        PaymentEvent.get('TX-1').status = PaymentEventStatus.CREDITED
+        db.session.commit()
+
+        assert PaymentEvent.enqueue('TX-1') is False
+        assert PaymentEvent.get('TX-1').status == PaymentEventStatus.CREDITED
+
+
+def test_burst_of_callbacks_credits_payment_once(app, chapa):
+    with app.app_context():
+        user_id = add_payment('TX-1')
+
+    queued = []
+    errors = []
+    start = threading.Barrier(CALLBACKS + PROCESSORS)
+
+    def callback():
+        try:
+            with app.app_context():
+                start.wait()
+                queued.append(PaymentEvent.enqueue('TX-1'))
+        except Exception as error:
+            errors.append(error)
+
+    def process():
+        try:
+            with app.app_context():
+                start.wait()
+                for _ in range(3):
+                    make_processor().process_pending()
+        except Exception as error:
+            errors.append(error)
+
+    threads = [threading.Thread(target=callback) for _ in range(CALLBACKS)]
+    threads += [threading.Thread(target=process) for _ in range(PROCESSORS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    with app.app_context():
+        make_processor().process_pending()
+
+        assert errors == []
+        assert queued.count(True) == 1
+
+        event = PaymentEvent.get('TX-1')
+        assert event.status == PaymentEventStatus.CREDITED
+        assert event.amount_minor == 1000
+        assert [entry.amount for entry in deposits('TX-1')] == [1000]
+        assert db.session.get(User, user_id).balance_minor == 1000
+
+
+def test_failing_payment_is_given_up_without_blocking_others(app, chapa, monkeypatch):
+    with app.app_context():
+        failing_id = add_payment('TX-1')
+        user_id = add_payment('TX-2')
+        PaymentEvent.enqueue('TX-1')
+        PaymentEvent.enqueue('TX-2')
+
+        deposit = Ledger.deposit
+
+        def failing_deposit(user_id: int, amount: int, reference: str) -> str:
+            if reference == 'TX-1':
+                raise RuntimeError('deposit failed')
+            return deposit(user_id, amount, reference)
+
+        monkeypatch.setattr(Ledger, 'deposit', staticmethod(failing_deposit))
+
+        processor = make_processor(batch_size=1, max_attempts=2)
+        processor.process_pending()
+
+        db.session.expire_all()
+        assert PaymentEvent.get('TX-1').status == PaymentEventStatus.PENDING
+        assert PaymentEvent.get('TX-1').attempts == 1
+        assert PaymentEvent.get('TX-2').status == PaymentEventStatus.CREDITED
+
+        processor.process_pending()
+
+        db.session.expire_all()
+        event = PaymentEvent.get('TX-1')
+        assert event.status == PaymentEventStatus.FAILED
+        assert event.attempts == 2
+        assert deposits('TX-1') == []
+        assert db.session.get(User, failing_id).balance_minor == 0
+        assert db.session.get(User, user_id).balance_minor == 1000
+        assert PaymentEvent.get_pending(10) == []
@@ -0,0 +1,129 @@
+from chat.PresenceRegistry import LocalPresenceRegistry
+from chat.PresenceService import PresenceService
+from chat.SocketSessionManager import SocketSessionManager
+
+USER = 1
+PEER = 2
+
+
+class FakeSocketIO:
+    """Records emitted events, every worker emits through the shared message queue"""
+
+    def __init__(self, emitted: list):
+        self.emitted = emitted
+
+    def emit(self, event, data, to=None):
+        self.emitted.append((to, data))
+
+    def start_background_task(self, target, *args):
+        # tests flush by hand
+        return object()
+
+
+class Worker:
+    def __init__(self, registry, emitted: list):
+        self.sessions = SocketSessionManager(registry)
+        self.presence = PresenceService(FakeSocketIO(emitted), self.sessions,
+                                        lambda user_ids: {PEER: set(user_ids)})
+
+    def connect(self, sid: str, user_id: int = USER) -> None:
+        first = self.sessions.bind(sid, user_id)
+        self.presence.connected(user_id, first, app=None)
+
+    def disconnect(self, sid: str) -> None:
+        user_id, last = self.sessions.unbind(sid)
+        self.presence.disconnected(user_id, last, app=None)
+
+
+def announcements(emitted: list) -> list:
+    events = [data for _, data in emitted]
+    emitted.clear()
+    return events
+
+
+def make_workers():
+    registry = LocalPresenceRegistry()
+    emitted = []
+    return Worker(registry, emitted), Worker(registry, emitted), emitted
+
+
+def test_registry_reports_first_and_last_socket():
+    registry = LocalPresenceRegistry()
+
+    assert registry.add(USER, 'a') is True
+    assert registry.add(USER, 'b') is False
+    assert registry.online([USER, PEER]) == {USER}
+    assert registry.remove(USER, 'a') is False
+    assert registry.remove(USER, 'a') is False
+    assert registry.remove(USER, 'b') is True
+    assert registry.online([USER]) == set()
+
+
+def test_presence_follows_sockets_on_every_worker():
+    worker_a, worker_b, emitted = make_workers()
+
+    worker_a.connect('a1')
+    worker_a.presence.flush()
+    assert announcements(emitted) == [{'online': [USER], 'offline': []}]
+
+    worker_a.disconnect('a1')
+    worker_a.presence.flush()
+    assert announcements(emitted) == [{'online': [], 'offline': [USER]}]
+
+    # back online through the other worker, then offline again there
+    worker_b.connect('b1')
+    worker_b.presence.flush()
+    assert announcements(emitted) == [{'online': [USER], 'offline': []}]
+    worker_b.disconnect('b1')
+    worker_b.presence.flush()
+    assert announcements(emitted) == [{'online': [], 'offline': [USER]}]
+
+    # reconnecting to the first worker announces the user again
+    worker_a.connect('a2')
+    worker_a.presence.flush()
+    assert announcements(emitted) == [{'online': [USER], 'offline': []}]
+
+
+def test_sockets_on_other_workers_keep_user_online():
+    worker_a, worker_b, emitted = make_workers()
+
+    worker_a.connect('a1')
+    worker_b.connect('b1')
+    worker_a.presence.flush()
+    worker_b.presence.flush()
+    assert announcements(emitted) == [{'online': [USER], 'offline': []}]
+
+    worker_a.disconnect('a1')
+    worker_a.presence.flush()
+    assert announcements(emitted) == []
+
+    worker_b.disconnect('b1')
+    worker_b.presence.flush()
+    assert announcements(emitted) == [{'online': [], 'offline': [USER]}]
+
+
+def test_changes_within_window_are_coalesced():
+    worker_a, worker_b, emitted = make_workers()
+
+    worker_a.connect('a1')
+    worker_a.disconnect('a1')
+    worker_a.connect('a2')
+    worker_a.presence.flush()
+    assert announcements(emitted) == [{'online': [USER], 'offline': []}]
+
+    # reconnect through another worker before the offline change is
+    # announced, the user is not announced offline
+    worker_a.disconnect('a2')
+    worker_b.connect('b1')
+    worker_a.presence.flush()
+    worker_b.presence.flush()
+    assert all(event['offline'] == [] for event in announcements(emitted))
+
+
+def test_events_are_sent_to_room_of_peer():
+    worker_a, _, emitted = make_workers()
+
+    worker_a.connect('a1')
+    worker_a.presence.flush()
+
+    assert [room for room, _ in emitted] == [SocketSessionManager.user_room(PEER)]
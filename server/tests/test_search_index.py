@@ -0,0 +1,56 @@
+import threading
+
+from search import SearchIndex
+
+DOCUMENTS = [
+    (1, [("Python developer", 3), ("Build flask apps", 1)], {}),
+    (2, [("Graphic designer", 3), ("Logo design", 1)], {}),
+]
+
+
+def ids(result):
+    return [doc_id for doc_id, _ in result[1]]
+
+
+def test_query_words_match_terms_they_prefix():
+    index = SearchIndex()
+    index.set_loader(lambda: iter(DOCUMENTS))
+
+    assert ids(index.search("desig")) == [2]
+    assert ids(index.search("flas")) == [1]
+    # exact matches rank above prefix matches
+    index.add(3, [("Pythonista", 3)], {})
+    assert ids(index.search("python")) == [1, 3]
+
+
+def test_searches_use_previous_index_while_rebuilding():
+    loading = threading.Event()
+    release = threading.Event()
+    documents = list(DOCUMENTS)
+
+    def loader():
+        if index._loaded_at is not None:
+            loading.set()
+            release.wait(5)
+        return iter(documents)
+
+    index = SearchIndex(max_age=0)
+    index.set_loader(loader)
+    index.ensure_loaded()
+
+    documents.append((3, [("Python tutor", 3)], {}))
+    rebuild = threading.Thread(target=index.ensure_loaded)
+    rebuild.start()
+    assert loading.wait(5)
+
+    # the rebuild holds no lock searches need
+    assert ids(index.search("python")) == [1]
+    index.remove(1)
+    index.add(4, [("Python reviewer", 3)], {})
+
+    release.set()
+    rebuild.join(5)
+    index.max_age = 300
+
+    # changes made during the rebuild survive the swap
+    assert sorted(ids(index.search("python"))) == [3, 4]
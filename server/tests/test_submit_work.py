@@ -0,0 +1,105 @@
+import io
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+from conftest import login
+from model import (Attachment, Contract, ContractStatus, File, FileAccess, FileAccessScope, Job,
+                   UserType, Work, db, new_id)
+
+FILES = 4
+
+
+@contextmanager
+def count_commits():
+    # files are processed by other threads after the commit of the request
+    commits = []
+    thread = threading.get_ident()
+
+    def count(session):
+        if threading.get_ident() == thread:
+            commits.append(session)
+
+    event.listen(Session, 'after_commit', count)
+    try:
+        yield commits
+    finally:
+        event.remove(Session, 'after_commit', count)
+
+
+@pytest.fixture
+def contract_id(web_app, make_user):
+    with web_app.app_context():
+        owner = make_user('owner@example.com', UserType.EMPLOYER)
+        worker = make_user('worker@example.com', UserType.FREELANCER)
+
+        job = Job(id=new_id(), title='job', description='job', experience_level='ENTRY',
+                  budget=1, owner_id=owner.id)
+        contract = Contract(id=new_id(), job_id=job.id, worker_id=worker.id,
+                            deadline=datetime.now() + timedelta(days=1),
+                            status=ContractStatus.ACCEPTED)
+        db.session.add_all([job, contract])
+        db.session.commit()
+        return contract.id
+
+
+def files() -> list:
+    return [(io.BytesIO(f'work {index}'.encode()), f'work-{index}.txt', 'text/plain')
+            for index in range(FILES)]
+
+
+def test_work_is_submitted_with_its_files_in_one_commit(web_app, contract_id):
+    client = web_app.test_client()
+
+    with web_app.app_context():
+        login(client, 'worker@example.com')
+
+    with count_commits() as commits:
+        response = client.post(f'/contract/{contract_id}', content_type='multipart/form-data',
+                               data={'files': files()})
+
+    assert response.status_code == 302
+    assert len(commits) == 1
+
+    with web_app.app_context():
+        work = Work.query.filter_by(contract_id=contract_id).one()
+        file_ids = [attachment.file_id
+                    for attachment in Attachment.query.filter_by(id=work.attachment_id)]
+        assert len(file_ids) == FILES
+
+        scopes = {(access.file_id, access.scope_type)
+                  for access in FileAccess.query.filter(FileAccess.file_id.in_(file_ids))}
+        assert scopes == {(file_id, scope) for file_id in file_ids
+                          for scope in (FileAccessScope.USER, FileAccessScope.CONTRACT)}
+
+
+def test_failed_work_insert_leaves_no_files(web_app, contract_id):
+    client = web_app.test_client()
+
+    with web_app.app_context():
+        login(client, 'worker@example.com')
+
+    def fail_work_insert(connection, cursor, statement, parameters, context, executemany):
+        if statement.startswith('INSERT INTO work'):
+            raise RuntimeError('work insert failed')
+
+    with web_app.app_context():
+        engine = db.engine
+
+    event.listen(engine, 'before_cursor_execute', fail_work_insert)
+    try:
+        with pytest.raises(RuntimeError):
+            client.post(f'/contract/{contract_id}', content_type='multipart/form-data',
+                        data={'files': files()})
+    finally:
+        event.remove(engine, 'before_cursor_execute', fail_work_insert)
+
+    with web_app.app_context():
+        assert Work.query.count() == 0
+        assert File.query.count() == 0
+        assert FileAccess.query.count() == 0
+        assert Attachment.query.count() == 0
@@ -0,0 +1,93 @@
+from contextlib import contextmanager
+from datetime import datetime
+
+import pytest
+from sqlalchemy import event
+
+from model import Contract, Escrow, Job, User, UserType, Work, db, new_id
+
+JOBS = 500
+
+
+@contextmanager
+def count_statements():
+    statements = []
+
+    def count(connection, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(db.engine, 'before_cursor_execute', count)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, 'before_cursor_execute', count)
+
+
+@pytest.fixture
+def users(app):
+    """Employer with JOBS jobs, each under contract with the same worker"""
+
+    with app.app_context():
+        owner = User(email='owner@example.com', user_type=UserType.EMPLOYER)
+        worker = User(email='worker@example.com', user_type=UserType.FREELANCER)
+        db.session.add_all([owner, worker])
+        db.session.flush()
+
+        for index in range(JOBS):
+            job = Job(id=new_id(), title=f'job {index}', description='job',
+                      experience_level='ENTRY', budget=1, owner_id=owner.id)
+            contract = Contract(id=new_id(), job_id=job.id, worker_id=worker.id,
+                                deadline=datetime.now())
+            escrow = Escrow(id=new_id(), contract_id=contract.id, amount_minor=100,
+                            balance_minor=100)
+            work = Work(id=new_id(), contract_id=contract.id)
+            db.session.add_all([job, contract, escrow, work])
+
+        db.session.commit()
+        return owner.id, worker.id
+
+
+@pytest.mark.parametrize('role', ['owner', 'worker'])
+def test_contracts_are_loaded_with_constant_number_of_statements(app, users, role):
+    user_id = users[0] if role == 'owner' else users[1]
+
+    with app.app_context():
+        user = db.session.get(User, user_id)
+
+        with count_statements() as statements:
+            contracts = user._query_contracts()
+            for contract in contracts:
+                contract.job.title
+                contract.escrow[0].balance_minor
+                len(contract.submissions)
+
+        assert len(contracts) == JOBS
+        # contracts with their jobs, escrows and submissions
+        assert len(statements) == 3
+
+
+@pytest.mark.parametrize('role', ['owner', 'worker'])
+def test_fund_in_escrow_is_summed_by_one_statement(app, users, role):
+    user_id = users[0] if role == 'owner' else users[1]
+
+    with app.app_context():
+        user = db.session.get(User, user_id)
+
+        with count_statements() as statements:
+            amount = user._query_fund_in_escrow()
+
+        assert amount == JOBS
+        assert len(statements) == 1
+
+
+def test_contracts_are_queried_once_per_request(app, users):
+    with app.test_request_context(), app.app_context():
+        user = db.session.get(User, users[0])
+
+        with count_statements() as statements:
+            for _ in range(3):
+                user.get_contracts()
+                user.get_grouped_contracts()
+                user.get_fund_in_escrow()
+
+        assert len(statements) == 4
@@ -0,0 +1,89 @@
+import sys
+from typing import Iterable, Optional
+
+from flask import g, has_app_context
+from model import File
+
+sys.path.append("..")
+
+
+class FileLoader:
+    """
+    Resolves file ids in batches and caches the result
+
+    Ids are collected with `prime` and fetched together with a single
+    `IN (...)` query the first time one of them is requested.
+    """
+
+    BATCH_SIZE = 500
+
+    def __init__(self):
+        self._files: dict[str, Optional[File]] = {}
+        self._pending: set[str] = set()
+
+    @staticmethod
+    def current() -> "FileLoader":
+        """Gets loader shared by the current request
+
+        Returns:
+            FileLoader: request scoped loader, a new loader outside of app context
+        """
+
+        if not has_app_context():
+            return FileLoader()
+
+        if "file_loader" not in g:
+            g.file_loader = FileLoader()
+        return g.file_loader
+
+    def prime(self, file_ids: Iterable[str]) -> None:
+        """Schedules file ids to be fetched with the next batch
+
+        Args:
+            file_ids (Iterable[str]): file ids
+        """
+
+        self._pending.update(str(file_id) for file_id in file_ids
+                             if file_id is not None and str(file_id) not in self._files)
+
+    def dispatch(self) -> None:
+        """Fetches all scheduled file ids"""
+
+        pending = list(self._pending)
+        self._pending.clear()
+
+        for start in range(0, len(pending), self.BATCH_SIZE):
+            batch = pending[start:start + self.BATCH_SIZE]
+            files = File.query.filter(File.id.in_(batch)).all()
+
+            self._files.update(dict.fromkeys(batch))
+            self._files.update((file.id, file) for file in files)
+
+    def get(self, file_id: str) -> Optional[File]:
+        """Gets file by id
+
+        Args:
+            file_id (str): file id
+
+        Returns:
+            File: file object if file is found, None otherwise
+        """
+
+        return self.get_many([file_id])[0]
+
+    def get_many(self, file_ids: Iterable[str]) -> list[Optional[File]]:
+        """Gets files by id, fetching every scheduled id with a single query
+
+        Args:
+            file_ids (Iterable[str]): file ids
+
+        Returns:
+            list: File object or None for every id, in the same order
+        """
+
+        file_ids = [str(file_id) for file_id in file_ids]
+        self.prime(file_ids)
+        if self._pending:
+            self.dispatch()
+
+        return [self._files.get(file_id) for file_id in file_ids]
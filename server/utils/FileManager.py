@@ -1,52 +1,318 @@
 import os
 import sys
-from uuid import uuid4
-from model import db, File
+import hashlib
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Optional
+from flask import Response, current_app, has_app_context, request, send_file
+from model import db, File, FileAccess, FileAccessScope, FileStatus, new_id
 from werkzeug.datastructures import FileStorage
 
+from .FileProcessor import FileProcessor, file_processor
+from .PreviewGenerator import PreviewGenerator, preview_generator
+
 sys.path.append("..")
 
 
 class FileManager:
-    def __init__(self, upload_folder: str):
+    """
+    Stores uploaded files in content addressed storage
+
+    Files are streamed to a temporary file while their SHA-256 is computed
+    and then renamed to a path derived from the hash, so uploads with
+    identical content share one blob on disk. Saved files are pending
+    until the file processor has verified them and sniffed their type,
+    then previews of images and PDFs are rendered in the background and
+    stored next to the blobs, keyed by content hash as well.
+
+    Parameters:
+        upload_folder (str): root folder of stored files
+        previews (PreviewGenerator): renderer of previews (default is the
+            shared generator)
+        processor (FileProcessor): processor of saved files (default is the
+            shared processor)
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    # threads writing files of one batch
+    MAX_WORKERS = 8
+    # stored content never changes for a file id
+    MAX_AGE = 365 * 24 * 60 * 60
+
+    def __init__(self, upload_folder: str, previews: Optional[PreviewGenerator] = None,
+                 processor: Optional[FileProcessor] = None):
         self.upload_folder = upload_folder
+        self.temp_folder = os.path.join(upload_folder, ".tmp")
+        self.previews = previews or preview_generator
+        self.processor = processor or file_processor
+
+    def blob_path(self, content_hash: str) -> str:
+        """Gets storage path of content with given hash
+
+        Args:
+            content_hash (str): hex encoded SHA-256 of content
+
+        Returns:
+            str: path to blob
+        """
+
+        return os.path.join(self.upload_folder, content_hash[:2], content_hash[2:4], content_hash)
+
+    def preview_path(self, content_hash: str) -> str:
+        """Gets storage path of preview of content with given hash
+
+        Args:
+            content_hash (str): hex encoded SHA-256 of content
+
+        Returns:
+            str: path to JPEG preview
+        """
+
+        return os.path.join(self.upload_folder, "previews", content_hash[:2],
+                            content_hash[2:4], content_hash + ".jpg")
+
+    def has_preview(self, file: File) -> bool:
+        """Checks whether preview of file has been rendered
+
+        Args:
+            file (File): stored file
+
+        Returns:
+            bool: True if preview exists on disk
+        """
+
+        return bool(file.content_hash) and os.path.exists(self.preview_path(file.content_hash))
+
+    def request_preview(self, file: File) -> None:
+        """Schedules rendering of preview of ready file unless it exists
+
+        Args:
+            file (File): stored file
+        """
+
+        if file.status == FileStatus.READY and file.content_hash and not self.has_preview(file):
+            self.previews.submit(file.file_path, self.preview_path(file.content_hash),
+                                 file.mime_type)
+
+    def write_blob(self, file: FileStorage) -> tuple[str, str, int]:
+        """Streams file into content addressed storage
+
+        Args:
+            file (FileStorage): `FileStorage` object representing file
+
+        Returns:
+            tuple: path to blob, hex encoded SHA-256 and size in bytes
+        """
+
+        os.makedirs(self.temp_folder, exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=self.temp_folder)
+
+        digest = hashlib.sha256()
+        size = 0
+
+        try:
+            with os.fdopen(fd, "wb") as temp:
+                for chunk in iter(lambda: file.stream.read(self.CHUNK_SIZE), b""):
+                    digest.update(chunk)
+                    temp.write(chunk)
+                    size += len(chunk)
+
+            content_hash = digest.hexdigest()
+            path = self.blob_path(content_hash)
 
-    def __generate_file_id(self) -> str:
-        """Returns new unique uuid4 used in database for file"""
+            if os.path.exists(path):
+                os.remove(temp_path)
+            else:
+                # mkstemp creates owner only files, blobs may be served by a proxy
+                os.chmod(temp_path, 0o644)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                os.replace(temp_path, path)
 
-        id = uuid4()
-        while File.get(id):
-            id = uuid4()
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
 
-        return str(id)
+        return path, content_hash, size
 
-    def add_file_to_database(self, file_id: str, file_name: str, file_path: str, mime_type: str):
-        """Adds reference to file to database
+    def add_file_to_database(self, file_id: str, file_name: str, file_path: str, mime_type: str,
+                             content_hash: str = None, size: int = None, owner_id: int = None):
+        """Adds reference to pending file to database
 
         Args:
             file_id (str): primary key for file on database
             file_path (str): path to file
             mime_type (str): MIME type of file
+            content_hash (str): hex encoded SHA-256 of file content
+            size (int): file size in bytes
+            owner_id (int): id of uploading user, who is granted access to the file
         """
 
         file = File(id=file_id, file_name=file_name,
-                    file_path=file_path, mime_type=mime_type)
+                    file_path=file_path, mime_type=mime_type,
+                    content_hash=content_hash, size=size, status=FileStatus.PENDING)
         db.session.add(file)
+        if owner_id is not None:
+            db.session.add(FileAccess(file_id=file_id, scope_type=FileAccessScope.USER,
+                                      scope_id=str(owner_id)))
         db.session.commit()
 
-    def save(self, file: FileStorage) -> str:
+    def save(self, file: FileStorage, owner_id: int = None) -> str:
         """Saves file on specified upload folder and adds reference to database
 
+        The file is pending when this returns, it is verified and its type
+        is sniffed by the file processor.
+
         Args:
             file (FileStorage): `FileStorage` object representing file
+            owner_id (int): id of uploading user, who is granted access to the file
 
         Returns:
             str: file id on database
         """
-        path = os.path.join(self.upload_folder, file.filename)
-        file.save(path)
 
-        file_id = self.__generate_file_id()
-        self.add_file_to_database(file_id, file.filename, path, file.mimetype)
+        path, content_hash, size = self.write_blob(file)
+
+        file_id = new_id()
+        self.add_file_to_database(file_id, file.filename, path, file.mimetype,
+                                  content_hash, size, owner_id)
+
+        self.process_saved()
 
         return file_id
+
+    def save_many(self, files: list[FileStorage], owner_id: int = None) -> list[str]:
+        """Saves files concurrently and adds references to the session
+
+        Files are written by a thread pool and their rows are added to the
+        session without committing or querying, so they are inserted together with the
+        caller's rows in one transaction. Call `process_saved` after the
+        commit.
+
+        Args:
+            files (list): `FileStorage` objects representing files
+            owner_id (int): id of uploading user, who is granted access to the files
+
+        Returns:
+            list: file ids on database, in the same order as files
+        """
+
+        if not files:
+            return []
+
+        if len(files) == 1:
+            blobs = [self.write_blob(files[0])]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.MAX_WORKERS, len(files)),
+                                    thread_name_prefix="file-write") as executor:
+                blobs = list(executor.map(self.write_blob, files))
+
+        file_ids = [new_id() for _ in files]
+
+        rows = []
+        for file_id, file, (path, content_hash, size) in zip(file_ids, files, blobs):
+            rows.append(File(id=file_id, file_name=file.filename, file_path=path,
+                             mime_type=file.mimetype, content_hash=content_hash,
+                             size=size, status=FileStatus.PENDING))
+            if owner_id is not None:
+                rows.append(FileAccess(file_id=file_id, scope_type=FileAccessScope.USER,
+                                       scope_id=str(owner_id)))
+
+        db.session.add_all(rows)
+        return file_ids
+
+    def process_saved(self) -> None:
+        """Starts post processing of committed files"""
+
+        if has_app_context():
+            self.processor.wake(current_app._get_current_object(), self)
+
+    def send(self, file: File, accel_redirect_prefix: Optional[str] = None) -> Response:
+        """Creates response serving file
+
+        The response supports conditional requests using the content hash as
+        ETag and byte ranges. When accel_redirect_prefix is given the body is
+        left to the front proxy via X-Accel-Redirect, otherwise `send_file`
+        streams the file, using X-Sendfile when USE_X_SENDFILE is enabled or
+        the server's file wrapper (sendfile) when available. Files that are
+        not ready are served as application/octet-stream and not cached.
+        Only images and PDFs are displayed inline, everything else is
+        downloaded as attachment, and browsers are told not to sniff types.
+
+        Args:
+            file (File): file to serve
+            accel_redirect_prefix (str): internal proxy location mapped to
+                upload folder
+
+        Returns:
+            Response: response serving the file
+        """
+
+        etag = file.content_hash or file.id
+        if file.status != FileStatus.READY:
+            return self.__send(file.file_path, FileProcessor.OCTET_STREAM, file.file_name,
+                               etag + "-" + file.status, accel_redirect_prefix, max_age=0)
+
+        return self.__send(file.file_path, file.mime_type, file.file_name,
+                           etag, accel_redirect_prefix)
+
+    def send_preview(self, file: File, accel_redirect_prefix: Optional[str] = None) -> Response:
+        """Creates response serving preview of file, see `send`
+
+        Args:
+            file (File): file with rendered preview
+            accel_redirect_prefix (str): internal proxy location mapped to
+                upload folder
+
+        Returns:
+            Response: response serving the JPEG preview
+        """
+
+        name = os.path.splitext(file.file_name)[0] + ".jpg"
+        return self.__send(self.preview_path(file.content_hash), "image/jpeg", name,
+                           file.content_hash + "-preview", accel_redirect_prefix)
+
+    def __send(self, path: str, mime_type: str, name: str, etag: str,
+               accel_redirect_prefix: Optional[str], max_age: Optional[int] = None) -> Response:
+        max_age = self.MAX_AGE if max_age is None else max_age
+        inline = self.__is_inline(mime_type)
+
+        if accel_redirect_prefix:
+            response = self.__accel_redirect(path, mime_type, name, etag, inline,
+                                             accel_redirect_prefix, max_age)
+        else:
+            response = send_file(path, mimetype=mime_type, download_name=name,
+                                 as_attachment=not inline, etag=etag,
+                                 conditional=True, max_age=max_age)
+
+        # uploads must not be rendered as a type they were not served as
+        response.headers["X-Content-Type-Options"] = "nosniff"
+        # downloads require login, keep them out of shared caches
+        response.cache_control.public = False
+        response.cache_control.private = True
+        return response
+
+    @staticmethod
+    def __is_inline(mime_type: str) -> bool:
+        if mime_type in FileProcessor.ACTIVE:
+            return False
+
+        return mime_type == PreviewGenerator.PDF_MIME_TYPE or mime_type.startswith("image/")
+
+    def __accel_redirect(self, path: str, mime_type: str, name: str, etag: str,
+                         inline: bool, prefix: str, max_age: int) -> Response:
+        relative_path = os.path.relpath(path, self.upload_folder)
+
+        response = Response(mimetype=mime_type)
+        response.headers["X-Accel-Redirect"] = "/".join(
+            [prefix.rstrip("/"), *relative_path.split(os.sep)])
+        response.headers.set("Content-Disposition", "inline" if inline else "attachment",
+                             filename=name)
+
+        response.set_etag(etag)
+        response.last_modified = datetime.fromtimestamp(
+            os.path.getmtime(path), timezone.utc)
+        response.cache_control.max_age = max_age
+
+        return response.make_conditional(request)
@@ -0,0 +1,243 @@
+import hashlib
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import TYPE_CHECKING, Callable, Optional
+
+from flask import Flask
+from model import File, FileStatus, db
+
+if TYPE_CHECKING:
+    from .FileManager import FileManager
+
+logger = logging.getLogger(__name__)
+
+
+class FileProcessor:
+    """
+    Checks stored uploads in the background
+
+    Uploads are stored as pending and answered right away. The processor
+    then reads every pending file once to verify its SHA-256 and size
+    against the values recorded while storing it, and sniffs its MIME type
+    from its first bytes instead of trusting the type sent by the client.
+    Files of a batch are read concurrently by a bounded pool and updated
+    with a single commit, afterwards previews are scheduled and listeners
+    are notified of the processed files.
+
+    Parameters:
+        batch_size (int): maximum number of files handled per commit (default is 20)
+        workers (int): number of threads reading files (default is 4)
+        interval (float): seconds between checks for pending files left by
+            other workers or restarts (default is 60)
+    """
+
+    CHUNK_SIZE = 64 * 1024
+    SNIFF_SIZE = 512
+    OCTET_STREAM = 'application/octet-stream'
+
+    # (offset, prefix, MIME type)
+    SIGNATURES = [
+        (0, b'\x89PNG\r\n\x1a\n', 'image/png'),
+        (0, b'\xff\xd8\xff', 'image/jpeg'),
+        (0, b'GIF87a', 'image/gif'),
+        (0, b'GIF89a', 'image/gif'),
+        (8, b'WEBP', 'image/webp'),
+        (0, b'%PDF-', 'application/pdf'),
+        (0, b'{\\rtf', 'application/rtf'),
+        (0, b'\x1f\x8b', 'application/gzip'),
+        (0, b'PK\x03\x04', 'application/zip'),
+        (0, b'\xd0\xcf\x11\xe0\xa1\xb1\x1a\xe1', 'application/x-ole-storage'),
+        (4, b'ftyp', 'video/mp4'),
+    ]
+
+    # formats stored inside a recognized container keep their declared type
+    CONTAINED = {
+        'application/zip': ('application/vnd.', 'application/epub+zip',
+                            'application/x-zip-compressed'),
+        'application/x-ole-storage': ('application/vnd.ms-', 'application/msword'),
+        'video/mp4': ('video/', 'audio/', 'image/heic', 'image/heif', 'image/avif'),
+    }
+
+    # types able to run scripts when opened from the site
+    ACTIVE = ('text/html', 'application/xhtml+xml', 'image/svg+xml',
+              'text/javascript', 'application/javascript', 'text/xml', 'application/xml')
+
+    def __init__(self, batch_size: int = 20, workers: int = 4, interval: float = 60):
+        self.batch_size = batch_size
+        self.workers = workers
+        self.interval = interval
+
+        self.listeners: list[Callable[[list[File]], None]] = []
+        self.file_manager: Optional["FileManager"] = None
+
+        self._wakeup = threading.Event()
+        self._lock = threading.Lock()
+        self._worker: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def wake(self, app: Flask, file_manager: "FileManager") -> None:
+        """
+        Starts processing pending files, starts the worker on first call
+
+        Args:
+            app (Flask): application the worker runs in
+            file_manager (FileManager): manager used to schedule previews
+        """
+
+        with self._lock:
+            if self.file_manager is None:
+                self.file_manager = file_manager
+
+            if self._worker is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers,
+                                                    thread_name_prefix='file-processor-read')
+                self._worker = threading.Thread(target=self._run, args=(app,),
+                                                name='file-processor', daemon=True)
+                self._worker.start()
+
+        self._wakeup.set()
+
+    def _run(self, app: Flask) -> None:
+        while True:
+            self._wakeup.wait(self.interval)
+            self._wakeup.clear()
+
+            try:
+                with app.app_context():
+                    self.process_pending()
+            except Exception:
+                logger.exception('Failed to process stored files')
+
+    def process_pending(self) -> None:
+        """Processes every file that is pending when the call starts"""
+
+        after_id = ''
+        while after_id is not None:
+            after_id = self.process_batch(after_id)
+
+    def process_batch(self, after_id: str = '') -> Optional[str]:
+        """
+        Checks one batch of pending files and commits the results
+
+        Args:
+            after_id (str): only files with greater id are processed
+
+        Returns:
+            str: id of last processed file, None if there was nothing to process
+        """
+
+        files = File.get_pending(self.batch_size, after_id)
+        if not files:
+            return None
+
+        arguments = [(file.file_path, file.mime_type, file.content_hash, file.size)
+                     for file in files]
+
+        # end read transaction while files are read, the arguments are taken
+        # first as reading expired attributes would begin a new one
+        db.session.commit()
+        if self._executor is not None:
+            results = list(self._executor.map(lambda args: self.inspect(*args), arguments))
+        else:
+            results = [self.inspect(*args) for args in arguments]
+
+        processed = []
+        for file, (status, mime_type) in zip(files, results):
+            # files are claimed so that other workers do not process them again
+            claimed = db.session.execute(
+                db.update(File)
+                .where(File.id == file.id, File.status == FileStatus.PENDING)
+                .values(status=status, mime_type=mime_type)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+
+            if claimed:
+                file.status, file.mime_type = status, mime_type
+                processed.append(file)
+
+        db.session.commit()
+
+        for file in processed:
+            if file.status == FileStatus.FAILED:
+                logger.warning('Stored content of file %s does not match its hash', file.id)
+            elif self.file_manager is not None:
+                self.file_manager.request_preview(file)
+
+        for listener in self.listeners:
+            try:
+                listener(processed)
+            except Exception:
+                logger.exception('File listener failed')
+
+        return files[-1].id
+
+    def inspect(self, path: str, declared_type: Optional[str], content_hash: Optional[str],
+                size: Optional[int]) -> tuple[str, str]:
+        """
+        Reads stored file, verifies it and sniffs its type
+
+        Args:
+            path (str): path to stored file
+            declared_type (str): MIME type sent by the client
+            content_hash (str): SHA-256 recorded while storing the file
+            size (int): size recorded while storing the file
+
+        Returns:
+            tuple: FileStatus and MIME type of file
+        """
+
+        digest = hashlib.sha256()
+        length = 0
+        head = b''
+
+        try:
+            with open(path, 'rb') as stored:
+                for chunk in iter(lambda: stored.read(self.CHUNK_SIZE), b''):
+                    if length < self.SNIFF_SIZE:
+                        head += chunk[:self.SNIFF_SIZE - length]
+                    digest.update(chunk)
+                    length += len(chunk)
+        except OSError:
+            logger.warning('Could not read stored file %s', path, exc_info=True)
+            return FileStatus.FAILED, declared_type or self.OCTET_STREAM
+
+        mime_type = self.sniff(head, declared_type)
+
+        if (content_hash and digest.hexdigest() != content_hash) or \
+                (size is not None and length != size):
+            return FileStatus.FAILED, mime_type
+
+        return FileStatus.READY, mime_type
+
+    @classmethod
+    def sniff(cls, head: bytes, declared_type: Optional[str]) -> str:
+        """
+        Determines MIME type of content
+
+        Args:
+            head (bytes): first bytes of content
+            declared_type (str): MIME type sent by the client
+
+        Returns:
+            str: type matching the signature of the content, the declared
+                type if the content has no known signature and the declared
+                type claims none, application/octet-stream otherwise
+        """
+
+        declared_type = (declared_type or '').split(';')[0].strip().lower()
+
+        for offset, prefix, mime_type in cls.SIGNATURES:
+            if head[offset:offset + len(prefix)] == prefix:
+                if declared_type.startswith(cls.CONTAINED.get(mime_type, ())):
+                    return declared_type
+                return mime_type
+
+        signed_types = {mime_type for _, _, mime_type in cls.SIGNATURES}
+        if not declared_type or declared_type in signed_types or declared_type in cls.ACTIVE:
+            return cls.OCTET_STREAM
+
+        return declared_type
+
+
+file_processor = FileProcessor()
@@ -0,0 +1,210 @@
+import logging
+import os
+import tempfile
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Optional
+
+try:
+    from PIL import Image
+except ImportError:  # previews are disabled without Pillow
+    Image = None
+
+try:
+    import pypdfium2 as pdfium
+except ImportError:  # PDF previews are disabled without pypdfium2
+    pdfium = None
+
+logger = logging.getLogger(__name__)
+
+# pdfium is not thread safe, every call into it is made holding this lock
+_pdfium_lock = threading.Lock()
+
+
+class PreviewGenerator:
+    """
+    Renders size bounded JPEG previews of images and first pages of PDFs
+
+    Previews are rendered by a small worker pool so uploads return as soon
+    as the original is stored. A preview is written to a temporary file
+    and renamed into place, its existence on disk marks it as done. Every
+    target is rendered at most once at a time, targets that failed to
+    render are not retried by the same process. PDFs are rendered one at
+    a time since pdfium does not support concurrent use.
+
+    Parameters:
+        workers (int): number of worker threads
+        max_size (tuple): maximum (width, height) of previews in pixels
+        quality (int): JPEG quality of previews
+        max_pixels (int): images with more pixels are not previewed
+    """
+
+    PDF_MIME_TYPE = "application/pdf"
+    MAX_FAILED = 10000
+
+    def __init__(self, workers: int = 2, max_size: tuple[int, int] = (320, 320),
+                 quality: int = 80, max_pixels: int = 50_000_000):
+        self.workers = workers
+        self.max_size = max_size
+        self.quality = quality
+        self.max_pixels = max_pixels
+
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._rendering: set[str] = set()
+        self._failed: set[str] = set()
+        self._lock = threading.Lock()
+
+    def can_preview(self, mime_type: Optional[str]) -> bool:
+        """Checks whether previews of files of given type can be rendered
+
+        Args:
+            mime_type (str): MIME type of file
+
+        Returns:
+            bool: True if type is an image or PDF and its renderer is installed
+        """
+
+        if Image is None or not mime_type:
+            return False
+
+        if mime_type == self.PDF_MIME_TYPE:
+            return pdfium is not None
+
+        return mime_type.startswith("image/")
+
+    def submit(self, source: str, target: str, mime_type: str) -> Optional[Future]:
+        """Schedules rendering of preview
+
+        Args:
+            source (str): path to original file
+            target (str): path preview is written to
+            mime_type (str): MIME type of original file
+
+        Returns:
+            Future: future resolving to result of `render`, None if type can
+                not be previewed, target is already being rendered or failed
+        """
+
+        if not self.can_preview(mime_type):
+            return None
+
+        with self._lock:
+            if target in self._rendering or target in self._failed:
+                return None
+            self._rendering.add(target)
+
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="preview")
+
+        try:
+            return self._executor.submit(self.__render_once, source, target, mime_type)
+        except RuntimeError:
+            # interpreter is shutting down
+            with self._lock:
+                self._rendering.discard(target)
+            return None
+
+    def render(self, source: str, target: str, mime_type: str) -> bool:
+        """Renders preview of file
+
+        Args:
+            source (str): path to original file
+            target (str): path preview is written to
+            mime_type (str): MIME type of original file
+
+        Returns:
+            bool: True if preview exists after the call
+        """
+
+        if os.path.exists(target):
+            return True
+
+        if not self.can_preview(mime_type):
+            return False
+
+        try:
+            if mime_type == self.PDF_MIME_TYPE:
+                image = self.__open_pdf(source)
+            else:
+                image = self.__open_image(source)
+
+            if image is not None:
+                with image:
+                    self.__write(image, target)
+                return True
+
+        except Exception:
+            # unreadable and unsupported files simply have no preview
+            logger.warning("Could not render preview of %s", source, exc_info=True)
+
+        with self._lock:
+            if len(self._failed) >= self.MAX_FAILED:
+                self._failed.clear()
+            self._failed.add(target)
+
+        return False
+
+    def __render_once(self, source: str, target: str, mime_type: str) -> bool:
+        try:
+            return self.render(source, target, mime_type)
+        finally:
+            with self._lock:
+                self._rendering.discard(target)
+
+    def __open_image(self, source: str) -> Optional["Image.Image"]:
+        image = Image.open(source)
+        if image.width * image.height > self.max_pixels:
+            image.close()
+            return None
+
+        # decode JPEGs directly at reduced scale
+        image.draft("RGB", self.max_size)
+        image.thumbnail(self.max_size)
+        return image
+
+    def __open_pdf(self, source: str) -> Optional["Image.Image"]:
+        with _pdfium_lock:
+            document = pdfium.PdfDocument(source)
+            try:
+                if len(document) == 0:
+                    return None
+
+                page = document[0]
+                width, height = page.get_size()
+                scale = min(self.max_size[0] / width, self.max_size[1] / height)
+                bitmap = page.render(scale=scale)
+                # copy pixels so the image outlives the bitmap
+                image = bitmap.to_pil().copy()
+                bitmap.close()
+                page.close()
+            finally:
+                document.close()
+
+        image.thumbnail(self.max_size)
+        return image
+
+    def __write(self, image: "Image.Image", target: str) -> None:
+        if image.mode in ("RGBA", "LA", "P"):
+            image = image.convert("RGBA")
+            background = Image.new("RGB", image.size, "white")
+            background.paste(image, mask=image.getchannel("A"))
+            image = background
+        elif image.mode != "RGB":
+            image = image.convert("RGB")
+
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(target), suffix=".tmp")
+
+        try:
+            with os.fdopen(fd, "wb") as temp:
+                image.save(temp, "JPEG", quality=self.quality, optimize=True)
+            os.chmod(temp_path, 0o644)
+            os.replace(temp_path, target)
+        except BaseException:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+preview_generator = PreviewGenerator()
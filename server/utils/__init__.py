@@ -1 +1,4 @@
 from .FileManager import FileManager
+from .FileLoader import FileLoader
+from .PreviewGenerator import PreviewGenerator, preview_generator
+from .FileProcessor import FileProcessor, file_processor